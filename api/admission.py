@@ -0,0 +1,152 @@
+"""
+Admission control for the webhook and check endpoints.
+
+Every limited route has a concurrency limit between a floor and
+ADMISSION_LIMITS' cap. The limit adapts to the DB round-trip time
+(utils.query_counter.db_latency): while it is above
+ADMISSION_DB_LATENCY_TARGET_MS the limit is cut by ADMISSION_DECREASE at most
+once per ADMISSION_DECREASE_INTERVAL_MS, otherwise it grows by one per
+limit's worth of completed requests. Requests over the limit are not queued
+but answered right away with 503 and Retry-After, so Stripe and the bot back
+off instead of piling up tasks waiting for the pool.
+"""
+import os
+import time
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+
+from utils.logger import logger
+from utils.metrics import ADMISSION_LIMIT, ADMISSION_IN_FLIGHT, ADMISSION_REJECTED
+from utils.query_counter import db_latency
+
+load_dotenv()
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# "path=max concurrency,..." for the routes to limit.
+ADMISSION_LIMITS = os.getenv(
+    "ADMISSION_LIMITS", "/api/stripe_webhook=64,/api/subscription/check=128,/api/subscription/check/batch=8")
+ADMISSION_DB_LATENCY_TARGET_MS = float(os.getenv("ADMISSION_DB_LATENCY_TARGET_MS", 50))
+ADMISSION_DECREASE = float(os.getenv("ADMISSION_DECREASE", 0.9))
+ADMISSION_DECREASE_INTERVAL_MS = float(os.getenv("ADMISSION_DECREASE_INTERVAL_MS", 100))
+# Lowest limit as a share of the cap.
+ADMISSION_MIN_RATIO = float(os.getenv("ADMISSION_MIN_RATIO", 0.1))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 2))
+
+
+def parse_limits(spec):
+    """{"/api/x": 64} from "/api/x=64,...", skipping malformed entries."""
+    limits = {}
+    for part in spec.split(","):
+        path, _, value = part.strip().partition("=")
+        try:
+            limits[path.strip()] = int(value)
+        except ValueError:
+            if part.strip():
+                logger.warning("[ADMISSION] Ignoring bad ADMISSION_LIMITS entry %r", part)
+    return {path: limit for path, limit in limits.items() if path and limit > 0}
+
+
+class RouteLimiter:
+    def __init__(self, route, max_limit, min_ratio=ADMISSION_MIN_RATIO, target=ADMISSION_DB_LATENCY_TARGET_MS / 1000,
+                 decrease=ADMISSION_DECREASE, decrease_interval=ADMISSION_DECREASE_INTERVAL_MS / 1000):
+        self.route = route
+        self.max_limit = max_limit
+        self.min_limit = max(1, int(max_limit * min_ratio))
+        self.target = target
+        self.decrease = decrease
+        self.decrease_interval = decrease_interval
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.last_decrease = 0.0
+        self.limit_gauge = ADMISSION_LIMIT.labels(route)
+        self.in_flight_gauge = ADMISSION_IN_FLIGHT.labels(route)
+        self.rejected_counter = ADMISSION_REJECTED.labels(route)
+        self.limit_gauge.set(max_limit)
+
+    def try_acquire(self):
+        if self.in_flight >= int(self.limit):
+            self.rejected += 1
+            self.rejected_counter.inc()
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        self.in_flight_gauge.set(self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self.in_flight_gauge.set(self.in_flight)
+        self._adapt()
+
+    def _adapt(self):
+        if db_latency.value > self.target:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.decrease_interval and self.limit > self.min_limit:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self.last_decrease = now
+                logger.warning("[ADMISSION] DB latency %.1f ms, %s limit lowered to %s",
+                               db_latency.value * 1000, self.route, int(self.limit))
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self.limit_gauge.set(int(self.limit))
+
+    @property
+    def saturation(self):
+        return self.in_flight / int(self.limit)
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "min_limit": self.min_limit,
+            "in_flight": self.in_flight,
+            "saturation": round(self.saturation, 3),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits=None):
+        limits = parse_limits(ADMISSION_LIMITS) if limits is None else limits
+        self.limiters = {route: RouteLimiter(route, limit) for route, limit in limits.items()}
+
+    def saturation(self):
+        """Highest in-flight / limit ratio over the limited routes."""
+        return round(max((l.saturation for l in self.limiters.values()), default=0.0), 3)
+
+    def stats(self):
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "db_latency_ms": round(db_latency.value * 1000, 3),
+            "db_latency_target_ms": ADMISSION_DB_LATENCY_TARGET_MS,
+            "routes": {route: limiter.stats() for route, limiter in self.limiters.items()},
+        }
+
+
+admission = AdmissionController()
+
+
+def overloaded_response():
+    return JSONResponse({"error": "Overloaded, retry later"}, status_code=503,
+                        headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the route limiters of admission by request path."""
+
+    def __init__(self, app, controller=admission):
+        self.app = app
+        self.limiters = controller.limiters if ADMISSION_ENABLED else {}
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        if not limiter.try_acquire():
+            return await overloaded_response()(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,69 @@
+import time
+
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+from starlette.responses import PlainTextResponse
+
+from utils.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUEST_DB_QUERIES, HTTP_REQUEST_DB_SECONDS, render_metrics
+from utils.query_counter import count_queries
+
+router = APIRouter(
+    tags=["Metrics"],
+)
+
+UNMATCHED_ROUTE = "unmatched"
+# Other methods are counted as OTHER, like unknown paths, so clients cannot grow the label set.
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+OTHER_METHOD = "OTHER"
+STATUS_CLASSES = ("1xx", "1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+@router.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def preallocate_route_metrics(app):
+    """Resolve the per-route metric children once, so requests never create them."""
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            for method in route.methods:
+                HTTP_REQUEST_DB_QUERIES.labels(method, route.path)
+                HTTP_REQUEST_DB_SECONDS.labels(method, route.path)
+                for status in ("2xx", "4xx", "5xx"):
+                    HTTP_REQUEST_SECONDS.labels(method, route.path, status)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status class and DB round-trips per
+    route template. Streaming responses are timed until the last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            with count_queries() as queries:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else UNMATCHED_ROUTE
+            method = scope["method"] if scope["method"] in HTTP_METHODS else OTHER_METHOD
+            status_class = STATUS_CLASSES[min(status // 100, 5)]
+            HTTP_REQUEST_SECONDS.labels(method, path, status_class).observe(time.perf_counter() - start)
+            HTTP_REQUEST_DB_QUERIES.labels(method, path).observe(queries.count)
+            HTTP_REQUEST_DB_SECONDS.labels(method, path).observe(queries.time)
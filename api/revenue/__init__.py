@@ -0,0 +1 @@
+from .router import router
\ No newline at end of file
@@ -0,0 +1,37 @@
+import os
+from typing import Optional
+from datetime import date, datetime, timedelta, UTC
+
+from dotenv import load_dotenv
+from fastapi import Query
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from db.Revenue import SOURCES, daily_revenue
+from utils.logger import logger
+from .router import router
+
+load_dotenv()
+REVENUE_MAX_DAYS = int(os.getenv("REVENUE_MAX_DAYS", 366))
+
+
+@router.get("/daily")
+async def get_daily_revenue(
+        start_date: date = Query(None, description="Format: YYYY-MM-DD, default 30 days ago"),
+        days: int = Query(30, ge=1, le=REVENUE_MAX_DAYS),
+        source: Optional[str] = Query(None, description="payment or charge, default both"),
+        currency: Optional[str] = None,
+        status: Optional[str] = None):
+    if source is not None and source not in SOURCES:
+        return JSONResponse({"error": f"source must be one of {', '.join(SOURCES)}"}, status_code=400)
+    if not start_date:
+        start_date = datetime.now(UTC).date() - timedelta(days=days - 1)
+    end_date = start_date + timedelta(days=days)
+
+    logger.info("[REVENUE] Daily revenue from %s to %s (source=%s, currency=%s, status=%s)",
+                start_date, end_date, source, currency, status)
+    rows = await daily_revenue(start_date, end_date, source, currency and currency.lower(), status)
+    return JSONResponse(jsonable_encoder({
+        "start_date": start_date,
+        "end_date": end_date - timedelta(days=1),
+        "rows": rows,
+    }))
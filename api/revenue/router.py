@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+
+router = APIRouter(
+    prefix="/revenue",
+    tags=["Revenue"],
+)
+
+from . import daily
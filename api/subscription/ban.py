@@ -1,7 +1,12 @@
+from datetime import datetime, UTC
 from pydantic import BaseModel
 from fastapi import Response, status
+from tortoise.transactions import in_transaction
 from db.models import TelegramUser
+from db.Entitlement import refresh_entitlements
+from db.notifier import notifier
 from utils.logger import logger
+from utils.subscription_cache import subscription_cache
 from .router import router
 
 class BanUserRequest(BaseModel):
@@ -12,23 +17,30 @@ async def update_telegram_user_set_status_false(request: BanUserRequest):
     try:
         uid = request.user_id
     except Exception:
-        logger.error(f"[BAN] No user_id passed!")
+        logger.error("[BAN] No user_id passed!")
         return Response(status_code=status.HTTP_400_BAD_REQUEST)
 
     if not uid:
-        logger.info(f"[BAN] No user id passed, skipped.")
+        logger.info("[BAN] No user id passed, skipped.")
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     tgu = await TelegramUser.get_or_none(user_id=uid)
     if not tgu:
-        logger.info(f"[BAN] User {uid} not found, skipped.")
+        logger.info("[BAN] User %s not found, skipped.", uid)
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     try:
         tgu.subscription_status = False
-        await tgu.save()
-        logger.info(f"[BAN] User {uid} subscription status switch to False.")
+        # Revokes the current subscriptions in the entitlement (see db/Entitlement.py).
+        tgu.banned_at = datetime.now(UTC)
+        async with in_transaction():
+            await tgu.save()
+            changed = await refresh_entitlements(telegram_user_ids=[tgu.id])
+        for user_id in changed:
+            notifier.notify(user_id, "ban")
+        subscription_cache.invalidate(user_id=uid)
+        logger.info("[BAN] User %s subscription status switch to False.", uid)
         return {'success': True}
     except Exception as e:
-        logger.error(f"[BAN] Error occurred: {e}")
+        logger.error("[BAN] Error occurred: %s", e)
         return Response(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
@@ -1,20 +1,45 @@
+import os
+import json
+from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import Optional
 
 from utils.logger import logger
 from fastapi import HTTPException
-from starlette.responses import JSONResponse
-from db.Subscription import get_subscriptions
-from db.TelegramUser import get_telegram_user, create_telegram_user
-from db.Customer import get_customers
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, StreamingResponse
+from db.TelegramUser import resolve_subscription, resolve_subscriptions
+from utils.query_counter import count_queries, check_query_budget
+from utils.subscription_cache import subscription_cache
 from .router import router
 
+load_dotenv()
+CHECK_QUERY_BUDGET = 2
+CHECK_BATCH_MAX = int(os.getenv("CHECK_BATCH_MAX", 10000))
+# Batches are resolved (two round-trips each) and streamed back in chunks of this size.
+CHECK_BATCH_CHUNK = int(os.getenv("CHECK_BATCH_CHUNK", 500))
+
 class SubscriptionCheckRequest(BaseModel):
     email: Optional[str] = None
     username: Optional[str] = None
     user_id: Optional[int] = None
     name: Optional[str] = None
 
+def check_result(telegram_user, customers, active_end):
+    """Response body of a subscription check and the cache tags it depends on."""
+    cache_tags = [("user_id", telegram_user["user_id"])] + [("customer", cid) for cid in customers]
+    if not customers:
+        logger.info("[CHECK SUBSCRIPTION] No customer found for %s", telegram_user['user_id'])
+        return {"message": "No customer found", "subscription_status": False}, cache_tags
+
+    if active_end is not None:
+        logger.info("[CHECK SUBSCRIPTION] Found subscription for %s ending %s", telegram_user['user_id'], active_end)
+        return jsonable_encoder(telegram_user), cache_tags
+
+    logger.info("[CHECK SUBSCRIPTION] Subscription not found for %s", customers)
+    return {"subscription_status": False, "message": "Not found subscription for customer"}, cache_tags
+
+
 @router.post("/check")
 async def check_subscription(payload: SubscriptionCheckRequest):
     try:
@@ -24,55 +49,92 @@ async def check_subscription(payload: SubscriptionCheckRequest):
             "user_id": payload.user_id,
         }.items() if v is not None}
 
-        creation_data = {k: v for k, v in {
-            "email": payload.email,
-            "username": payload.username,
-            "user_id": payload.user_id,
-            "full_name": payload.name
-        }.items() if v is not None}
-        logger.info(f"filters: {filters}, types: {[type(v) for v in filters.values()]}")
+        logger.debug("filters: %s, types: %s", filters, [type(v) for v in filters.values()])
 
         if not filters:
             return JSONResponse({"error": "Bad filters passed"}, status_code=400)
 
-        logger.info(f"[CHECK SUBSCRIPTION] New request with data {filters.items()}...")
+        logger.info("[CHECK SUBSCRIPTION] New request with data %s...", filters.items())
 
-        telegram_user = await get_telegram_user(**filters)
-        if telegram_user:
-            logger.info(f"[CHECK SUBSCRIPTION] Found Telegram User! {telegram_user.user_id}")
-        else:
-            telegram_user = await create_telegram_user(**creation_data)
-
-        logger.info(f"[CHECK SUBSCRIPTION] Telegram User not found, searching for customer...")
-        customers = await get_customers(email=filters.get('email'), username=filters.get('username'))
-
-        if not customers:
-            logger.info(f"[CHECK SUBSCRIPTION] No customer found {filters.keys()} {filters.values()}")
-            return JSONResponse({"message": "No customer found", "subscription_status": False}, status_code=200)
-
-        for cus in customers:
-            cus.user_id = telegram_user
-            await cus.save()
-
-            cid = cus.id
-            subscriptions = await get_subscriptions({"customer_id": cid})
-            active_sub = None
-            for sub in subscriptions:
-                if sub.status == "active":
-                    telegram_user.subscription_status = True
-                    telegram_user.date_end = sub.ending
-                    await telegram_user.save()
-                    active_sub = sub
-                    break
-
-            if active_sub:
-                logger.info(f"[CHECK SUBSCRIPTION] Found subscription for {cid} {subscriptions}")
-                return telegram_user
-
-        logger.info(f"[CHECK SUBSCRIPTION] Subscription not found for {customers}")
-        return {"subscription_status": False, "message": "Not found subscription for customer"}
+        cache_key = subscription_cache.key(**filters)
+        if subscription_cache.enabled:
+            cached = subscription_cache.get(cache_key)
+            if cached is not None:
+                logger.info("[CHECK SUBSCRIPTION] Cache hit for %s", filters.keys())
+                return JSONResponse(cached, status_code=200)
+
+        generation = subscription_cache.generation
+        with count_queries() as queries:
+            telegram_user, customers, active_end = await resolve_subscription(
+                email=payload.email, username=payload.username, user_id=payload.user_id, full_name=payload.name)
+        check_query_budget("check_subscription", queries, CHECK_QUERY_BUDGET)
+
+        result, cache_tags = check_result(telegram_user, customers, active_end)
+        subscription_cache.set(cache_key, result, cache_tags, generation)
+        return JSONResponse(result, status_code=200)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("[CHECK SUBSCRIPTION] Unexpected error")
-        return {"error": "Internal Server Error", "detail": str(e)}
\ No newline at end of file
+        return {"error": "Internal Server Error", "detail": str(e)}
+
+
+async def resolve_check_batch(identities):
+    """Answers for a chunk of identities, in order: cache hits first, misses resolved together."""
+    results = [None] * len(identities)
+    misses = []
+    for n, identity in enumerate(identities):
+        filters = {k: v for k, v in {
+            "email": identity.email,
+            "username": identity.username,
+            "user_id": identity.user_id,
+        }.items() if v is not None}
+        if not filters:
+            results[n] = {"error": "Bad filters passed"}
+            continue
+        cache_key = subscription_cache.key(**filters)
+        cached = subscription_cache.get(cache_key) if subscription_cache.enabled else None
+        if cached is not None:
+            results[n] = cached
+        else:
+            misses.append((n, cache_key, {**filters, "full_name": identity.name}))
+
+    if misses:
+        generation = subscription_cache.generation
+        with count_queries() as queries:
+            resolved = await resolve_subscriptions([identity for _, _, identity in misses])
+        check_query_budget("check_subscription_batch", queries, CHECK_QUERY_BUDGET)
+
+        for (n, cache_key, identity), entry in zip(misses, resolved):
+            if entry is None:
+                results[n] = {"error": "Could not create Telegram User", "user_id": identity.get("user_id")}
+                continue
+            result, cache_tags = check_result(*entry)
+            subscription_cache.set(cache_key, result, cache_tags, generation)
+            results[n] = result
+    return results
+
+
+@router.post("/check/batch")
+async def check_subscription_batch(payload: list[SubscriptionCheckRequest]):
+    if len(payload) > CHECK_BATCH_MAX:
+        return JSONResponse({"error": f"Batch is larger than {CHECK_BATCH_MAX}"}, status_code=400)
+
+    logger.info("[CHECK SUBSCRIPTION BATCH] New batch of %s identities", len(payload))
+    if len(payload) <= CHECK_BATCH_CHUNK:
+        return JSONResponse(await resolve_check_batch(payload), status_code=200)
+
+    async def stream():
+        yield "["
+        for start in range(0, len(payload), CHECK_BATCH_CHUNK):
+            results = await resolve_check_batch(payload[start:start + CHECK_BATCH_CHUNK])
+            body = ",".join(json.dumps(r) for r in results)
+            yield ("," if start else "") + body
+        yield "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
+
+
+@router.get("/check/stats")
+async def check_subscription_cache_stats():
+    return subscription_cache.stats()
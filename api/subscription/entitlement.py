@@ -0,0 +1,24 @@
+from datetime import datetime, UTC
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from db.Entitlement import get_entitlement, is_entitled
+from utils.logger import logger
+from .router import router
+
+
+@router.get("/entitlement/{user_id}")
+async def get_user_entitlement(user_id: int):
+    entitlement = await get_entitlement(user_id)
+    if entitlement is None:
+        logger.info("[ENTITLEMENT] No entitlement for %s", user_id)
+        return JSONResponse({"user_id": user_id, "entitled": False, "message": "Unknown user"}, status_code=404)
+
+    now = datetime.now(UTC)
+    return JSONResponse(jsonable_encoder({
+        "user_id": user_id,
+        "entitled": is_entitled(entitlement, now),
+        "ends_at": entitlement["ends_at"],
+        "cancel_at_period_end": entitlement["cancel_at_period_end"],
+        "subscription_id": entitlement["subscription_id"],
+    }))
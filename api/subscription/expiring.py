@@ -1,12 +1,71 @@
+import os
+import json
+import base64
+from typing import Optional
 from datetime import date, datetime, timedelta, UTC
 
+from dotenv import load_dotenv
 from fastapi import Query
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, StreamingResponse
+from tortoise.expressions import Q
 from db.models import TelegramUser
 from utils.logger import logger
 from .router import router
 
+load_dotenv()
+# Page size when a cursor is passed without a limit; without either the whole list is returned.
+EXPIRING_PAGE_SIZE = int(os.getenv("EXPIRING_PAGE_SIZE", 1000))
+EXPIRING_MAX_PAGE_SIZE = int(os.getenv("EXPIRING_MAX_PAGE_SIZE", 10000))
+EXPIRING_STREAM_CHUNK = int(os.getenv("EXPIRING_STREAM_CHUNK", 1000))
+
+
+def encode_cursor(row):
+    raw = f"{row['date_end'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    date_end, _, user_pk = raw.rpartition("|")
+    return datetime.fromisoformat(date_end), int(user_pk)
+
+
+async def fetch_expiring_page(start, end, limit=None, after=None):
+    """One keyset page (every row when limit is None) of expiring users ordered by (date_end, id), as plain dicts."""
+    query = TelegramUser.filter(
+        date_end__gte=start,
+        date_end__lte=end,
+        subscription_status=True,
+        is_admin=False
+    )
+    if after:
+        after_date, after_id = after
+        query = query.filter(Q(date_end__gt=after_date) | Q(date_end=after_date, id__gt=after_id))
+    query = query.order_by("date_end", "id")
+    if limit is not None:
+        query = query.limit(limit)
+    return await query.values(
+        "id", "user_id", "date_end", "full_name", "username")
+
+
+def expiring_item(row):
+    return {
+        "user_id": row["user_id"],
+        "date_end": row["date_end"],
+        "full_name": row["full_name"],
+        "username": row["username"]
+    }
+
+
 @router.get("/expiring")
-async def get_expiring_subscriptions(days: int = 5, start_date: date = Query(None, description="Format: YYYY-MM-DD") ):
+async def get_expiring_subscriptions(
+        days: int = 5,
+        start_date: date = Query(None, description="Format: YYYY-MM-DD"),
+        limit: Optional[int] = Query(None, ge=1, le=EXPIRING_MAX_PAGE_SIZE,
+                                     description="page size, pages are opt-in (default: the whole list)"),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+        format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson streams every page")):
     if not start_date:
         start_date = datetime.now(UTC).date()
     if days <= 0:
@@ -16,22 +75,32 @@ async def get_expiring_subscriptions(days: int = 5, start_date: date = Query(Non
     start = datetime.combine(start_date, datetime.min.time(), tzinfo=UTC)
     end = datetime.combine(end_date, datetime.max.time(), tzinfo=UTC)
 
-    logger.info(f"[GET EXPIRING SUBS] Looking for subs from {start} to {end}")
-    users = await TelegramUser.filter(
-        date_end__gte=start,
-        date_end__lte=end,
-        subscription_status=True,
-        is_admin=False
-    ).all()
-
-    logger.info(f"[GET EXPIRING SUBS] Found subscriptions: {users}.")
-    user_ids = [
-        {
-            "user_id": user.user_id,
-            "date_end": user.date_end,
-            "full_name": user.full_name,
-            "username": user.username
-        }
-        for user in users]
-
-    return user_ids
\ No newline at end of file
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return JSONResponse({"error": "Bad cursor passed"}, status_code=400)
+
+    logger.info("[GET EXPIRING SUBS] Looking for subs from %s to %s", start, end)
+
+    if format == "ndjson":
+        async def stream():
+            position = after
+            while True:
+                rows = await fetch_expiring_page(start, end, EXPIRING_STREAM_CHUNK, position)
+                if rows:
+                    yield "".join(json.dumps(jsonable_encoder(expiring_item(r))) + "\n" for r in rows)
+                if len(rows) < EXPIRING_STREAM_CHUNK:
+                    break
+                position = (rows[-1]["date_end"], rows[-1]["id"])
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    if limit is None and after is not None:
+        limit = EXPIRING_PAGE_SIZE
+    rows = await fetch_expiring_page(start, end, limit, after)
+    logger.info("[GET EXPIRING SUBS] Found %s subscriptions.", len(rows))
+
+    headers = {}
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+    return JSONResponse(jsonable_encoder([expiring_item(r) for r in rows]), headers=headers)
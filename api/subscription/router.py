@@ -7,4 +7,5 @@ router = APIRouter(
 
 from . import check
 from . import expiring
-from . import ban
\ No newline at end of file
+from . import ban
+from . import entitlement
\ No newline at end of file
@@ -0,0 +1,443 @@
+"""
+Append-only archive of the raw webhook payloads.
+
+Every verified delivery is kept as received, so a bad row can be traced back
+to what Stripe actually sent. The request path only appends (received_at,
+event, payload) to a bounded deque. A writer thread then:
+- groups the records into zlib compressed blocks,
+- appends the blocks to the current segment file (ARCHIVE_DIR/00000001.seg),
+- rotates to a new segment once ARCHIVE_SEGMENT_BYTES or
+  ARCHIVE_SEGMENT_SECONDS is reached.
+
+Sealing a segment writes its index (00000001.idx): fixed-size entries
+(key hash, event.created, block offset, slot in block) sorted by hash and
+created. Every record has an entry for its event id and one for each object it
+references (the object itself, its customer, payment intent and
+subscription). ArchiveReader memory-maps the indexes, so a lookup is a binary
+search per segment plus one block read, and a customer's events are streamed
+in created order by merging the index runs of that customer's hash. Only the
+segment being written has no index yet and is scanned.
+
+One process owns a directory (flock on ARCHIVE_DIR/.lock), so with several
+uvicorn workers give each its own ARCHIVE_DIR. Records still in the deque or
+in an unflushed block are lost on a crash; a segment left without index by a
+crash is indexed on the next start.
+"""
+import os
+import mmap
+import time
+import zlib
+import fcntl
+import heapq
+import struct
+import hashlib
+import threading
+from collections import deque, namedtuple
+from dotenv import load_dotenv
+
+from utils.logger import logger
+from utils.lru import LRUCache
+from utils.metrics import ARCHIVE_EVENTS, ARCHIVE_BYTES
+from .event import loads, StripeView
+
+load_dotenv()
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+# Segment size limit; offsets in the index are 32-bit.
+ARCHIVE_SEGMENT_BYTES = min(int(os.getenv("ARCHIVE_SEGMENT_BYTES", 64 * 1024 * 1024)), 2 ** 32 - 1)
+ARCHIVE_SEGMENT_SECONDS = float(os.getenv("ARCHIVE_SEGMENT_SECONDS", 3600))
+ARCHIVE_BLOCK_EVENTS = int(os.getenv("ARCHIVE_BLOCK_EVENTS", 64))
+ARCHIVE_FLUSH_MS = float(os.getenv("ARCHIVE_FLUSH_MS", 200))
+# Deliveries waiting for the writer; beyond this they are dropped, not blocked on.
+ARCHIVE_QUEUE_SIZE = int(os.getenv("ARCHIVE_QUEUE_SIZE", 10000))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", 6))
+# Oldest sealed segments beyond this many are deleted; 0 keeps everything.
+ARCHIVE_MAX_SEGMENTS = int(os.getenv("ARCHIVE_MAX_SEGMENTS", 0))
+
+# compressed size, raw size, crc32 of the compressed bytes
+BLOCK_HEADER = struct.Struct("<III")
+# received_at, payload size
+RECORD_HEADER = struct.Struct("<dI")
+# key hash, event.created, block offset, slot in block
+INDEX_ENTRY = struct.Struct("<QqIH")
+# Object fields whose ids a record is indexed under, next to obj.id.
+REFERENCE_FIELDS = ("customer", "payment_intent", "subscription")
+
+ArchivedEvent = namedtuple("ArchivedEvent", "received_at payload")
+
+
+def key_hash(kind, key):
+    """64-bit hash of an index key; kind is b"e" for event ids and b"k" for object ids."""
+    return int.from_bytes(hashlib.blake2b(kind + key.encode(), digest_size=8).digest(), "little")
+
+
+def event_keys(event):
+    """Event id and the ids of the objects the event references."""
+    keys = set()
+    try:
+        obj = event.data.object
+        for value in (obj.get("id"), *(obj.get(field) for field in REFERENCE_FIELDS)):
+            if isinstance(value, str):
+                keys.add(value)
+    except (AttributeError, KeyError, TypeError):
+        pass
+    return event.get("id"), keys
+
+
+def index_entries(event, offset, slot):
+    event_id, keys = event_keys(event)
+    created = event.get("created") or 0
+    entries = [(key_hash(b"e", event_id), created, offset, slot)] if isinstance(event_id, str) else []
+    entries.extend((key_hash(b"k", key), created, offset, slot) for key in keys)
+    return entries
+
+
+def segment_path(directory, seq, suffix=".seg"):
+    return os.path.join(directory, f"{seq:08d}{suffix}")
+
+
+def list_segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".seg") and name[:-4].isdigit())
+
+
+def read_blocks(f):
+    """Yield (offset, raw block) of a segment file, stopping at a torn or corrupt tail."""
+    offset = 0
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        size, raw_size, crc = BLOCK_HEADER.unpack(header)
+        data = f.read(size)
+        if len(data) < size or zlib.crc32(data) != crc:
+            return
+        yield offset, zlib.decompress(data, bufsize=raw_size)
+        offset += BLOCK_HEADER.size + size
+
+
+def block_records(raw):
+    records = []
+    pos = 0
+    while pos < len(raw):
+        received_at, size = RECORD_HEADER.unpack_from(raw, pos)
+        pos += RECORD_HEADER.size
+        records.append(ArchivedEvent(received_at, raw[pos:pos + size]))
+        pos += size
+    return records
+
+
+def scan_segment(path):
+    """Index entries and valid length of a segment without index, by reading all of it."""
+    entries = []
+    end = 0
+    with open(path, "rb") as f:
+        for offset, raw in read_blocks(f):
+            for slot, record in enumerate(block_records(raw)):
+                try:
+                    entries.extend(index_entries(StripeView(loads(record.payload)), offset, slot))
+                except ValueError:
+                    continue
+            end = f.tell()
+    return entries, end
+
+
+def write_index(directory, seq, entries):
+    entries.sort()
+    path = segment_path(directory, seq, ".idx")
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+    os.replace(f"{path}.tmp", path)
+
+
+class EventArchive:
+    def __init__(self, directory=ARCHIVE_DIR, enabled=ARCHIVE_ENABLED, segment_bytes=ARCHIVE_SEGMENT_BYTES,
+                 segment_seconds=ARCHIVE_SEGMENT_SECONDS, block_events=ARCHIVE_BLOCK_EVENTS,
+                 flush_interval=ARCHIVE_FLUSH_MS / 1000, queue_size=ARCHIVE_QUEUE_SIZE,
+                 level=ARCHIVE_COMPRESSION_LEVEL, max_segments=ARCHIVE_MAX_SEGMENTS):
+        self.directory = directory
+        self.enabled = enabled
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.block_events = max(1, block_events)
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.level = level
+        self.max_segments = max_segments
+        self.pending = deque()
+        self.running = False
+        self.stopping = threading.Event()
+        self.thread = None
+        self.lock_file = None
+        self.file = None
+        self.seq = 0
+        self.entries = []
+        self.opened_at = 0.0
+        self.archived = 0
+        self.dropped = 0
+        self.blocks = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.archived_counter = ARCHIVE_EVENTS.labels("archived")
+        self.dropped_counter = ARCHIVE_EVENTS.labels("dropped")
+        self.raw_counter = ARCHIVE_BYTES.labels("raw")
+        self.compressed_counter = ARCHIVE_BYTES.labels("compressed")
+
+    def append(self, event, payload):
+        """Queue a verified delivery for the writer thread. Never blocks."""
+        if not self.running:
+            return
+        if len(self.pending) >= self.queue_size:
+            self.dropped += 1
+            self.dropped_counter.inc()
+            return
+        self.pending.append((time.time(), event, payload))
+
+    def start(self):
+        if not self.enabled or self.running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_file = open(os.path.join(self.directory, ".lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.warning("[ARCHIVE] %s is used by another process, raw events are not archived", self.directory)
+            self.lock_file.close()
+            self.lock_file = None
+            return
+        self.recover()
+        segments = list_segments(self.directory)
+        self.seq = segments[-1] if segments else 0
+        self._open_segment()
+        self.stopping.clear()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="event-archive", daemon=True)
+        self.thread.start()
+        logger.info("[ARCHIVE] Writing raw events to %s", segment_path(self.directory, self.seq))
+
+    def stop(self):
+        """Write what is queued and seal the current segment."""
+        if not self.running:
+            return
+        self.running = False
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        self._seal()
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
+        logger.info("[ARCHIVE] Stopped after %s events (%s dropped)", self.archived, self.dropped)
+
+    def recover(self):
+        """Index the segments a crash left without one, cutting off a torn last block."""
+        for seq in list_segments(self.directory):
+            if os.path.exists(segment_path(self.directory, seq, ".idx")):
+                continue
+            path = segment_path(self.directory, seq)
+            entries, end = scan_segment(path)
+            if end < os.path.getsize(path):
+                logger.warning("[ARCHIVE] Truncating torn tail of %s at byte %s", path, end)
+                os.truncate(path, end)
+            write_index(self.directory, seq, entries)
+            logger.info("[ARCHIVE] Indexed unsealed segment %s (%s entries)", path, len(entries))
+
+    def _open_segment(self):
+        self.seq += 1
+        self.file = open(segment_path(self.directory, self.seq), "ab")
+        self.entries = []
+        self.opened_at = time.monotonic()
+
+    def _seal(self):
+        self.file.close()
+        self.file = None
+        if self.entries or os.path.getsize(segment_path(self.directory, self.seq)):
+            write_index(self.directory, self.seq, self.entries)
+        else:
+            os.remove(segment_path(self.directory, self.seq))
+        self._apply_retention()
+
+    def _apply_retention(self):
+        if self.max_segments <= 0:
+            return
+        for seq in list_segments(self.directory)[:-self.max_segments]:
+            for suffix in (".seg", ".idx"):
+                try:
+                    os.remove(segment_path(self.directory, seq, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _rotate(self):
+        self._seal()
+        self._open_segment()
+
+    def _run(self):
+        while not self.stopping.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        try:
+            while self.pending:
+                batch = []
+                while self.pending and len(batch) < self.block_events:
+                    batch.append(self.pending.popleft())
+                self._write_block(batch)
+                if self.file.tell() >= self.segment_bytes:
+                    self._rotate()
+            self.file.flush()
+            if self.file.tell() and time.monotonic() - self.opened_at >= self.segment_seconds:
+                self._rotate()
+        except Exception:
+            logger.exception("[ARCHIVE] Writing segment %s failed", self.seq)
+
+    def _write_block(self, batch):
+        offset = self.file.tell()
+        parts = []
+        for slot, (received_at, event, payload) in enumerate(batch):
+            parts.append(RECORD_HEADER.pack(received_at, len(payload)))
+            parts.append(payload)
+            self.entries.extend(index_entries(event, offset, slot))
+        raw = b"".join(parts)
+        data = zlib.compress(raw, self.level)
+        self.file.write(BLOCK_HEADER.pack(len(data), len(raw), zlib.crc32(data)) + data)
+        self.archived += len(batch)
+        self.blocks += 1
+        self.raw_bytes += len(raw)
+        self.compressed_bytes += BLOCK_HEADER.size + len(data)
+        self.archived_counter.inc(len(batch))
+        self.raw_counter.inc(len(raw))
+        self.compressed_counter.inc(BLOCK_HEADER.size + len(data))
+
+    def stats(self):
+        return {
+            "enabled": self.running,
+            "directory": self.directory,
+            "segment": self.seq,
+            "archived": self.archived,
+            "dropped": self.dropped,
+            "pending": len(self.pending),
+            "blocks": self.blocks,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "ratio": round(self.raw_bytes / self.compressed_bytes, 2) if self.compressed_bytes else 0.0,
+        }
+
+
+class ArchiveReader:
+    """Point lookups and per-object streams over an archive directory; safe while the writer runs."""
+
+    def __init__(self, directory=ARCHIVE_DIR, block_cache=256):
+        self.directory = directory
+        self.indexes = {}
+        self.blocks = LRUCache(block_cache)
+
+    def close(self):
+        for index in self.indexes.values():
+            if isinstance(index, mmap.mmap):
+                index.close()
+        self.indexes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _index(self, seq):
+        index = self.indexes.get(seq)
+        if index is not None:
+            return index
+        path = segment_path(self.directory, seq, ".idx")
+        if not os.path.exists(path):
+            # Segment being written: index it in memory, and not cached as it grows.
+            try:
+                entries, _ = scan_segment(segment_path(self.directory, seq))
+            except FileNotFoundError:
+                return b""
+            entries.sort()
+            return b"".join(INDEX_ENTRY.pack(*entry) for entry in entries)
+        if os.path.getsize(path) == 0:
+            index = b""
+        else:
+            with open(path, "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.indexes[seq] = index
+        return index
+
+    @staticmethod
+    def _find(index, h):
+        """Entries of index with hash h, in created order."""
+        size = INDEX_ENTRY.size
+        lo, hi = 0, len(index) // size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX_ENTRY.unpack_from(index, mid * size)[0] < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        for n in range(lo, len(index) // size):
+            entry = INDEX_ENTRY.unpack_from(index, n * size)
+            if entry[0] != h:
+                break
+            entries.append(entry)
+        return entries
+
+    def _record(self, seq, offset, slot):
+        records = self.blocks.get((seq, offset))
+        if records is None:
+            with open(segment_path(self.directory, seq), "rb") as f:
+                f.seek(offset)
+                size, raw_size, crc = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                records = block_records(zlib.decompress(f.read(size), bufsize=raw_size))
+            self.blocks.set((seq, offset), records)
+        return records[slot]
+
+    def get(self, event_id):
+        """Latest archived delivery of event_id, or None."""
+        h = key_hash(b"e", event_id)
+        for seq in reversed(list_segments(self.directory)):
+            for _, _, offset, slot in reversed(self._find(self._index(seq), h)):
+                record = self._record(seq, offset, slot)
+                if loads(record.payload).get("id") == event_id:
+                    return record
+        return None
+
+    def stream(self, key, since=None, unique=True):
+        """
+        Archived events referencing the object key (a customer, payment intent,
+        subscription or any object id) in event.created order, optionally from
+        since on. With unique, Stripe's redeliveries of an event are skipped.
+        """
+        h = key_hash(b"k", key)
+        runs = []
+        for seq in list_segments(self.directory):
+            entries = self._find(self._index(seq), h)
+            if entries:
+                runs.append([(created, seq, offset, slot) for _, created, offset, slot in entries])
+        seen = set()
+        for created, seq, offset, slot in heapq.merge(*runs):
+            if since is not None and created < since:
+                continue
+            record = self._record(seq, offset, slot)
+            event_id, keys = event_keys(StripeView(loads(record.payload)))
+            if key not in keys or (unique and event_id in seen):
+                continue
+            seen.add(event_id)
+            yield record
+
+    def stats(self):
+        segments = list_segments(self.directory)
+        sealed = [seq for seq in segments if os.path.exists(segment_path(self.directory, seq, ".idx"))]
+        return {
+            "segments": len(segments),
+            "sealed": len(sealed),
+            "bytes": sum(os.path.getsize(segment_path(self.directory, seq)) for seq in segments),
+            "index_entries": sum(os.path.getsize(segment_path(self.directory, seq, ".idx")) // INDEX_ENTRY.size
+                                 for seq in sealed),
+        }
+
+
+archive = EventArchive()
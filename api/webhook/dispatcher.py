@@ -0,0 +1,149 @@
+import time
+from collections import namedtuple
+
+from db.PaymentIntent import save_payment_intent
+from db.Charge import save_charge
+from db.Customer import save_customer, update_customer_username_from_checkout_session
+from db.Subscription import save_subscription, delete_subscription
+from db.TelegramUser import update_telegram_user_from_event
+from db.bulk import (BULK_WRITES, BULK_ROWS, writer, upsert_payment_intent, upsert_charge, upsert_customer,
+                     upsert_subscription)
+from utils.logger import logger
+from utils.metrics import (OUTCOMES, SKIPPED, ERROR, WEBHOOK_EVENT_SECONDS, WEBHOOK_EVENT_LAG,
+                           WEBHOOK_EVENT_OUTCOMES, WEBHOOK_EVENT_DB_QUERIES)
+from utils.query_counter import count_queries
+from .worker import release_lane, wait_for_lane
+
+Handler = namedtuple("Handler", ["func", "fields"])
+EventMetrics = namedtuple("EventMetrics", ["seconds", "lag", "db_queries", "outcomes"])
+
+# Exact Stripe event type -> handlers, run in order.
+EVENT_HANDLERS = {}
+# Exact Stripe event type -> its metric children, resolved once at registration.
+EVENT_METRICS = {}
+# Exact Stripe event types handled by a single bulk upsert.
+PIPELINED_EVENTS = set()
+
+
+def register(event_types, func, fields=()):
+    """
+    Register func for every type in event_types.
+
+    fields lists the data.object keys the handler cannot work without;
+    the handler is skipped when any of them is missing from the event.
+    """
+    if isinstance(event_types, str):
+        event_types = (event_types,)
+    for event_type in event_types:
+        EVENT_HANDLERS.setdefault(event_type, []).append(Handler(func, tuple(fields)))
+        if len(EVENT_HANDLERS[event_type]) == 1 and func in BULK_ROWS:
+            PIPELINED_EVENTS.add(event_type)
+        else:
+            PIPELINED_EVENTS.discard(event_type)
+        if event_type not in EVENT_METRICS:
+            EVENT_METRICS[event_type] = EventMetrics(
+                WEBHOOK_EVENT_SECONDS.labels(event_type),
+                WEBHOOK_EVENT_LAG.labels(event_type),
+                WEBHOOK_EVENT_DB_QUERIES.labels(event_type),
+                {outcome: WEBHOOK_EVENT_OUTCOMES.labels(event_type, outcome) for outcome in OUTCOMES},
+            )
+
+
+def is_supported(event_type) -> bool:
+    return event_type in EVENT_HANDLERS
+
+
+async def dispatch(event) -> list:
+    """
+    Run the handlers of event. Returns their outcomes in order (empty for an
+    unsupported type); handlers that catch their own errors report ERROR.
+
+    On a worker pool lane, an event handled by a single bulk upsert queues
+    its row and releases the lane before the batch is written; the writer
+    commits batches in arrival order. Other events first wait for the lane's
+    earlier events of the same partition key, since their handlers read what
+    those wrote.
+    """
+    handlers = EVENT_HANDLERS.get(event.type)
+    if not handlers:
+        logger.info("[INFO] Unsupported event type %s, ignored.", event.type)
+        return []
+
+    logger.info("[RECEIVE] Received %s event_id=%s", event.type, event.id)
+    metrics = EVENT_METRICS[event.type]
+    created = event.get("created")
+    if created:
+        metrics.lag.set(time.time() - created)
+
+    obj = event.data.object
+    pipelined = event.type in PIPELINED_EVENTS
+    outcomes = []
+    start = time.perf_counter()
+    try:
+        with count_queries() as queries:
+            if not pipelined:
+                await wait_for_lane()
+            for handler in handlers:
+                missing = [field for field in handler.fields if obj.get(field) is None]
+                if missing:
+                    logger.error("[DISPATCH] %s skipped for %s %s, missing %s",
+                                 handler.func.__name__, event.type, event.id, missing)
+                    metrics.outcomes[SKIPPED].inc()
+                    outcomes.append(SKIPPED)
+                    continue
+                try:
+                    if pipelined:
+                        table, build = BULK_ROWS[handler.func]
+                        queued = writer.enqueue(table, build(event))
+                        release_lane()
+                        outcome = await queued
+                    else:
+                        outcome = await handler.func(event)
+                except Exception:
+                    metrics.outcomes[ERROR].inc()
+                    raise
+                if outcome in metrics.outcomes:
+                    metrics.outcomes[outcome].inc()
+                outcomes.append(outcome)
+    finally:
+        metrics.seconds.observe(time.perf_counter() - start)
+        metrics.db_queries.observe(queries.count)
+    return outcomes
+
+
+register((
+    "payment_intent.created",
+    "payment_intent.processing",
+    "payment_intent.requires_action",
+    "payment_intent.amount_capturable_updated",
+    "payment_intent.partially_funded",
+    "payment_intent.succeeded",
+    "payment_intent.payment_failed",
+    "payment_intent.canceled",
+), upsert_payment_intent if BULK_WRITES else save_payment_intent, fields=("id", "created"))
+
+register((
+    "charge.pending",
+    "charge.succeeded",
+    "charge.failed",
+    "charge.captured",
+    "charge.expired",
+    "charge.refunded",
+    "charge.updated",
+), upsert_charge if BULK_WRITES else save_charge, fields=("id", "billing_details"))
+
+register(("customer.created", "customer.updated"), upsert_customer if BULK_WRITES else save_customer, fields=("id", "created"))
+
+register(
+    ("customer.subscription.created", "customer.subscription.updated"),
+    upsert_subscription if BULK_WRITES else save_subscription,
+    fields=("id", "current_period_start", "current_period_end", "items"),
+)
+register("customer.subscription.updated", update_telegram_user_from_event, fields=("customer",))
+
+register("customer.subscription.deleted", delete_subscription, fields=("id", "ended_at"))
+register("customer.subscription.deleted", update_telegram_user_from_event, fields=("customer", "ended_at"))
+
+register("invoice.paid", update_telegram_user_from_event, fields=("customer",))
+
+register("checkout.session.completed", update_customer_username_from_checkout_session, fields=("customer", "custom_fields"))
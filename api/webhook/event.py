@@ -0,0 +1,118 @@
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+
+def _wrap(value):
+    if type(value) is dict:
+        return StripeView(value)
+    if type(value) is list:
+        return ListView(value)
+    return value
+
+
+class StripeView:
+    """
+    Read-only view over a parsed Stripe object, standing in for StripeObject.
+
+    Supports the access patterns of the handlers: event.data.object.customer,
+    obj.get("id"), obj["data"], hasattr(obj, "lines"). Nested objects and lists
+    are wrapped the first time they are read, not up front, so handlers only
+    pay for the fields they touch.
+    """
+
+    __slots__ = ("_data", "_children")
+
+    def __init__(self, data):
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_children", None)
+
+    def _child(self, key):
+        value = self._data[key]
+        if type(value) is not dict and type(value) is not list:
+            return value
+        children = self._children
+        if children is None:
+            children = {}
+            object.__setattr__(self, "_children", children)
+        view = children.get(key)
+        if view is None:
+            view = children[key] = _wrap(value)
+        return view
+
+    def __getattr__(self, name):
+        try:
+            return self._child(name)
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key):
+        return self._child(key)
+
+    def get(self, key, default=None):
+        if key in self._data:
+            return self._child(key)
+        return default
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, StripeView):
+            return self._data == other._data
+        return self._data == other
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return ((key, _wrap(value)) for key, value in self._data.items())
+
+    def to_dict(self):
+        """The underlying parsed JSON; callers must not modify it."""
+        return self._data
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._data.get('object', '')} id={self._data.get('id')}>"
+
+
+class ListView:
+    __slots__ = ("_items",)
+
+    def __init__(self, items):
+        self._items = items
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ListView(self._items[index])
+        return _wrap(self._items[index])
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return (_wrap(value) for value in self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def to_list(self):
+        return self._items
+
+    def __repr__(self):
+        return f"<{type(self).__name__} len={len(self._items)}>"
+
+
+def parse_event(payload):
+    """Parse raw webhook bytes into an event view."""
+    return StripeView(loads(payload))
@@ -1,28 +1,25 @@
-import os
-import json
-import stripe
-from dotenv import load_dotenv
 from fastapi import APIRouter, Request, status
 
-from db.PaymentIntent import save_payment_intent
-from db.Charge import save_charge
-from db.Customer import save_customer, update_customer_username_from_checkout_session
-from db.Subscription import save_subscription, delete_subscription
-from db.TelegramUser import update_telegram_user_from_event
+from api.admission import ADMISSION_RETRY_AFTER
+from db.ProcessedEvent import claim_event, release_event
+from db.jobs import WEBHOOK_JOB_QUEUE, enqueue_jobs
 from starlette.responses import JSONResponse
 from utils.logger import logger
+from utils.metrics import ERROR
+from .archive import archive
+from .dispatcher import dispatch, is_supported
+from .event import parse_event
+from .signature import verifier, SignatureVerificationError
+from .worker import WorkerPool, WEBHOOK_FAST_ACK, partition_key
 
 router = APIRouter(
     tags=["Webhook"],
 )
 
-load_dotenv()
-STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 @router.post("/stripe_webhook")
 async def webhook_handler(request: Request):
     event = None
-    is_processed = False
     payload = await request.body()
     sig_header = request.headers.get("Stripe-Signature", None)
     if sig_header is None:
@@ -30,52 +27,60 @@ async def webhook_handler(request: Request):
         return JSONResponse({"error": "Missing Stripe‑Signature header"}, status_code=400)
 
     try:
-        event = stripe.Event.construct_from(
-            json.loads(payload),
-            sig_header,
-            STRIPE_WEBHOOK_SECRET)
-    except stripe.error.SignatureVerificationError as e:
-        logger.error(e)
+        verifier.verify(payload, sig_header)
+    except SignatureVerificationError as e:
+        logger.error("[SIGNATURE] %s", e)
         return JSONResponse({"error": "Invalid signature"}, status_code=400)
+
+    try:
+        event = parse_event(payload)
+        archive.append(event, payload)
+        event_type = event.get("type")
+        if not is_supported(event_type):
+            logger.info("[INFO] Unsupported event type %s, ignored.", event_type)
+            return JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
     except Exception as e:
         logger.error(e)
         return JSONResponse({"error": str(e)}, status_code=400)
 
-    if "payment_intent" in event.type:
-        is_processed = True
-        logger.info(f"[RECEIVE] Received payment_intent with status={event.get('type')} event_id={event.get('id')}")
-        await save_payment_intent(event)
+    if WEBHOOK_JOB_QUEUE:
+        await enqueue_jobs([(event.id, event.type, str(partition_key(event)), payload.decode())])
+    elif WEBHOOK_FAST_ACK:
+        if not await worker_pool.submit(event):
+            return JSONResponse({"error": "Webhook queue is full"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+    else:
+        outcomes = await worker_pool.run(event)
+        if outcomes and ERROR in outcomes:
+            # The claim was released, a non-2xx answer makes Stripe deliver it again.
+            return JSONResponse({"error": "Event processing failed"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    elif "charge" in event.type:
-        is_processed = True
-        logger.info(f"[RECEIVE] Received charge with status={event.get('type')} event_id={event.get('id')}")
-        await save_charge(event)
+    return JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
 
-    elif "customer" in event.type:
-        logger.info(f"[RECEIVE] Received customer event {event.type}: event_id={event.get('id')}")
-        is_processed = True
-        if event.type in ["customer.created", "customer.updated"]:
-            await save_customer(event)
 
-        elif event.type in ["customer.subscription.created", "customer.subscription.updated"]:
-            await save_subscription(event)
-            if event.type == "customer.subscription.updated":
-                await update_telegram_user_from_event(event)
+async def process_event(event):
+    """
+    Claim and dispatch event. Returns the handlers' outcomes, None for a
+    redelivery. The claim is released when a handler raises or reports ERROR,
+    so the next delivery of the event is processed again.
+    """
+    if not await claim_event(event.id, event.type):
+        return None
 
-        elif event.type == "customer.subscription.deleted":
-            await delete_subscription(event)
-
-    elif "invoice" in event.type:
-        if event.type == "invoice.paid":
-            await update_telegram_user_from_event(event)
+    try:
+        outcomes = await dispatch(event)
+    except Exception:
+        await release_event(event.id)
+        raise
+    if ERROR in outcomes:
+        logger.error("[ERROR] %s event_id=%s failed, released for redelivery", event.type, event.id)
+        await release_event(event.id)
+    return outcomes
 
-    elif event.type == "checkout.session.completed":
-        logger.info(f"[RECEIVE] Received checkout session event {event.type}: event_id={event.get('id')}")
-        is_processed = True
-        await update_customer_username_from_checkout_session(event)
 
+worker_pool = WorkerPool(process_event)
 
-    if not is_processed:
-        logger.info(f"[INFO] Unsupported event type {event.type}, ignored.")
 
-    return JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
\ No newline at end of file
+@router.get("/stripe_webhook/lanes")
+async def webhook_lanes():
+    return worker_pool.stats()
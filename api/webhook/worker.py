@@ -0,0 +1,221 @@
+import os
+import time
+import zlib
+import asyncio
+import contextvars
+from collections import namedtuple
+from dotenv import load_dotenv
+
+from utils.logger import logger
+
+load_dotenv()
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK", "false").lower() in ("1", "true", "yes")
+# Number of ordered lanes, each drained by its own worker.
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+# Total queue bound, split evenly between the lanes.
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+# What to do when a lane is full: "reject" (503, Stripe retries later),
+# "wait" (block up to WEBHOOK_QUEUE_WAIT seconds, then reject) or "inline"
+# (block until there is room and wait for the result like the synchronous mode does).
+WEBHOOK_QUEUE_FULL = os.getenv("WEBHOOK_QUEUE_FULL", "reject").lower()
+WEBHOOK_QUEUE_WAIT = float(os.getenv("WEBHOOK_QUEUE_WAIT", 2))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
+
+# The lane slot of the event a handler runs for: the future that lets the lane
+# start its next event early, and the lane's still running events of the same
+# partition key that came before it.
+LaneSlot = namedtuple("LaneSlot", ["handoff", "earlier"])
+_lane_slot = contextvars.ContextVar("webhook_lane_slot", default=None)
+
+
+def release_lane():
+    """
+    Let the lane start its next event while this one finishes. Only call it
+    once the event's remaining work is queued somewhere that keeps arrival
+    order (the bulk writer), so later events of the lane cannot overtake it.
+    """
+    slot = _lane_slot.get()
+    if slot is not None and not slot.handoff.done():
+        slot.handoff.set_result(None)
+
+
+async def wait_for_lane():
+    """Wait until the lane's earlier events of the same partition key are done."""
+    slot = _lane_slot.get()
+    if slot is not None and slot.earlier:
+        await asyncio.wait(slot.earlier)
+
+
+def partition_key(event):
+    """
+    Owning object of an event: payment intents and their charges share the
+    payment_intent id, everything else is keyed by its customer.
+    """
+    obj = event.data.object
+    if event.type.startswith(("payment_intent.", "charge.")):
+        return obj.get("payment_intent") or obj.get("id")
+    if event.type.startswith("customer.") and not event.type.startswith(("customer.subscription.", "customer.discount.")):
+        return obj.get("id")
+    return obj.get("customer") or obj.get("id") or event.id
+
+
+class Lane:
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # Task -> partition key of the lane's events still running; more than
+        # one once handlers call release_lane().
+        self.in_flight = {}
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def stats(self):
+        return {
+            "depth": self.queue.qsize(),
+            "in_flight": len(self.in_flight),
+            "processed": self.processed,
+            "wait_avg_ms": round(self.wait_total / self.processed * 1000, 3) if self.processed else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class WorkerPool:
+    """
+    Key-partitioned executor: events are hashed by partition_key() onto ordered
+    lanes, so work for one customer runs strictly in order while different
+    customers run in parallel. A handler may hand its lane over to the next
+    event early with release_lane(); such events keep running in the
+    background, at most a lane's queue size of them, and are waited for when
+    the pool drains.
+
+    submit() returns True once the event is accepted and False when it was
+    rejected, so the caller can answer 503 and let Stripe retry. run() waits
+    for the event to be processed.
+    """
+
+    def __init__(self, handler, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE,
+                 on_full=WEBHOOK_QUEUE_FULL, wait_timeout=WEBHOOK_QUEUE_WAIT):
+        if on_full not in ("reject", "wait", "inline"):
+            raise ValueError(f"Unknown queue full policy {on_full!r}")
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.on_full = on_full
+        self.wait_timeout = wait_timeout
+        self.lanes = []
+        self.tasks = []
+        self.running = False
+
+    async def start(self):
+        if self.running:
+            return
+        lane_size = max(1, self.queue_size // self.workers)
+        self.lanes = [Lane(lane_size) for _ in range(self.workers)]
+        self.tasks = [asyncio.create_task(self._worker(n, lane)) for n, lane in enumerate(self.lanes)]
+        self.running = True
+        logger.info("[WORKER POOL] Started %s lanes of %s events, on full: %s", self.workers, lane_size, self.on_full)
+
+    def lane_for(self, event):
+        return self.lanes[zlib.crc32(str(partition_key(event)).encode()) % len(self.lanes)]
+
+    async def submit(self, event) -> bool:
+        if not self.running:
+            logger.warning("[WORKER POOL] Pool is not running, rejected event_id=%s", event.get('id'))
+            return False
+
+        lane = self.lane_for(event)
+        try:
+            lane.queue.put_nowait((time.monotonic(), event, None))
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.on_full == "inline":
+            logger.warning("[WORKER POOL] Lane full, waiting for event_id=%s", event.get('id'))
+            await self._put_and_wait(lane, event)
+            return True
+
+        if self.on_full == "wait":
+            try:
+                await asyncio.wait_for(lane.queue.put((time.monotonic(), event, None)), timeout=self.wait_timeout)
+                return True
+            except asyncio.TimeoutError:
+                pass
+
+        logger.warning("[WORKER POOL] Lane full, rejected event_id=%s", event.get('id'))
+        return False
+
+    async def run(self, event):
+        """Process event on its lane and wait for the result."""
+        if not self.running:
+            return await self.handler(event)
+        return await self._put_and_wait(self.lane_for(event), event)
+
+    async def _put_and_wait(self, lane, event):
+        future = asyncio.get_running_loop().create_future()
+        await lane.queue.put((time.monotonic(), event, future))
+        return await future
+
+    async def stop(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """Stop accepting events, wait for the lanes to drain, then cancel the workers."""
+        if not self.running:
+            return
+        self.running = False
+        logger.info("[WORKER POOL] Draining %s queued events...", sum(lane.queue.qsize() for lane in self.lanes))
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(lane.queue.join() for lane in self.lanes)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("[WORKER POOL] Drain timed out, dropping %s events", sum(lane.queue.qsize() for lane in self.lanes))
+
+        tasks = self.tasks + [task for lane in self.lanes for task in lane.in_flight]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = []
+        logger.info("[WORKER POOL] Stopped")
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queued": sum(lane.queue.qsize() for lane in self.lanes),
+            "queue_size": self.queue_size,
+            "lanes": [lane.stats() for lane in self.lanes],
+        }
+
+    async def _worker(self, n, lane):
+        loop = asyncio.get_running_loop()
+        while True:
+            if len(lane.in_flight) >= lane.queue.maxsize:
+                await asyncio.wait(list(lane.in_flight), return_when=asyncio.FIRST_COMPLETED)
+            enqueued, event, future = await lane.queue.get()
+            waited = time.monotonic() - enqueued
+            lane.wait_total += waited
+            lane.wait_max = max(lane.wait_max, waited)
+
+            key = partition_key(event)
+            handoff = loop.create_future()
+            earlier = frozenset(task for task, task_key in lane.in_flight.items() if task_key == key)
+            token = _lane_slot.set(LaneSlot(handoff, earlier))
+            try:
+                task = asyncio.create_task(self._process(n, lane, event, future))
+            finally:
+                _lane_slot.reset(token)
+            lane.in_flight[task] = key
+            task.add_done_callback(lane.in_flight.pop)
+            await asyncio.wait((task, handoff), return_when=asyncio.FIRST_COMPLETED)
+
+    async def _process(self, n, lane, event, future):
+        try:
+            result = await self.handler(event)
+            if future is not None and not future.done():
+                future.set_result(result)
+        except Exception as e:
+            if future is not None and not future.done():
+                future.set_exception(e)
+            else:
+                logger.exception("[WORKER POOL] Lane %s failed on event_id=%s", n, event.get('id'))
+        finally:
+            lane.processed += 1
+            lane.queue.task_done()
@@ -0,0 +1,283 @@
+"""
+Backfill / replay of a Stripe event export into payment, charge, customer and
+subscription.
+
+    python backfill.py events.jsonl [--chunk 20000] [--connections 4] [--checkpoint PATH] [--restart]
+                                    [--telegram] [--sort]
+
+The export is streamed (one event per line) in chunks and must be oldest
+first. Stripe's events list is newest first: pass --sort to write a copy
+sorted by event.created to <export>.sorted and backfill that. Each chunk is
+sorted by event.created and goes through the handlers registered in the
+webhook dispatcher:
+- Handlers with a set-based form (the bulk upserts) get their rows merged
+  per object. The rows are then split by owning object over --connections
+  transactions that run concurrently. Each transaction adds its revenue
+  deltas to a rollup slot of its own, so they never wait on each other.
+- The remaining handlers (subscription deletes, checkout usernames) run
+  event by event afterwards, ordered per customer.
+- Telegram user updates are skipped unless --telegram is passed.
+
+Row handlers only see what earlier chunks wrote (a subscription delete finds
+no subscription to delete if its creation comes in a later chunk), so the run
+stops before writing a chunk that holds events older than an earlier chunk,
+or that reads newest first. Upserts keep the last-writer-wins rule on
+updated, so replaying a chunk is harmless. After every committed chunk the
+byte offset is written to the checkpoint file. A rerun resumes from there
+unless --restart is given.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import zlib
+import asyncio
+import argparse
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from tortoise_config import TORTOISE_ORM
+from api.webhook.dispatcher import EVENT_HANDLERS
+from api.webhook.event import loads, StripeView
+from api.webhook.worker import partition_key
+from db.PaymentIntent import save_payment_intent
+from db.Charge import save_charge
+from db.Customer import save_customer
+from db.Subscription import save_subscription
+from db.TelegramUser import update_telegram_user_from_event
+from db.Revenue import REVENUE_ROLLUP_SLOTS
+from db.bulk import (TABLE_ORDER, merge_row, write_rows, payment_intent_row, charge_row, customer_row,
+                     subscription_row, upsert_payment_intent, upsert_charge, upsert_customer, upsert_subscription)
+
+# Handlers replaced by a set-based upsert: func -> (table, row builder).
+SET_BASED = {
+    save_payment_intent: ("payment", payment_intent_row),
+    upsert_payment_intent: ("payment", payment_intent_row),
+    save_charge: ("charge", charge_row),
+    upsert_charge: ("charge", charge_row),
+    save_customer: ("customer", customer_row),
+    upsert_customer: ("customer", customer_row),
+    save_subscription: ("subscription", subscription_row),
+    upsert_subscription: ("subscription", subscription_row),
+}
+# Row column that decides the connection a row is written on. Rows linked by a
+# foreign key share it, so concurrent transactions never lock each other's rows.
+PARTITION_COLUMN = {
+    "payment": "id",
+    "charge": "payment_intent_id",
+    "customer": "id",
+    "subscription": "customer_id",
+}
+
+
+class Progress:
+    def __init__(self, offset=0, lines=0, events=0, size=0, last_created=0):
+        self.offset = offset
+        self.lines = lines
+        self.events = events
+        self.size = size
+        # Newest event.created of the chunks applied so far.
+        self.last_created = last_created
+        self.skipped = 0
+        self.unsupported = 0
+        self.bad_lines = 0
+        self.started = time.monotonic()
+        self.started_events = events
+
+    def report(self, chunk_events, chunk_seconds):
+        elapsed = time.monotonic() - self.started
+        percent = self.offset / self.size * 100 if self.size else 100.0
+        rate = (self.events - self.started_events) / elapsed if elapsed else 0.0
+        print(f"[BACKFILL] {self.lines} lines ({percent:.1f}%), {self.events} events applied, "
+              f"{self.skipped} skipped, {self.unsupported} unsupported, {self.bad_lines} bad lines | "
+              f"{rate:.0f} events/s overall, {chunk_events / chunk_seconds if chunk_seconds else 0:.0f} events/s last chunk",
+              flush=True)
+
+
+def load_checkpoint(path, export_path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("export") != os.path.abspath(export_path):
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('export')}, pass --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(path, export_path, progress):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"export": os.path.abspath(export_path), "offset": progress.offset,
+                   "lines": progress.lines, "events": progress.events, "last_created": progress.last_created}, f)
+    os.replace(tmp, path)
+
+
+def read_chunks(path, offset, chunk_size, progress):
+    """Yield (events, end offset) chunks of the export starting at offset."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        events = []
+        for line in f:
+            offset += len(line)
+            progress.lines += 1
+            if not line.strip():
+                continue
+            try:
+                events.append(StripeView(loads(line)))
+            except ValueError:
+                progress.bad_lines += 1
+                continue
+            if len(events) >= chunk_size:
+                yield events, offset
+                events = []
+        if events:
+            yield events, offset
+
+
+def _created(event):
+    return event.get("created") or 0
+
+
+def sort_export(path, sorted_path):
+    """
+    Write the lines of the export at path to sorted_path ordered by
+    event.created, oldest first. Only (created, offset, length) of every line
+    is held in memory. Events of the same second keep their order, read from
+    the end of a newest-first export.
+    """
+    entries = []
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                try:
+                    created = loads(line).get("created") or 0
+                except ValueError:
+                    created = 0
+                entries.append((created, offset, len(line)))
+            offset += len(line)
+    if sum(b[0] < a[0] for a, b in zip(entries, entries[1:])) > len(entries) // 2:
+        entries.reverse()
+    entries.sort(key=lambda entry: entry[0])
+
+    tmp = f"{sorted_path}.tmp"
+    with open(path, "rb") as f, open(tmp, "wb") as out:
+        for _, offset, length in entries:
+            f.seek(offset)
+            line = f.read(length)
+            out.write(line if line.endswith(b"\n") else line + b"\n")
+    os.replace(tmp, sorted_path)
+    print(f"[BACKFILL] Sorted {len(entries)} events of {path} into {sorted_path}", flush=True)
+
+
+def check_order(events, progress):
+    """Stop the run before a chunk that would be applied out of created order."""
+    created = [_created(e) for e in events]
+    oldest = min(created)
+    if oldest < progress.last_created:
+        raise SystemExit(f"[BACKFILL] Line {progress.lines}: chunk has events created at {oldest}, before {progress.last_created} "
+                         f"from an earlier chunk. The export is not oldest first, rerun with --sort")
+    descending = sum(b < a for a, b in zip(created, created[1:]))
+    ascending = sum(b > a for a, b in zip(created, created[1:]))
+    if descending > ascending:
+        raise SystemExit(f"[BACKFILL] Line {progress.lines}: the export reads newest first, rerun with --sort")
+
+
+def _slot(key, connections):
+    return zlib.crc32(str(key).encode()) % connections
+
+
+async def write_group(rows, rollup_slot):
+    async with in_transaction() as conn:
+        await write_rows(conn, rows, rollup_slot)
+
+
+async def run_row_handlers(calls):
+    for func, event in calls:
+        await func(event)
+
+
+async def apply_chunk(events, connections, telegram, progress):
+    events.sort(key=_created)
+    groups = [{table: {} for table in TABLE_ORDER} for _ in range(connections)]
+    row_calls = [[] for _ in range(connections)]
+
+    for event in events:
+        handlers = EVENT_HANDLERS.get(event.get("type"))
+        if not handlers:
+            progress.unsupported += 1
+            continue
+        obj = event.data.object
+        for handler in handlers:
+            if any(obj.get(field) is None for field in handler.fields):
+                progress.skipped += 1
+                continue
+            target = SET_BASED.get(handler.func)
+            if target is not None:
+                table, build = target
+                row = build(event)
+                merge_row(groups[_slot(row.get(PARTITION_COLUMN[table]) or row["id"], connections)], table, row)
+            elif telegram or handler.func is not update_telegram_user_from_event:
+                row_calls[_slot(partition_key(event), connections)].append((handler.func, event))
+        progress.events += 1
+
+    # Past the slots the webhook writers hash into.
+    await asyncio.gather(*(write_group(rows, REVENUE_ROLLUP_SLOTS + n) for n, rows in enumerate(groups)
+                           if any(rows.values())))
+    await asyncio.gather(*(run_row_handlers(calls) for calls in row_calls if calls))
+    progress.last_created = max(progress.last_created, _created(events[-1]))
+
+
+async def backfill(args):
+    if args.sort:
+        sorted_path = f"{args.export}.sorted"
+        # A sorted copy newer than the export is reused, so a resumed run keeps its offsets.
+        if args.restart or not os.path.exists(sorted_path) or os.path.getmtime(sorted_path) < os.path.getmtime(args.export):
+            sort_export(args.export, sorted_path)
+        args.export = sorted_path
+    checkpoint_path = args.checkpoint or f"{args.export}.checkpoint"
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path, args.export)
+    progress = Progress(size=os.path.getsize(args.export))
+    if checkpoint:
+        progress = Progress(checkpoint["offset"], checkpoint["lines"], checkpoint["events"], progress.size,
+                            checkpoint.get("last_created", 0))
+        print(f"[BACKFILL] Resuming {args.export} at line {progress.lines} (byte {progress.offset})")
+
+    config = copy.deepcopy(TORTOISE_ORM)
+    credentials = config["connections"]["default"]["credentials"]
+    credentials["maxsize"] = max(credentials.get("maxsize") or 0, args.connections)
+    await Tortoise.init(config=config)
+    try:
+        for events, offset in read_chunks(args.export, progress.offset, args.chunk, progress):
+            started = time.monotonic()
+            check_order(events, progress)
+            await apply_chunk(events, args.connections, args.telegram, progress)
+            progress.offset = offset
+            save_checkpoint(checkpoint_path, args.export, progress)
+            progress.report(len(events), time.monotonic() - started)
+    finally:
+        await Tortoise.close_connections()
+    print(f"[BACKFILL] Done: {progress.lines} lines, {progress.events} events applied")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("export", help="Stripe event export, one JSON event per line")
+    parser.add_argument("--chunk", type=int, default=20000, help="events per chunk (default 20000)")
+    parser.add_argument("--connections", type=int, default=4, help="concurrent write transactions (default 4)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <export>.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--telegram", action="store_true", help="also apply Telegram user updates")
+    parser.add_argument("--sort", action="store_true", help="sort the export by event.created first (for newest-first exports)")
+    args = parser.parse_args()
+    if args.connections < 1 or args.chunk < 1:
+        parser.error("--chunk and --connections must be positive")
+    asyncio.run(backfill(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
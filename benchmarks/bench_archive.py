@@ -0,0 +1,79 @@
+"""
+Raw event archive benchmark (api/webhook/archive.py).
+
+Appends the synthetic event stream (benchmarks.event_stream) to an archive in
+a temporary directory and reports the cost of append() on the request path,
+the writer's throughput and compression ratio, and the latency of point
+lookups by event id and of streaming one customer's events. The writer is kept
+idle while appending, so the two costs are measured apart.
+
+    python -m benchmarks.bench_archive [--customers 5000] [--segment-mb 0.5] [--lookups 2000]
+"""
+import gc
+import os
+import time
+import random
+import tempfile
+import argparse
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from api.webhook.archive import EventArchive, ArchiveReader
+from api.webhook.event import parse_event
+from benchmarks.event_stream import generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--segment-mb", type=float, default=0.5, help="segment size, to get several segments")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    deliveries, _ = generate(args.customers, seed=args.seed)
+    events = [(parse_event(d.body), d.body) for d in deliveries]
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = EventArchive(directory, enabled=True, segment_bytes=int(args.segment_mb * 1024 * 1024),
+                               queue_size=len(events) + 1, flush_interval=3600)
+        archive.start()
+        # Freeze the generated events so collector passes over them are not billed to append().
+        gc.collect()
+        gc.freeze()
+        started = time.perf_counter()
+        for event, payload in events:
+            archive.append(event, payload)
+        append_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        archive.stop()
+        writer_seconds = time.perf_counter() - started
+        stats = archive.stats()
+        print(f"{len(events)} deliveries, {stats['raw_bytes'] / 1e6:.1f} MB raw -> "
+              f"{stats['compressed_bytes'] / 1e6:.1f} MB ({stats['ratio']}x), {stats['dropped']} dropped")
+        print(f"append():  {append_seconds / len(events) * 1e6:.2f} us per delivery on the request path")
+        print(f"writer:    {len(events) / writer_seconds:.0f} deliveries/s including compression and sealing")
+
+        with ArchiveReader(directory) as reader:
+            print(f"archive:   {reader.stats()}")
+            ids = [rng.choice(events)[0].id for _ in range(args.lookups)]
+            started = time.perf_counter()
+            missing = sum(1 for event_id in ids if reader.get(event_id) is None)
+            lookup = (time.perf_counter() - started) / len(ids)
+            print(f"get():     {lookup * 1e6:.0f} us per event id lookup, {missing} not found")
+
+            customers = [f"cus_load{rng.randrange(args.customers)}" for _ in range(min(args.lookups, 500))]
+            started = time.perf_counter()
+            streamed = [list(reader.stream(customer)) for customer in customers]
+            per_stream = (time.perf_counter() - started) / len(customers)
+            counts = [len(s) for s in streamed]
+            ordered = all(
+                [parse_event(r.payload).created for r in s] == sorted(parse_event(r.payload).created for r in s)
+                for s in streamed)
+            print(f"stream():  {per_stream * 1e3:.2f} ms per customer, {min(counts)}-{max(counts)} events each, "
+                  f"created order {'ok' if ordered else 'BROKEN'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Write-path benchmark of the bulk writer (db/bulk.py) behind the webhook lanes.
+
+The synthetic event stream (benchmarks.event_stream) is parsed up front and
+submitted straight to a WorkerPool running process_event, skipping HTTP and
+signature checks, once with the row-by-row handlers and once with
+BULK_WRITES. Each mode runs in its own process since BULK_WRITES is read at
+import. Reports events per second, DB round-trips per event and, for the
+bulk writer, the rows written per batch.
+
+Uses the database configured in tortoise_config and truncates every table, so
+only point DB_* at a throwaway database.
+
+    python -m benchmarks.bench_bulk_writer [--customers 1000] [--workers 4]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("ARCHIVE_ENABLED", "false")
+
+
+async def run_child(args):
+    from tortoise import Tortoise
+
+    from tortoise_config import TORTOISE_ORM
+    from api.webhook.event import parse_event
+    from api.webhook.stripe_webhook import process_event
+    from api.webhook.worker import WorkerPool
+    from benchmarks.bench_throughput import reset_tables
+    from benchmarks.event_stream import generate
+    from db.bulk import BULK_WRITES, writer
+    from db.notifier import notifier
+    from utils.query_counter import instrument_db_client, count_queries
+
+    deliveries, _ = generate(args.customers, seed=args.seed)
+    events = [parse_event(delivery.body) for delivery in deliveries]
+    instrument_db_client()
+    await Tortoise.init(config=TORTOISE_ORM)
+    await notifier.start()
+    try:
+        await reset_tables()
+        pool = WorkerPool(process_event, workers=args.workers, queue_size=len(events), on_full="inline")
+        with count_queries() as queries:
+            # The lanes and the flushes they start inherit the counter.
+            await pool.start()
+            started = time.perf_counter()
+            for event in events:
+                await pool.submit(event)
+            await pool.stop()
+            elapsed = time.perf_counter() - started
+    finally:
+        await notifier.stop()
+        await Tortoise.close_connections()
+    batches = writer.stats()["rows_per_batch"] if BULK_WRITES else "-"
+    print(f"{'bulk' if BULK_WRITES else 'row-by-row':>10} {len(events) / elapsed:9.0f} "
+          f"{queries.count / len(events):14.2f} {batches:>14}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4, help="worker pool lanes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return asyncio.run(run_child(args))
+
+    print(f"{args.customers} customers on {args.workers} lanes")
+    print(f"{'mode':>10} {'events/s':>9} {'queries/event':>14} {'rows/batch':>14}", flush=True)
+    for bulk in ("false", "true"):
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_bulk_writer", "--child",
+                        "--customers", str(args.customers), "--workers", str(args.workers), "--seed", str(args.seed)],
+                       env={**os.environ, "BULK_WRITES": bulk}, check=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Microbenchmark: per-event parse and dispatch-side field access with the event
+view (api.webhook.event) against json.loads + stripe.Event.construct_from.
+
+The "+ dispatch" columns parse a fresh event and then run what happens before
+the database: the required-field check, partition_key() and the fields each
+handler reads. No database is touched.
+
+    python -m benchmarks.bench_event_view [invoice_lines]
+"""
+import sys
+import json
+import time
+import timeit
+
+import stripe
+
+from api.webhook.dispatcher import EVENT_HANDLERS
+from api.webhook.event import parse_event, loads
+from api.webhook.worker import partition_key
+from db.bulk import payment_intent_row, charge_row, customer_row, subscription_row
+
+ROUNDS = 2000
+
+
+def make_events(lines):
+    now = int(time.time())
+    period = {"start": now, "end": now + 2592000}
+    objects = {
+        "payment_intent.succeeded": {
+            "id": "pi_bench", "object": "payment_intent", "amount": 1000, "currency": "eur", "status": "succeeded",
+            "created": now, "receipt_email": "bench@example.com", "statement_descriptor": None, "description": None,
+            "charges": {"object": "list", "data": []}, "metadata": {},
+        },
+        "charge.succeeded": {
+            "id": "ch_bench", "object": "charge", "payment_intent": "pi_bench", "amount": 1000, "currency": "eur",
+            "status": "succeeded", "receipt_url": "https://example.com/r", "created": now,
+            "billing_details": {"email": "bench@example.com", "address": {"country": "NL"}},
+            "outcome": {"network_status": "approved_by_network", "type": "authorized"},
+        },
+        "customer.updated": {
+            "id": "cus_bench", "object": "customer", "email": "bench@example.com", "name": "Bench",
+            "phone": None, "description": None, "created": now, "metadata": {},
+        },
+        "customer.subscription.updated": {
+            "id": "sub_bench", "object": "subscription", "customer": "cus_bench", "status": "active",
+            "current_period_start": period["start"], "current_period_end": period["end"],
+            "cancel_at_period_end": False,
+            "items": {"object": "list", "url": "/v1/subscription_items?subscription=sub_bench",
+                      "data": [{"id": "si_bench", "price": {"id": "price_bench", "unit_amount": 1000}}]},
+        },
+        "invoice.paid": {
+            "id": "in_bench", "object": "invoice", "customer": "cus_bench", "cancel_at_period_end": False,
+            "lines": {"object": "list", "data": [
+                {"id": f"il_{n}", "amount": 1000, "period": period, "price": {"id": "price_bench"}}
+                for n in range(lines)
+            ]},
+        },
+    }
+    return {
+        event_type: json.dumps({
+            "id": f"evt_{event_type}", "object": "event", "type": event_type, "created": now,
+            "data": {"object": obj},
+        }).encode()
+        for event_type, obj in objects.items()
+    }
+
+
+ROW_BUILDERS = {
+    "payment_intent.succeeded": payment_intent_row,
+    "charge.succeeded": charge_row,
+    "customer.updated": customer_row,
+    "customer.subscription.updated": subscription_row,
+}
+
+
+def touch(event):
+    """The reads the dispatcher and the handlers do for one event."""
+    obj = event.data.object
+    for handler in EVENT_HANDLERS[event.type]:
+        [field for field in handler.fields if obj.get(field) is None]
+    partition_key(event)
+    builder = ROW_BUILDERS.get(event.type)
+    if builder:
+        builder(event)
+    if hasattr(obj, "cancel_at_period_end"):
+        obj.cancel_at_period_end
+    if event.type == "invoice.paid" and hasattr(obj, "lines") and len(obj.lines.data) > 0:
+        obj.lines.data[0].period.end
+
+
+def construct(payload):
+    return stripe.Event.construct_from(json.loads(payload), stripe.api_key)
+
+
+def per_event_us(fn, rounds):
+    return min(timeit.repeat(fn, number=rounds, repeat=3)) / rounds * 1e6
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"parser: {loads.__module__}, invoice lines: {lines}, {ROUNDS} rounds")
+    print(f"{'event type':32} {'bytes':>7} {'stripe parse':>13} {'view parse':>11} "
+          f"{'stripe + dispatch':>18} {'view + dispatch':>16}")
+    for event_type, payload in make_events(lines).items():
+        print(f"{event_type:32} {len(payload):7} "
+              f"{per_event_us(lambda: construct(payload), ROUNDS):11.1f}us "
+              f"{per_event_us(lambda: parse_event(payload), ROUNDS):9.1f}us "
+              f"{per_event_us(lambda: touch(construct(payload)), ROUNDS):16.1f}us "
+              f"{per_event_us(lambda: touch(parse_event(payload)), ROUNDS):14.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Scaling benchmark of the Postgres job queue (db/jobs.py, job_worker.py).
+
+For every worker count in --workers the tables are truncated, the synthetic
+event stream (benchmarks.event_stream) is enqueued like the webhook does with
+WEBHOOK_JOB_QUEUE set, and that many `job_worker.py --drain` processes are
+started to work the queue off. Reports events per second, the speedup over the
+first run and the jobs left behind (dead or unfinished). Timings include the
+workers' start-up, and the workers share the machine with Postgres, so the
+speedup is only meaningful with spare cores.
+
+Uses the database configured in tortoise_config and truncates every table, so
+only point DB_* at a throwaway database.
+
+    python -m benchmarks.bench_job_queue [--customers 500] [--workers 1,2,4] [--concurrency 4] [--batch 20]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from tortoise import Tortoise, connections
+
+from tortoise_config import TORTOISE_ORM
+from api.webhook.event import parse_event
+from api.webhook.worker import partition_key
+from db.jobs import enqueue_jobs, job_stats
+from benchmarks.event_stream import generate
+from benchmarks.bench_throughput import reset_tables
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_jobs(deliveries):
+    jobs = []
+    for delivery in deliveries:
+        event = parse_event(delivery.body)
+        jobs.append((event.id, event.type, str(partition_key(event)), delivery.body.decode()))
+    return jobs
+
+
+async def prepare(jobs):
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        await reset_tables()
+        await enqueue_jobs(jobs)
+    finally:
+        await Tortoise.close_connections()
+
+
+async def leftovers():
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        stats = await job_stats()
+        subscriptions = await connections.get("default").execute_query_dict(
+            'SELECT count(*) AS "count" FROM "subscription"')
+    finally:
+        await Tortoise.close_connections()
+    return {status: s["count"] for status, s in stats.items()}, subscriptions[0]["count"]
+
+
+async def run_workers(count, args):
+    command = [sys.executable, os.path.join(ROOT, "job_worker.py"), "--drain", "--report-interval", "0",
+               "--concurrency", str(args.concurrency), "--batch", str(args.batch)]
+    started = time.perf_counter()
+    workers = [await asyncio.create_subprocess_exec(*command, cwd=ROOT, stdout=asyncio.subprocess.DEVNULL)
+               for _ in range(count)]
+    codes = await asyncio.gather(*(worker.wait() for worker in workers))
+    return time.perf_counter() - started, codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker process counts")
+    parser.add_argument("--concurrency", type=int, default=4, help="slots per worker process")
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    deliveries, _ = generate(args.customers, seed=args.seed)
+    jobs = build_jobs(deliveries)
+    events = len({job[0] for job in jobs})
+    print(f"{len(jobs)} deliveries, {events} distinct events, {args.customers} customers, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'seconds':>8} {'events/s':>9} {'speedup':>8} {'left':>6} {'subs':>6}")
+    baseline = None
+    for count in (int(n) for n in args.workers.split(",")):
+        asyncio.run(prepare(jobs))
+        elapsed, codes = asyncio.run(run_workers(count, args))
+        left, subscriptions = asyncio.run(leftovers())
+        rate = events / elapsed
+        baseline = baseline or rate
+        failed = f" (exit codes {codes})" if any(codes) else ""
+        print(f"{count:7} {elapsed:8.2f} {rate:9.0f} {rate / baseline:7.2f}x {sum(left.values()):6} "
+              f"{subscriptions:6}{failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark: Stripe-Signature verification with the pre-keyed verifier
+against the stripe SDK (stripe.Webhook.construct_event).
+
+    python -m benchmarks.bench_signature [payload_kb]
+"""
+import sys
+import json
+import hmac
+import time
+import timeit
+import hashlib
+
+import stripe
+
+from api.webhook.signature import SignatureVerifier, SignatureVerificationError
+
+SECRET = "whsec_benchmark"
+ROUNDS = 2000
+
+
+def make_payload(size_kb):
+    lines = [{"id": f"il_{n}", "amount": 1000, "period": {"start": 0, "end": 1}} for n in range(size_kb * 10)]
+    event = {
+        "id": "evt_bench",
+        "object": "event",
+        "type": "invoice.paid",
+        "created": int(time.time()),
+        "data": {"object": {"id": "in_bench", "object": "invoice", "customer": "cus_bench", "lines": {"data": lines}}},
+    }
+    return json.dumps(event).encode()
+
+
+def sign(payload, secret, timestamp):
+    sig = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={sig}"
+
+
+def main():
+    size_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    payload = make_payload(size_kb)
+    now = int(time.time())
+    header = sign(payload, SECRET, now)
+    forged = sign(payload, "whsec_forged", now)
+    verifier = SignatureVerifier(["whsec_old", SECRET])
+
+    def sdk_valid():
+        stripe.Webhook.construct_event(payload, header, SECRET)
+
+    def fast_valid():
+        verifier.verify(payload, header)
+        stripe.Event.construct_from(json.loads(payload), None)
+
+    def sdk_forged():
+        try:
+            stripe.Webhook.construct_event(payload, forged, SECRET)
+        except stripe.error.SignatureVerificationError:
+            pass
+
+    def fast_forged():
+        try:
+            verifier.verify(payload, forged)
+        except SignatureVerificationError:
+            pass
+
+    print(f"payload: {len(payload)} bytes, {ROUNDS} rounds")
+    for name, fn in (("sdk valid", sdk_valid), ("verifier valid", fast_valid),
+                     ("sdk forged", sdk_forged), ("verifier forged", fast_forged)):
+        elapsed = min(timeit.repeat(fn, number=ROUNDS, repeat=3))
+        print(f"{name:>16}: {elapsed / ROUNDS * 1e6:8.1f} us/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark: import time of main and time from process spawn to the
+first 200 on /health, each measured in fresh interpreters.
+
+    python -m benchmarks.bench_startup [runs]
+
+The server runs with the environment of the caller, so point DB_* at a
+reachable database and set DB_SCHEMA_MODE to the mode being measured. Prints
+one JSON line per run set so results can be compared across releases.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+ROUNDS = 5
+STARTUP_TIMEOUT = 30
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time():
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def time_to_first_200():
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while time.perf_counter() - started < STARTUP_TIMEOUT:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with {server.returncode}: {server.stderr.read().decode()[-2000:]}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError(f"No 200 from /health within {STARTUP_TIMEOUT}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summary(samples):
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    imports = [import_time() for _ in range(rounds)]
+    first_200 = [time_to_first_200() for _ in range(rounds)]
+    print(json.dumps({
+        "python": sys.version.split()[0],
+        "schema_mode": os.getenv("DB_SCHEMA_MODE", "check"),
+        "rounds": rounds,
+        "import_main": summary(imports),
+        "first_200_health": summary(first_200),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+End-to-end webhook throughput benchmark.
+
+Replays a synthetic event stream (benchmarks.event_stream) with valid
+signatures against the ASGI app in-process, mixed with /subscription/check
+reads, and reports events per second, p50/p99 latency and DB round-trips per
+event type.
+
+The app talks to the database configured in tortoise_config, so point DB_* at
+a local Postgres (e.g. `docker run -p 5432:5432 postgres`) and only use a
+throwaway database: --reset truncates every table first. Migrate it with
+`aerich upgrade`, or set DB_SCHEMA_MODE=generate for a fresh one.
+WEBHOOK_FAST_ACK, BULK_WRITES and the pool settings are read from the
+environment as usual.
+
+    python -m benchmarks.bench_throughput [--customers 500] [--concurrency 32] [--read-ratio 0.2] [--reset]
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+from tortoise import Tortoise, connections
+
+import main
+from api.webhook.dispatcher import EVENT_METRICS
+from api.webhook.signature import STRIPE_WEBHOOK_SECRETS
+from db.bulk import BULK_WRITES, writer
+from utils.query_counter import count_queries
+from benchmarks.event_stream import generate, sign
+
+CHECK_ROUTE = "check"
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def reset_tables():
+    conn = connections.get("default")
+    tables = ", ".join(f'"{model._meta.db_table}"' for model in Tortoise.apps["models"].values()
+                       if model._meta.db_table != "aerich")
+    await conn.execute_script(f"TRUNCATE {tables} CASCADE")
+
+
+def build_requests(deliveries, identities, read_ratio, seed):
+    """Interleave webhook deliveries with check reads, read_ratio of all requests being reads."""
+    rng = random.Random(seed)
+    requests = []
+    for delivery in deliveries:
+        requests.append(delivery)
+        while rng.random() < read_ratio:
+            identity = rng.choice(identities)
+            requests.append({"email": identity.email, "username": identity.username, "user_id": identity.user_id})
+    return requests
+
+
+async def drive(client, requests, concurrency, secret):
+    latencies = defaultdict(list)
+    statuses = defaultdict(int)
+    rejected = defaultdict(int)
+    check_queries = []
+    position = 0
+
+    async def sender():
+        nonlocal position
+        while position < len(requests):
+            request = requests[position]
+            position += 1
+            start = time.perf_counter()
+            if isinstance(request, dict):
+                with count_queries() as queries:
+                    response = await client.post("/api/subscription/check", json=request)
+                check_queries.append(queries.count)
+                key = CHECK_ROUTE
+            else:
+                response = await client.post("/api/stripe_webhook", content=request.body,
+                                             headers={"Stripe-Signature": sign(request.body, secret)})
+                key = request.event_type
+                if response.status_code >= 500:
+                    rejected[key] += 1
+            latencies[key].append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return latencies, statuses, rejected, check_queries
+
+
+def report(elapsed, latencies, statuses, rejected, check_queries, queries_before):
+    events = sum(len(v) for k, v in latencies.items() if k != CHECK_ROUTE)
+    accepted = events - sum(rejected.values())
+    reads = len(latencies.get(CHECK_ROUTE, ()))
+    print(f"{events} webhook deliveries ({accepted} accepted) and {reads} checks in {elapsed:.2f}s: "
+          f"{accepted / elapsed:.1f} events/s, {(events + reads) / elapsed:.1f} requests/s")
+    print(f"status codes: {dict(sorted(statuses.items()))}")
+    print(f"{'route / event type':34} {'count':>6} {'5xx':>5} {'p50 ms':>8} {'p99 ms':>8} {'queries/event':>14}")
+    for key in sorted(latencies):
+        samples = latencies[key]
+        if key == CHECK_ROUTE:
+            queries = sum(check_queries) / len(check_queries) if check_queries else 0.0
+        else:
+            child = EVENT_METRICS[key].db_queries
+            before_sum, before_count = queries_before.get(key, (0, 0))
+            processed = child.count - before_count
+            queries = (child.sum - before_sum) / processed if processed else 0.0
+        print(f"{key:34} {len(samples):6} {rejected.get(key, 0):5} {percentile(samples, 0.5) * 1000:8.2f} "
+              f"{percentile(samples, 0.99) * 1000:8.2f} {queries:14.2f}")
+
+
+async def run(args):
+    deliveries, identities = generate(args.customers, args.duplicates, args.reorder, args.invoice_lines, args.seed)
+    requests = build_requests(deliveries, identities, args.read_ratio, args.seed)
+    secret = STRIPE_WEBHOOK_SECRETS[0]
+
+    async with main.lifespan(main.app):
+        if args.reset:
+            await reset_tables()
+        queries_before = {k: (m.db_queries.sum, m.db_queries.count) for k, m in EVENT_METRICS.items()}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            latencies, statuses, rejected, check_queries = await drive(client, requests, args.concurrency, secret)
+            await main.worker_pool.stop()
+            elapsed = time.perf_counter() - start
+    report(elapsed, latencies, statuses, rejected, check_queries, queries_before)
+    if BULK_WRITES:
+        stats = writer.stats()
+        print(f"bulk writer: {stats['batches']} batches, {stats['rows_per_batch']} rows per batch")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--read-ratio", type=float, default=0.2, help="share of requests that are /check reads")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of events delivered twice")
+    parser.add_argument("--reorder", type=float, default=0.05, help="share of events swapped with the next one")
+    parser.add_argument("--invoice-lines", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="truncate all tables first (throwaway databases only)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,104 @@
+"""
+Synthetic Stripe event streams for the load benchmarks.
+
+Every simulated customer goes through the lifecycle the service handles:
+customer.created, payment_intent.created / succeeded, charge.succeeded,
+checkout.session.completed, customer.subscription.created, invoice.paid and
+customer.subscription.updated. Streams of different customers are interleaved,
+and a share of the events is delivered twice or swapped with its neighbour,
+like Stripe retries and out-of-order deliveries do.
+"""
+import json
+import hmac
+import time
+import random
+import hashlib
+from collections import namedtuple
+
+Delivery = namedtuple("Delivery", ["event_id", "event_type", "body"])
+Identity = namedtuple("Identity", ["email", "username", "user_id"])
+
+MONTH = 30 * 86400
+
+
+def sign(body, secret, timestamp=None):
+    """Stripe-Signature header for body (bytes)."""
+    timestamp = timestamp or int(time.time())
+    sig = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={sig}"
+
+
+def _event(event_id, event_type, created, obj):
+    return {"id": event_id, "object": "event", "type": event_type, "created": created,
+            "api_version": "2024-06-20", "livemode": False, "data": {"object": obj}}
+
+
+def customer_lifecycle(n, start, invoice_lines=1):
+    """Events of customer n in the order Stripe emits them."""
+    cus, pi, ch, sub = f"cus_load{n}", f"pi_load{n}", f"ch_load{n}", f"sub_load{n}"
+    email, username = f"load{n}@example.com", f"load_user{n}"
+    period_end = start + MONTH
+    intent = {"id": pi, "object": "payment_intent", "amount": 1000, "currency": "eur", "created": start,
+              "customer": cus, "receipt_email": email, "statement_descriptor": None, "description": "Subscription"}
+    subscription = {"id": sub, "object": "subscription", "customer": cus, "status": "active",
+                    "current_period_start": start, "current_period_end": period_end, "cancel_at_period_end": False,
+                    "items": {"object": "list", "url": f"/v1/subscription_items?subscription={sub}",
+                              "data": [{"id": f"si_load{n}", "price": {"id": "price_load", "unit_amount": 1000}}]}}
+    lines = [{"id": f"il_load{n}_{k}", "amount": 1000, "period": {"start": start, "end": period_end}}
+             for k in range(invoice_lines)]
+    objects = [
+        ("customer.created", {"id": cus, "object": "customer", "email": email, "name": f"Load {n}",
+                              "phone": None, "description": None, "created": start}),
+        ("payment_intent.created", {**intent, "status": "requires_payment_method"}),
+        ("payment_intent.succeeded", {**intent, "status": "succeeded"}),
+        ("charge.succeeded", {"id": ch, "object": "charge", "payment_intent": pi, "amount": 1000, "currency": "eur",
+                              "created": start, "status": "succeeded", "receipt_url": f"https://pay.example.com/r/{ch}",
+                              "billing_details": {"email": email}}),
+        ("checkout.session.completed", {"id": f"cs_load{n}", "object": "checkout.session", "customer": cus,
+                                        "custom_fields": [{"key": "telegramusername",
+                                                           "text": {"value": f"@{username}"}}]}),
+        ("customer.subscription.created", subscription),
+        ("invoice.paid", {"id": f"in_load{n}", "object": "invoice", "customer": cus, "subscription": sub,
+                          "lines": {"object": "list", "data": lines}}),
+        ("customer.subscription.updated", {**subscription, "cancel_at_period_end": True}),
+    ]
+    return [_event(f"evt_load{n}_{k}", event_type, start + k, obj) for k, (event_type, obj) in enumerate(objects)]
+
+
+def generate(customers, duplicate_rate=0.05, reorder_rate=0.05, invoice_lines=1, seed=0):
+    """
+    Deliveries for customers simulated customers plus the identities to query
+    /subscription/check with. The per-customer order is kept except for the
+    injected swaps; customers are interleaved randomly.
+    """
+    rng = random.Random(seed)
+    # Keep every event in the past, like a real export.
+    start = int(time.time()) - 3600 - customers - 10
+    streams = []
+    identities = []
+    for n in range(customers):
+        events = customer_lifecycle(n, start + n, invoice_lines)
+        for k in range(len(events) - 1):
+            if rng.random() < reorder_rate:
+                events[k], events[k + 1] = events[k + 1], events[k]
+        deliveries = []
+        for event in events:
+            delivery = Delivery(event["id"], event["type"], json.dumps(event).encode())
+            deliveries.append(delivery)
+            if rng.random() < duplicate_rate:
+                deliveries.append(delivery)
+        streams.append(deliveries)
+        identities.append(Identity(f"load{n}@example.com", f"load_user{n}", 700000 + n))
+
+    stream = []
+    positions = [0] * len(streams)
+    pending = list(range(len(streams)))
+    while pending:
+        k = rng.randrange(len(pending))
+        n = pending[k]
+        stream.append(streams[n][positions[n]])
+        positions[n] += 1
+        if positions[n] == len(streams[n]):
+            pending[k] = pending[-1]
+            pending.pop()
+    return stream, identities
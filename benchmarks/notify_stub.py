@@ -0,0 +1,104 @@
+"""
+Local stand-in for the bot's notification callback (see db/notifier.py).
+
+    python -m benchmarks.notify_stub [--port 8099] [--fail-rate 0.2] [--status 503] [--latency-ms 20] [--secret S]
+
+Point the service at it with NOTIFY_URL=http://127.0.0.1:8099/notify. The
+stub answers --status for a --fail-rate share of the batches (with
+Retry-After: 1 on 429/503), verifies X-Notify-Signature when --secret is
+given, and keeps the latest state per user. GET /stats returns the counts,
+GET /users/{user_id} the last change received for a user.
+"""
+import hmac
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class Recorder:
+    def __init__(self, fail_rate, status, latency, secret, seed):
+        self.fail_rate = fail_rate
+        self.status = status
+        self.latency = latency
+        self.secret = secret
+        self.rng = random.Random(seed)
+        self.batches = 0
+        self.failed = 0
+        self.bad_signatures = 0
+        self.changes = 0
+        self.users = {}
+        self.batch_sizes = []
+
+    def verify(self, body, header):
+        parts = dict(p.split("=", 1) for p in (header or "").split(",") if "=" in p)
+        expected = hmac.new(self.secret.encode(), f"{parts.get('t')}.".encode() + body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, parts.get("v1", ""))
+
+    async def notify(self, request: Request):
+        body = await request.body()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.secret and not self.verify(body, request.headers.get("X-Notify-Signature")):
+            self.bad_signatures += 1
+            return JSONResponse({"error": "bad signature"}, status_code=401)
+        if self.rng.random() < self.fail_rate:
+            self.failed += 1
+            headers = {"Retry-After": "1"} if self.status in (429, 503) else {}
+            return JSONResponse({"error": "injected failure"}, status_code=self.status, headers=headers)
+
+        payload = await request.json()
+        self.batches += 1
+        self.batch_sizes.append(len(payload["changes"]))
+        for change in payload["changes"]:
+            self.changes += 1
+            self.users[change["user_id"]] = {**change, "received_at": time.time()}
+        return JSONResponse({"received": len(payload["changes"])})
+
+    async def stats(self, request: Request):
+        sizes = self.batch_sizes
+        return JSONResponse({
+            "batches": self.batches,
+            "failed": self.failed,
+            "bad_signatures": self.bad_signatures,
+            "changes": self.changes,
+            "users": len(self.users),
+            "entitled": sum(1 for c in self.users.values() if c["entitled"]),
+            "avg_batch": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "max_batch": max(sizes, default=0),
+        })
+
+    async def user(self, request: Request):
+        change = self.users.get(int(request.path_params["user_id"]))
+        return JSONResponse(change or {"error": "not notified"}, status_code=200 if change else 404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of batches answered with --status")
+    parser.add_argument("--status", type=int, default=503)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--secret", help="verify X-Notify-Signature with this NOTIFY_SECRET")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    recorder = Recorder(args.fail_rate, args.status, args.latency_ms / 1000, args.secret, args.seed)
+    app = Starlette(routes=[
+        Route("/notify", recorder.notify, methods=["POST"]),
+        Route("/stats", recorder.stats),
+        Route("/users/{user_id}", recorder.user),
+    ])
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
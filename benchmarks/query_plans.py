@@ -0,0 +1,108 @@
+"""
+Query-plan regression check for the hot lookups.
+
+Runs EXPLAIN on every hot query against the database configured in
+tortoise_config (run `aerich upgrade` first) and exits non-zero when any of
+them plans a sequential scan on one of the looked-up tables.
+
+    python -m benchmarks.query_plans [--seed N]
+
+--seed inserts N synthetic customers, subscriptions and Telegram users first,
+so the planner sees realistic table sizes. Only use it on a throwaway database.
+tests/test_query_plans.py runs the same check on the test database.
+"""
+import sys
+import json
+import asyncio
+import argparse
+from datetime import datetime, timedelta, UTC
+
+from tortoise import Tortoise, connections
+
+from tortoise_config import TORTOISE_ORM
+from db.models import TelegramUser, Subscription
+from db.TelegramUser import RESOLVE_SUBSCRIPTIONS_SQL
+
+WATCHED_TABLES = {"telegram_user", "customer", "subscription", "processed_event"}
+
+SEED_SQL = """
+INSERT INTO "telegram_user" ("user_id", "username", "email", "subscription_status", "date_end",
+                             "cancel_at_period_end", "is_admin", "created_at")
+SELECT 100000 + g, 'User' || g, 'User' || g || '@example.com', g % 3 = 0,
+       now() + (g % 60) * interval '1 day', false, g % 100 = 0, now()
+FROM generate_series(1, $1::int) AS g
+ON CONFLICT DO NOTHING;
+INSERT INTO "customer" ("id", "created_at", "updated", "email", "username", "user_id_id")
+SELECT 'cus_seed_' || g, now(), now(), 'User' || g || '@example.com', 'User' || g, NULL
+FROM generate_series(1, $1::int) AS g
+ON CONFLICT DO NOTHING;
+INSERT INTO "subscription" ("id", "created_at", "updated", "status", "started", "ending", "url", "customer_id")
+SELECT 'sub_seed_' || g, now(), now() - (g % 90) * interval '1 day',
+       CASE WHEN g % 4 = 0 THEN 'active' ELSE 'canceled' END,
+       now(), now() + interval '30 days', '/v1/subscription_items', 'cus_seed_' || (g % $1::int + 1)
+FROM generate_series(1, $1::int * 2) AS g
+ON CONFLICT DO NOTHING;
+INSERT INTO "processed_event" ("id", "type", "created_at")
+SELECT 'evt_seed_' || g, 'invoice.paid', now()
+FROM generate_series(1, $1::int) AS g
+ON CONFLICT DO NOTHING;
+ANALYZE "telegram_user";
+ANALYZE "customer";
+ANALYZE "subscription";
+ANALYZE "processed_event";
+"""
+
+
+def hot_queries():
+    now = datetime.now(UTC)
+    identities = [[0, 1, 2], [100007, None, None], [None, "user8", None], [None, None, "user9@example.com"],
+                  [None, "User8", None], [None, None, "User9@example.com"]]
+    expiring = TelegramUser.filter(
+        date_end__gte=now, date_end__lte=now + timedelta(days=5), subscription_status=True, is_admin=False
+    ).order_by("date_end", "id").limit(1000).values("id", "user_id", "date_end", "full_name", "username")
+    return {
+        "check_subscription (resolve_subscriptions)": (RESOLVE_SUBSCRIPTIONS_SQL, identities),
+        "get_subscriptions": (Subscription.filter(customer_id="cus_seed_1").order_by("-updated").sql(params_inline=True), []),
+        "get_expiring_subscriptions": (expiring.sql(params_inline=True), []),
+        "claim_event duplicate probe": ('SELECT 1 FROM "processed_event" WHERE "id" = $1', ["evt_seed"]),
+    }
+
+
+def seq_scans(plan):
+    """Watched relations scanned sequentially anywhere in an EXPLAIN (FORMAT JSON) plan tree."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in WATCHED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found += seq_scans(child)
+    return found
+
+
+async def main(seed):
+    await Tortoise.init(config=TORTOISE_ORM)
+    conn = connections.get("default")
+    try:
+        if seed:
+            for statement in SEED_SQL.split(";"):
+                if statement.strip():
+                    await conn.execute_query(statement, [seed] if "$1" in statement else None)
+
+        failed = False
+        for name, (sql, params) in hot_queries().items():
+            rows = await conn.execute_query_dict(f"EXPLAIN (FORMAT JSON) {sql}", params or None)
+            plan = rows[0]["QUERY PLAN"]
+            plan = plan if isinstance(plan, list) else json.loads(plan)
+            scans = seq_scans(plan[0]["Plan"])
+            status = f"SEQ SCAN on {', '.join(sorted(set(scans)))}" if scans else "ok"
+            failed = failed or bool(scans)
+            print(f"{name:>45}: {status}")
+        return 1 if failed else 0
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="synthetic rows to insert before checking")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.seed)))
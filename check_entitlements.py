@@ -0,0 +1,47 @@
+"""
+Consistency check of the entitlement table against telegram_user, customer
+and subscription.
+
+    python check_entitlements.py [--repair] [--chunk 5000]
+
+Walks the Telegram users in id chunks and reports entitlement rows that are
+missing, stale or orphaned. --repair recomputes them. Exits with 1 when mismatches were found and
+left unrepaired, so it can run from cron.
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from tortoise import Tortoise
+
+from tortoise_config import TORTOISE_ORM
+from db.Entitlement import check_entitlements
+
+
+async def run(args):
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        result = await check_entitlements(repair=args.repair, chunk=args.chunk)
+    finally:
+        await Tortoise.close_connections()
+    print(f"[ENTITLEMENT] Checked telegram users up to id {result['last_id']}: {result['missing']} missing, "
+          f"{result['stale']} stale, {result['orphaned']} orphaned, {result['repaired']} repaired")
+    mismatches = result["missing"] + result["stale"] + result["orphaned"]
+    return 1 if mismatches > result["repaired"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repair", action="store_true", help="recompute missing, stale and orphaned rows")
+    parser.add_argument("--chunk", type=int, default=5000, help="telegram users per query (default 5000)")
+    args = parser.parse_args()
+    if args.chunk < 1:
+        parser.error("--chunk must be positive")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,22 @@
 from datetime import datetime
 from tortoise.transactions import in_transaction
 from utils.logger import logger
+from utils.metrics import CREATED, UPDATED, SKIPPED, ERROR
 from db.models import Charge
 from db.PaymentIntent import fulfill_payment_intent, save_empty_payment_intent_from_charge
+from db.Revenue import rollup_row, apply_rollup
 
 
 async def save_charge(event):
     charge = event.get("data").get("object")
     charge_id = charge.get("id")
     created_event = event.get("created")
-    logger.info(f"[INFO] Starting saving charge {charge_id}")
+    logger.info("[INFO] Starting saving charge %s", charge_id)
 
     try:
-        async with in_transaction():
+        async with in_transaction() as conn:
             await save_empty_payment_intent_from_charge(charge)
-            existing = await Charge.get_or_none(id=charge_id)
+            existing = await Charge.select_for_update().get_or_none(id=charge_id)
 
             if not existing:
                 await Charge.create(
@@ -25,20 +27,27 @@ async def save_charge(event):
                     status=charge.get("status"),
                     receipt_url=charge.get("receipt_url"),
                     email=charge.get("billing_details").get("email"),
-                    created_at=datetime.now()
+                    created_at=datetime.fromtimestamp(charge["created"]) if charge.get("created") else datetime.now()
                 )
-                logger.info(f"[NEW] Created Charge {charge_id}")
-                return
+                await apply_rollup(conn, "charge", [charge_id], [])
+                logger.info("[NEW] Created Charge %s", charge_id)
+                return CREATED
 
             if created_event and created_event > datetime.timestamp(existing.updated):
+                before = rollup_row(existing)
                 await existing.update_from_dict({
                     "status": charge.get("status"),
                     "updated": datetime.now()
                 }).save()
-                logger.info(f"[UPDATE] Updated Charge {charge_id} (newer timestamp)")
+                await apply_rollup(conn, "charge", [charge_id], [before])
+                logger.info("[UPDATE] Updated Charge %s (newer timestamp)", charge_id)
+                outcome = UPDATED
             else:
-                logger.info(f"[SKIP] Ignored outdated event for {charge_id}")
+                logger.info("[SKIP] Ignored outdated event for %s", charge_id)
+                outcome = SKIPPED
 
             await fulfill_payment_intent(charge.get("payment_intent"))
+            return outcome
     except Exception as e:
-        logger.error(f"[ERROR] {e}")
\ No newline at end of file
+        logger.error("[ERROR] %s", e)
+        return ERROR
\ No newline at end of file
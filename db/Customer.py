@@ -1,17 +1,18 @@
 from datetime import datetime, timezone, UTC
 from utils.logger import logger
 from db.models import Customer
-from tortoise.expressions import Q
 from tortoise.exceptions import IntegrityError
 
 from utils.make_aware import make_aware
+from utils.subscription_cache import subscription_cache
+from utils.metrics import CREATED, UPDATED, SKIPPED, ERROR
 
 
 async def save_customer(event):
     customer = event.get("data").get("object")
     customer_id = customer.get("id")
     created_event = datetime.fromtimestamp(event.get("created"), tz=UTC)
-    logger.info(f"[INFO] Starting saving charge {customer_id}")
+    logger.info("[INFO] Starting saving charge %s", customer_id)
 
     try:
         await Customer.create(
@@ -23,7 +24,9 @@ async def save_customer(event):
             created_at=datetime.fromtimestamp(customer.get("created"), tz=UTC),
             updated=created_event,
         )
-        logger.info(f"[NEW] Created Customer {customer_id}")
+        logger.info("[NEW] Created Customer %s", customer_id)
+        subscription_cache.invalidate(customer_id=customer_id, email=customer.get("email"))
+        return CREATED
 
     except IntegrityError:
         existing = await Customer.get(id=customer_id)
@@ -37,12 +40,15 @@ async def save_customer(event):
                 "description": customer.get("description"),
                 "updated": created_event,
             }).save()
-            logger.info(f"[UPDATE] Updated Charge {customer_id} (newer timestamp)")
-            return
+            logger.info("[UPDATE] Updated Charge %s (newer timestamp)", customer_id)
+            subscription_cache.invalidate(customer_id=customer_id, email=customer.get("email"))
+            return UPDATED
         else:
-            logger.info(f"[SKIP] Ignored outdated event for {customer_id}")
+            logger.info("[SKIP] Ignored outdated event for %s", customer_id)
+            return SKIPPED
     except Exception as e:
-        logger.error(f"[ERROR] [CUSTOMER_SAVE] {e}")
+        logger.error("[ERROR] [CUSTOMER_SAVE] %s", e)
+        return ERROR
 
 
 async def update_customer_username_from_checkout_session(event):
@@ -50,7 +56,7 @@ async def update_customer_username_from_checkout_session(event):
     customer_id = body.get("customer")
     custom_fields = body.get("custom_fields")
     telegram_tag = None
-    logger.info(f"[UPDATE USERNAME] Starting saving telegram username for customer_id={customer_id}")
+    logger.info("[UPDATE USERNAME] Starting saving telegram username for customer_id=%s", customer_id)
 
     for field in custom_fields:
         key = field.get("key")
@@ -81,11 +87,11 @@ async def update_customer_username_from_checkout_session(event):
                 normalized = normalized.strip("/")
 
                 telegram_tag = normalized or None
-        logger.info(f"[UPDATE USERNAME] Normalized username is {telegram_tag}")
+        logger.info("[UPDATE USERNAME] Normalized username is %s", telegram_tag)
 
     if not telegram_tag:
-        logger.error(f"[UPDATE USERNAME] Telegram tag not found in request body, skipping update for {customer_id}")
-        return
+        logger.error("[UPDATE USERNAME] Telegram tag not found in request body, skipping update for %s", customer_id)
+        return SKIPPED
 
     try:
         await Customer.update_or_create(
@@ -95,31 +101,10 @@ async def update_customer_username_from_checkout_session(event):
             },
             id=customer_id,
         )
-        logger.info(f"[UPDATE USERNAME] Successfully updated {customer_id} with {telegram_tag}")
+        logger.info("[UPDATE USERNAME] Successfully updated %s with %s", customer_id, telegram_tag)
+        subscription_cache.invalidate(customer_id=customer_id, username=telegram_tag)
+        return UPDATED
 
     except Exception as e:
-        logger.error(f"[ERROR] [UPDATE USERNAME] {e}")
-
-
-async def get_customers(*, email=None, name=None, phone=None, username=None):
-    fields = {k: v for k, v in locals().items() if v is not None}
-    queries = [Q(**{k: v}) for k, v in fields.items()]
-    if not queries:
-        logger.error("[GET CUSTOMER] No filters was given")
-        return None
-
-    query = queries.pop()
-    for q in queries:
-        query |= q
-
-    customers = await Customer.filter(query)
-    customers_info = [
-        {'id': c.id, 'email': c.email, 'username': c.username, 'phone': c.phone}
-        for c in customers
-    ]
-
-    if customers:
-        logger.info(f"[GET CUSTOMER] Found customers {customers_info} by {fields}")
-    else:
-        logger.info(f"[GET CUSTOMER] No customer found by {fields}")
-    return customers
+        logger.error("[ERROR] [UPDATE USERNAME] %s", e)
+        return ERROR
@@ -0,0 +1,156 @@
+"""
+Precomputed answer to "is this Telegram user entitled, and until when?".
+
+One entitlement row per TelegramUser, keyed by the Telegram user_id. It holds
+the newest active subscription among the customers linked to the user, the
+same one resolve_subscriptions() picks. The row is refreshed in the
+transaction that changes a subscription or a customer link, so reading it is
+a single primary key lookup. check_entitlements() compares the table with
+the source tables and can repair it.
+
+/ban stamps TelegramUser.banned_at: subscriptions last written before the
+ban no longer entitle the user, a later subscription change does again.
+"""
+from datetime import datetime, UTC
+from tortoise import connections
+
+from utils.logger import logger
+from db.models import Entitlement
+
+ENTITLEMENT_COLUMNS = (
+    "user_id", "telegram_user_id", "active", "ends_at", "subscription_id", "customer_id", "cancel_at_period_end",
+)
+# Expected entitlements of the Telegram users in users (a relation with "id"
+# and "user_id"), with customer ownership taken from customers (a relation
+# with "id" and "user_id_id").
+ENTITLEMENT_SELECT_SQL = """
+SELECT t."user_id", t."id" AS "telegram_user_id", s."id" IS NOT NULL AS "active", s."ending" AS "ends_at",
+       s."id" AS "subscription_id", s."customer_id", COALESCE(s."cancel_at_period_end", false) AS "cancel_at_period_end"
+FROM {users} AS t
+LEFT JOIN "telegram_user" AS ban ON ban."id" = t."id"
+LEFT JOIN LATERAL (
+    SELECT sub."id", sub."ending", sub."customer_id", sub."cancel_at_period_end"
+    FROM {customers} AS c
+    JOIN "subscription" AS sub ON sub."customer_id" = c."id" AND sub."status" = 'active'
+    WHERE c."user_id_id" = t."id" AND (ban."banned_at" IS NULL OR sub."updated" > ban."banned_at")
+    ORDER BY sub."updated" DESC, sub."id"
+    LIMIT 1
+) AS s ON true
+"""
+
+
+def entitlement_upsert_sql(users, customers='"customer"'):
+    """INSERT … ON CONFLICT DO UPDATE of the entitlements of users, only touching rows that change."""
+    columns = ", ".join(f'"{c}"' for c in ENTITLEMENT_COLUMNS)
+    changed = ", ".join(f'"entitlement"."{c}"' for c in ENTITLEMENT_COLUMNS[1:])
+    incoming = ", ".join(f'excluded."{c}"' for c in ENTITLEMENT_COLUMNS[1:])
+    sets = ", ".join(f'"{c}" = excluded."{c}"' for c in ENTITLEMENT_COLUMNS[1:])
+    return f"""
+INSERT INTO "entitlement" ({columns}, "updated")
+SELECT e.*, now() FROM ({ENTITLEMENT_SELECT_SQL.format(users=users, customers=customers)}) AS e
+ON CONFLICT ("user_id") DO UPDATE SET {sets}, "updated" = now()
+WHERE ({changed}) IS DISTINCT FROM ({incoming})
+RETURNING "user_id"
+"""
+
+
+# Computed from the source tables, for users whose row is missing.
+COMPUTE_ENTITLEMENT_SQL = ENTITLEMENT_SELECT_SQL.format(
+    users='(SELECT "id", "user_id" FROM "telegram_user" WHERE "user_id" = $1)', customers='"customer"')
+
+REFRESH_ENTITLEMENTS_SQL = entitlement_upsert_sql("""(
+    SELECT "id", "user_id" FROM "telegram_user"
+    WHERE "id" = ANY($2::int[]) OR "id" IN (SELECT "user_id_id" FROM "customer" WHERE "id" = ANY($1::varchar[]))
+)""")
+
+ENTITLEMENT_DIFF_SQL = f"""
+WITH expected AS (
+    {ENTITLEMENT_SELECT_SQL.format(
+        users='(SELECT "id", "user_id" FROM "telegram_user" WHERE "id" > $1 AND "id" <= $2)',
+        customers='"customer"')}
+), stored AS (
+    SELECT {", ".join(f'"{c}"' for c in ENTITLEMENT_COLUMNS)} FROM "entitlement"
+    WHERE "telegram_user_id" > $1 AND "telegram_user_id" <= $2
+)
+SELECT e."telegram_user_id" AS "expected_id", x."telegram_user_id" AS "stored_id", x."user_id" AS "stored_user_id"
+FROM expected AS e
+FULL JOIN stored AS x ON x."user_id" = e."user_id"
+WHERE e."user_id" IS NULL OR x."user_id" IS NULL
+   OR ({", ".join(f'e."{c}"' for c in ENTITLEMENT_COLUMNS)}) IS DISTINCT FROM ({", ".join(f'x."{c}"' for c in ENTITLEMENT_COLUMNS)})
+"""
+
+
+async def refresh_entitlements(customer_ids=(), telegram_user_ids=(), conn=None):
+    """
+    Recompute the entitlements of the given Telegram users and of the users
+    the given customers are linked to. Call it inside the transaction that
+    changed them; by default it runs on the current transaction. Returns the
+    Telegram user ids whose entitlement changed.
+    """
+    customer_ids = [c for c in set(customer_ids) if c]
+    telegram_user_ids = [t for t in set(telegram_user_ids) if t]
+    if not customer_ids and not telegram_user_ids:
+        return []
+    conn = conn or connections.get("default")
+    _, rows = await conn.execute_query(REFRESH_ENTITLEMENTS_SQL, [customer_ids, telegram_user_ids])
+    return [row["user_id"] for row in rows]
+
+
+def is_entitled(entitlement, now=None):
+    if not entitlement or not entitlement["active"]:
+        return False
+    now = now or datetime.now(UTC)
+    return entitlement["ends_at"] is None or entitlement["ends_at"] > now
+
+
+async def get_entitlement(user_id):
+    """
+    The entitlement row of a Telegram user_id as a dict, or None for an
+    unknown user. A user without a row (created by a path that does not
+    refresh it) is answered from the source tables.
+    """
+    rows = await Entitlement.filter(user_id=user_id).limit(1).values(*ENTITLEMENT_COLUMNS)
+    if rows:
+        return rows[0]
+    rows = await connections.get("default").execute_query_dict(COMPUTE_ENTITLEMENT_SQL, [user_id])
+    if rows:
+        logger.warning("[ENTITLEMENT] No entitlement row for %s, computed it from the source tables", user_id)
+    return rows[0] if rows else None
+
+
+async def check_entitlements(repair=False, chunk=5000):
+    """
+    Compare the entitlement table with telegram_user, customer and subscription
+    in chunks of chunk Telegram users. Returns counts of missing, stale and
+    orphaned rows; with repair=True they are fixed as they are found.
+    """
+    conn = connections.get("default")
+    rows = await conn.execute_query_dict(
+        'SELECT GREATEST((SELECT max("id") FROM "telegram_user"), '
+        '(SELECT max("telegram_user_id") FROM "entitlement")) AS "last"')
+    last = rows[0]["last"] or 0
+    result = {"last_id": 0, "missing": 0, "stale": 0, "orphaned": 0, "repaired": 0}
+
+    for start in range(0, last, chunk):
+        diff = await conn.execute_query_dict(ENTITLEMENT_DIFF_SQL, [start, start + chunk])
+        result["last_id"] = min(start + chunk, last)
+        refresh = set()
+        orphans = []
+        for row in diff:
+            if row["stored_id"] is None:
+                result["missing"] += 1
+                refresh.add(row["expected_id"])
+            elif row["expected_id"] is None:
+                result["orphaned"] += 1
+                orphans.append(row["stored_user_id"])
+            else:
+                result["stale"] += 1
+                refresh.add(row["expected_id"])
+        if diff:
+            logger.warning("[ENTITLEMENT] %s mismatches for telegram users %s-%s", len(diff), start + 1, start + chunk)
+        if repair and diff:
+            if orphans:
+                await Entitlement.filter(user_id__in=orphans).delete()
+            await refresh_entitlements(telegram_user_ids=refresh, conn=conn)
+            result["repaired"] += len(diff)
+    return result
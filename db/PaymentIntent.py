@@ -1,16 +1,19 @@
 from datetime import datetime, timedelta
 from asyncpg import UniqueViolationError
+from tortoise import connections
 from tortoise.transactions import in_transaction
 from utils.logger import logger
+from utils.metrics import CREATED, UPDATED, SKIPPED
 from db.models import PaymentIntent
+from db.Revenue import rollup_row, apply_rollup, fulfill_payment
 
 async def save_payment_intent(event):
     intent = event["data"]["object"]
     intent_id = intent.get("id")
     created_event = event.get("created")
 
-    async with in_transaction():
-        existing = await PaymentIntent.get_or_none(id=intent_id)
+    async with in_transaction() as conn:
+        existing = await PaymentIntent.select_for_update().get_or_none(id=intent_id)
 
         if not existing:
             try:
@@ -25,14 +28,19 @@ async def save_payment_intent(event):
                     statement=intent.get("statement_descriptor"),
                     description=intent.get("description"),
                 )
-                logger.info(f"[NEW] Created PaymentIntent {intent_id}")
-                return
+                await apply_rollup(conn, "payment", [intent_id], [])
+                logger.info("[NEW] Created PaymentIntent %s", intent_id)
+                return CREATED
             except UniqueViolationError:
-                logger.warning(f"[RACE] PaymentIntent {intent_id} already exists (created concurrently)")
+                logger.warning("[RACE] PaymentIntent %s already exists (created concurrently)", intent_id)
                 existing = await PaymentIntent.get(id=intent_id)
 
 
         if created_event and created_event > datetime.timestamp(existing.updated):
+            before = rollup_row(existing)
+            if intent.get("created"):
+                # Replaces the receipt time of a placeholder created from the charge.
+                existing.created_at = datetime.fromtimestamp(intent.get("created"))
             await existing.update_from_dict({
                 "amount": intent.get("amount"),
                 "currency": intent.get("currency"),
@@ -42,31 +50,34 @@ async def save_payment_intent(event):
                 "description": intent.get("description"),
                 "updated": created_event
             }).save()
-            logger.info(f"[UPDATE] Updated PaymentIntent {intent_id} (newer timestamp)")
+            await apply_rollup(conn, "payment", [intent_id], [before])
+            logger.info("[UPDATE] Updated PaymentIntent %s (newer timestamp)", intent_id)
+            return UPDATED
         else:
-            logger.info(f"[SKIP] Ignored outdated event for {intent_id}")
+            logger.info("[SKIP] Ignored outdated event for %s", intent_id)
+            return SKIPPED
 
 async def fulfill_payment_intent(intent_id):
-    updated = await PaymentIntent.filter(id=intent_id).update(
-        status="succeeded",
-        updated=datetime.now()
-    )
+    updated = await fulfill_payment(connections.get("default"), intent_id) if intent_id else 0
     if updated == 0:
-        logger.info(f"[SKIP] No PaymentIntent found for {intent_id}, skipped")
+        logger.info("[SKIP] No PaymentIntent found for %s, skipped", intent_id)
     else:
-        logger.info(f"[UPDATED] PaymentIntent {intent_id} fulfilled successfully")
+        logger.info("[UPDATED] PaymentIntent %s fulfilled successfully", intent_id)
 
 async def save_empty_payment_intent_from_charge(charge):
     payment_intent_id = charge.get("payment_intent")
     if payment_intent_id:
         payment_intent = await PaymentIntent.get_or_none(id=payment_intent_id)
         if not payment_intent:
-            logger.info(f"[PLACEHOLDER] Creating placeholder PaymentIntent {payment_intent_id}")
+            logger.info("[PLACEHOLDER] Creating placeholder PaymentIntent %s", payment_intent_id)
+            # Dated like the charge until the intent's own event sets created_at;
+            # updated stays old so that event always wins.
             await PaymentIntent.create(
                 id=payment_intent_id,
                 amount=0,
                 currency=charge.get("currency", "eur"),
                 status="placeholder",
-                created_at=datetime.now() - timedelta(days=365),
+                created_at=datetime.fromtimestamp(charge["created"]) if charge.get("created") else datetime.now(),
                 updated=datetime.now() - timedelta(days=365)
             )
+            await apply_rollup(connections.get("default"), "payment", [payment_intent_id], [])
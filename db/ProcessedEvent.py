@@ -0,0 +1,41 @@
+import os
+from dotenv import load_dotenv
+from tortoise.exceptions import IntegrityError
+
+from utils.logger import logger
+from utils.lru import LRUCache
+from db.models import ProcessedEvent
+
+load_dotenv()
+PROCESSED_EVENTS_LRU_SIZE = int(os.getenv("PROCESSED_EVENTS_LRU_SIZE", 10000))
+
+_recent_events = LRUCache(PROCESSED_EVENTS_LRU_SIZE)
+
+
+async def claim_event(event_id, event_type=None) -> bool:
+    """
+    Claim a Stripe event for processing.
+
+    Returns True for the first delivery of event_id and False for a redelivery.
+    Recently seen ids are answered from memory; otherwise the insert into
+    processed_event is the durable check (the primary key rejects duplicates).
+    """
+    if event_id in _recent_events:
+        logger.info("[DUPLICATE] Event %s already processed, skipped", event_id)
+        return False
+
+    try:
+        await ProcessedEvent.create(id=event_id, type=event_type)
+    except IntegrityError:
+        _recent_events.set(event_id)
+        logger.info("[DUPLICATE] Event %s already processed, skipped", event_id)
+        return False
+
+    _recent_events.set(event_id)
+    return True
+
+
+async def release_event(event_id):
+    """Forget a claimed event so a redelivery is processed again (used when processing failed)."""
+    _recent_events.pop(event_id)
+    await ProcessedEvent.filter(id=event_id).delete()
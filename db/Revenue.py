@@ -0,0 +1,250 @@
+"""
+Daily revenue rollups over the payment and charge tables.
+
+revenue_rollup holds count and sum(amount) per (source, day, currency, status),
+source being the table and day the UTC date of created_at. Writers keep it
+current in their own transaction: they take the rollup fields of the rows
+before the change (locking them), write, and apply_rollup() adds the rows'
+new state and subtracts the old one, so a status transition moves the row
+from one bucket to the other and nothing is counted twice. Every key is split
+over REVENUE_ROLLUP_SLOTS rows by a hash of the row id, so concurrent writers
+rarely wait on the same counter; readers sum the slots. A writer that runs
+many large transactions side by side (backfill.py) gives each of them a slot
+of its own past those instead, so they never wait on each other's counters.
+
+rebuild_rollups() recomputes a range of days from the source table under a
+short SHARE ROW EXCLUSIVE lock of revenue_rollup, which waits for the writers
+that already applied a delta and holds back the ones about to.
+"""
+import os
+from datetime import UTC, date, timedelta
+from dotenv import load_dotenv
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+from utils.logger import logger
+from utils.make_aware import make_aware
+
+load_dotenv()
+REVENUE_ROLLUP_SLOTS = max(1, int(os.getenv("REVENUE_ROLLUP_SLOTS", 4)))
+
+SOURCES = ("payment", "charge")
+DAY_SQL = '("created_at" AT TIME ZONE \'UTC\')::date'
+SLOT_SQL = '((hashtext("id") & 2147483647) % {slots})::smallint'
+# created_at range of the days [$2, $3), usable with the created_at index.
+DAY_RANGE_SQL = ('"created_at" >= ($2::date)::timestamp AT TIME ZONE \'UTC\' '
+                 'AND "created_at" < ($3::date)::timestamp AT TIME ZONE \'UTC\'')
+
+SNAPSHOT_SQL = """
+SELECT "id", {day} AS "day", "currency", "status", "amount"
+FROM "{table}" WHERE "id" = ANY($1::varchar[])
+ORDER BY "id"
+FOR UPDATE
+"""
+
+# Adds the current state of the rows $1 and subtracts their state before the
+# write ($2-$6, from rollup_snapshot / rollup_row).
+APPLY_SQL = """
+WITH changes AS (
+    SELECT "id", {day} AS "day", "currency", "status", "amount"::bigint AS "amount", 1 AS "n"
+    FROM "{table}" WHERE "id" = ANY($1::varchar[])
+    UNION ALL
+    SELECT b."id", b."day", b."currency", b."status", b."amount", -1
+    FROM unnest($2::varchar[], $3::date[], $4::varchar[], $5::varchar[], $6::bigint[])
+        AS b("id", "day", "currency", "status", "amount")
+), delta AS (
+    SELECT "day", "currency", "status", {slot} AS "slot", sum("n") AS "count", sum("amount" * "n") AS "amount"
+    FROM changes
+    GROUP BY 1, 2, 3, 4
+    HAVING sum("n") <> 0 OR sum("amount" * "n") <> 0
+)
+INSERT INTO "revenue_rollup" ("source", "day", "currency", "status", "slot", "count", "amount", "updated")
+SELECT '{table}', "day", "currency", "status", "slot", "count", "amount", now() FROM delta
+ORDER BY "day", "currency", "status", "slot"
+ON CONFLICT ("source", "day", "currency", "status", "slot") DO UPDATE
+SET "count" = "revenue_rollup"."count" + excluded."count",
+    "amount" = "revenue_rollup"."amount" + excluded."amount", "updated" = now()
+"""
+
+# fulfill_payment_intent in one statement: the status change and its delta.
+FULFILL_SQL = """
+WITH old AS (
+    SELECT "id", {day} AS "day", "currency", "status", "amount"::bigint AS "amount"
+    FROM "payment" WHERE "id" = $1
+    FOR UPDATE
+), new AS (
+    UPDATE "payment" AS p SET "status" = 'succeeded', "updated" = now()
+    FROM old WHERE p."id" = old."id"
+    RETURNING p."id", old."day", p."currency", p."status", p."amount"::bigint AS "amount"
+), delta AS (
+    SELECT "day", "currency", "status", {slot} AS "slot", sum("n") AS "count", sum("amount" * "n") AS "amount"
+    FROM (SELECT *, 1 AS "n" FROM new UNION ALL SELECT *, -1 FROM old) AS changes
+    GROUP BY 1, 2, 3, 4
+    HAVING sum("n") <> 0 OR sum("amount" * "n") <> 0
+), applied AS (
+    INSERT INTO "revenue_rollup" ("source", "day", "currency", "status", "slot", "count", "amount", "updated")
+    SELECT 'payment', "day", "currency", "status", "slot", "count", "amount", now() FROM delta
+    ORDER BY "day", "currency", "status", "slot"
+    ON CONFLICT ("source", "day", "currency", "status", "slot") DO UPDATE
+    SET "count" = "revenue_rollup"."count" + excluded."count",
+        "amount" = "revenue_rollup"."amount" + excluded."amount", "updated" = now()
+)
+SELECT count(*) AS "updated" FROM new
+"""
+
+LOCK_SQL = 'LOCK TABLE "revenue_rollup" IN SHARE ROW EXCLUSIVE MODE'
+CLEAR_DAYS_SQL = 'DELETE FROM "revenue_rollup" WHERE "source" = $1 AND "day" >= $2 AND "day" < $3'
+CLEAR_OUTSIDE_SQL = 'DELETE FROM "revenue_rollup" WHERE "source" = $1 AND ("day" < $2 OR "day" >= $3)'
+
+REBUILD_SQL = """
+INSERT INTO "revenue_rollup" ("source", "day", "currency", "status", "slot", "count", "amount", "updated")
+SELECT $1, {day}, "currency", "status", {slot}, count(*), sum("amount"), now()
+FROM "{table}" WHERE {range}
+GROUP BY 2, 3, 4, 5
+"""
+
+DIFF_SQL = """
+WITH expected AS (
+    SELECT {day} AS "day", "currency", "status", count(*) AS "count", sum("amount") AS "amount"
+    FROM "{table}" WHERE {range}
+    GROUP BY 1, 2, 3
+), stored AS (
+    SELECT "day", "currency", "status", sum("count") AS "count", sum("amount") AS "amount"
+    FROM "revenue_rollup" WHERE "source" = $1 AND "day" >= $2 AND "day" < $3
+    GROUP BY 1, 2, 3
+    HAVING sum("count") <> 0 OR sum("amount") <> 0
+)
+SELECT COALESCE(e."day", s."day") AS "day", COALESCE(e."currency", s."currency") AS "currency",
+       COALESCE(e."status", s."status") AS "status", e."count" AS "expected_count", s."count" AS "stored_count",
+       e."amount" AS "expected_amount", s."amount" AS "stored_amount"
+FROM expected AS e
+FULL JOIN stored AS s ON (s."day", s."currency", s."status") = (e."day", e."currency", e."status")
+WHERE (e."count", e."amount") IS DISTINCT FROM (s."count", s."amount")
+"""
+
+DAILY_REVENUE_SQL = """
+SELECT "source", "day", "currency", "status", sum("count")::bigint AS "count", sum("amount")::bigint AS "amount"
+FROM "revenue_rollup"
+WHERE "day" >= $1 AND "day" < $2
+  AND ($3::varchar IS NULL OR "source" = $3)
+  AND ($4::varchar IS NULL OR "currency" = $4)
+  AND ($5::varchar IS NULL OR "status" = $5)
+GROUP BY 1, 2, 3, 4
+HAVING sum("count") <> 0 OR sum("amount") <> 0
+ORDER BY "source", "day", "currency", "status"
+"""
+
+
+def _sql(template, table, slot=None):
+    slot = SLOT_SQL.format(slots=REVENUE_ROLLUP_SLOTS) if slot is None else f"{int(slot)}::smallint"
+    return template.format(table=table, day=DAY_SQL, slot=slot, range=DAY_RANGE_SQL)
+
+
+def rollup_row(instance):
+    """Rollup fields of a PaymentIntent or Charge instance, as rollup_snapshot() returns them."""
+    return {
+        "id": instance.id,
+        "day": make_aware(instance.created_at).astimezone(UTC).date(),
+        "currency": instance.currency,
+        "status": instance.status,
+        "amount": instance.amount,
+    }
+
+
+async def rollup_snapshot(conn, source, ids):
+    """Rollup fields of the rows ids of source, locked until the end of the transaction."""
+    ids = sorted({i for i in ids if i})
+    if not ids:
+        return []
+    return await conn.execute_query_dict(_sql(SNAPSHOT_SQL, source), [ids])
+
+
+async def apply_rollup(conn, source, ids, before, slot=None):
+    """
+    Bring the rollups up to date after the rows ids of source were written.
+    before holds those rows' rollup fields from before the write (rows that
+    did not exist are left out). Call it in the writing transaction. The
+    deltas go to slot when given, else to the slot of each row id.
+    """
+    ids = sorted({i for i in ids if i})
+    if not ids:
+        return
+    columns = ("id", "day", "currency", "status", "amount")
+    await conn.execute_query(_sql(APPLY_SQL, source, slot), [ids, *([row[c] for row in before] for c in columns)])
+
+
+async def fulfill_payment(conn, intent_id):
+    """Mark a payment intent succeeded and move it to the succeeded rollup. Returns the rows updated."""
+    rows = await conn.execute_query_dict(_sql(FULFILL_SQL, "payment"), [intent_id])
+    return rows[0]["updated"]
+
+
+async def daily_revenue(start, end, source=None, currency=None, status=None):
+    """Rollup rows (summed over slots) of the days [start, end)."""
+    conn = connections.get("default")
+    return await conn.execute_query_dict(DAILY_REVENUE_SQL, [start, end, source, currency, status])
+
+
+async def day_range(source):
+    """First and last UTC day with rows in source, or (None, None) when it is empty."""
+    conn = connections.get("default")
+    rows = await conn.execute_query_dict(
+        f'SELECT min({DAY_SQL}) AS "first", max({DAY_SQL}) AS "last" FROM "{source}"')
+    return rows[0]["first"], rows[0]["last"]
+
+
+async def rebuild_rollups(source, start, end):
+    """Recompute the rollups of source for the days [start, end) in one transaction."""
+    async with in_transaction() as tx:
+        await tx.execute_query(LOCK_SQL)
+        await tx.execute_query(CLEAR_DAYS_SQL, [source, start, end])
+        await tx.execute_query(_sql(REBUILD_SQL, source), [source, start, end])
+
+
+async def clear_rollups_outside(source, start, end):
+    """Drop the rollups of source for days outside [start, end), e.g. after the rows were deleted."""
+    async with in_transaction() as tx:
+        await tx.execute_query(LOCK_SQL)
+        await tx.execute_query(CLEAR_OUTSIDE_SQL, [source, start, end])
+
+
+async def diff_rollups(source, start, end):
+    """(day, currency, status) buckets of the days [start, end) whose rollup disagrees with source."""
+    async with in_transaction() as tx:
+        await tx.execute_query(LOCK_SQL)
+        return await tx.execute_query_dict(_sql(DIFF_SQL, source), [source, start, end])
+
+
+async def rebuild_source(source, chunk_days=31, check_only=False, report=None):
+    """
+    Walk source in chunks of chunk_days days, comparing each chunk with its
+    rollups and recomputing it unless check_only. report(start, end,
+    mismatches) is called after every chunk. Returns {"days", "chunks",
+    "mismatches", "rebuilt"}.
+    """
+    first, last = await day_range(source)
+    result = {"days": 0, "chunks": 0, "mismatches": 0, "rebuilt": 0}
+    if first is None:
+        if not check_only:
+            # No rows left: every day is outside the range.
+            await clear_rollups_outside(source, date.max, date.max)
+        return result
+    end_of_range = last + timedelta(days=1)
+    start = first
+    while start < end_of_range:
+        end = min(start + timedelta(days=chunk_days), end_of_range)
+        diff = await diff_rollups(source, start, end)
+        if diff:
+            logger.warning("[REVENUE] %s: %s mismatched buckets in %s..%s", source, len(diff), start, end - timedelta(days=1))
+        if not check_only:
+            await rebuild_rollups(source, start, end)
+            result["rebuilt"] += len(diff)
+        result["days"] += (end - start).days
+        result["chunks"] += 1
+        result["mismatches"] += len(diff)
+        if report:
+            report(start, end, len(diff))
+        start = end
+    if not check_only:
+        await clear_rollups_outside(source, first, end_of_range)
+    return result
@@ -1,9 +1,13 @@
 from datetime import datetime, timezone, UTC
+from tortoise.transactions import in_transaction
 
-from db.TelegramUser import update_telegram_user_from_event
 from utils.logger import logger
 from utils.make_aware import make_aware
+from utils.subscription_cache import subscription_cache
+from utils.metrics import CREATED, UPDATED, SKIPPED, ERROR
 from db.models import Subscription, Customer
+from db.Entitlement import refresh_entitlements
+from db.notifier import notifier
 
 
 async def save_subscription(event):
@@ -21,49 +25,55 @@ async def save_subscription(event):
     }
 
     data = {k: v for k, v in data.items() if v not in (None, "", [])}
-    logger.info(f"[INFO] Starting saving subscription {data.get('id')} for customer {data.get('customer')} from {data}")
+    logger.info("[INFO] Starting saving subscription %s for customer %s", data.get('id'), data.get('customer'))
+    logger.debug("[INFO] Subscription payload %s", data)
 
     try:
-        existing = await Subscription.get_or_none(id=data.get('id'))
-
-        if not existing:
-            updated = data.get('created_at') or datetime.now(UTC)
-            await Subscription.create(
-                updated=updated,
-                **data
-            )
-            logger.info(f"[NEW] Created subscription {data.get('id')}")
-            return
-
-        existing_updated = make_aware(existing.updated)
-        if data.get('created_at') and data.get('created_at') > existing_updated:
-            await existing.update_from_dict(data).save()
-            logger.info(f"[UPDATE] Updated subscription {data.get('id')}")
-        else:
-            partial_update = {
-                k: v for k, v in data.items()
-                if getattr(existing, k) in (None, "", [])
-            }
-            if partial_update:
-                await existing.update_from_dict(partial_update).save()
-                logger.info(f"[UPDATE] Partially updated subscription {data.get('id')}")
-            else:
-                logger.info(f"[SKIP] No new data for subscription {data.get('id')}, skipped")
-
+        changed = []
+        async with in_transaction():
+            outcome = await _write_subscription(data)
+            if outcome != SKIPPED:
+                changed = await refresh_entitlements(customer_ids=[body.get('customer')])
+        for user_id in changed:
+            notifier.notify(user_id, event.get('type'))
+        return outcome
     except Exception as e:
-        logger.error(f"[ERROR] [SUBSCRIPTION] {e}")
-
-
-async def get_subscriptions(filters: dict):
-    logger.info(f"[GET SUBSCRIPTION] Looking for subscriptions by {filters}")
-
-    subscriptions = await Subscription.filter(**filters).order_by('-updated')
-
-    if subscriptions is None:
-        logger.info("[GET SUBSCRIPTION] No subscription found")
-        return []
+        logger.error("[ERROR] [SUBSCRIPTION] %s", e)
+        return ERROR
+    finally:
+        subscription_cache.invalidate(customer_id=body.get('customer'))
+
+
+async def _write_subscription(data):
+    existing = await Subscription.get_or_none(id=data.get('id'))
+
+    if not existing:
+        updated = data.get('created_at') or datetime.now(UTC)
+        await Subscription.create(
+            updated=updated,
+            **data
+        )
+        logger.info("[NEW] Created subscription %s", data.get('id'))
+        return CREATED
+
+    existing_updated = make_aware(existing.updated)
+    if data.get('created_at') and data.get('created_at') > existing_updated:
+        await existing.update_from_dict(data).save()
+        logger.info("[UPDATE] Updated subscription %s", data.get('id'))
+        return UPDATED
+    else:
+        partial_update = {
+            k: v for k, v in data.items()
+            if getattr(existing, k) in (None, "", [])
+        }
+        if partial_update:
+            await existing.update_from_dict(partial_update).save()
+            logger.info("[UPDATE] Partially updated subscription %s", data.get('id'))
+            return UPDATED
+        else:
+            logger.info("[SKIP] No new data for subscription %s, skipped", data.get('id'))
+            return SKIPPED
 
-    return subscriptions
 
 async def delete_subscription(event):
     body = event.get('data').get('object')
@@ -73,14 +83,21 @@ async def delete_subscription(event):
     subscription = await Subscription.filter(id=sub_id).first()
 
     if not subscription:
-        logger.info(f"[DELETE SUBSCRIPTION] No subscription {sub_id} found, skipped")
+        logger.info("[DELETE SUBSCRIPTION] No subscription %s found, skipped", sub_id)
+        return SKIPPED
 
     subscription.status = status
     subscription.ending = ended_at
     try:
-        await subscription.save()
-        logger.info(f"[DELETE SUBSCRIPTION] Updated subscription {sub_id}")
+        async with in_transaction():
+            # updated is bumped (auto_now), so older updates replayed later cannot revive it.
+            await subscription.save(update_fields=["status", "ending", "updated"])
+            changed = await refresh_entitlements(customer_ids=[subscription.customer_id])
+        for user_id in changed:
+            notifier.notify(user_id, event.get('type'))
+        logger.info("[DELETE SUBSCRIPTION] Updated subscription %s", sub_id)
+        subscription_cache.invalidate(customer_id=body.get('customer'))
+        return UPDATED
     except Exception as e:
-        logger.error(f"[DELETE SUBSCRIPTION] {e}")
-
-    await update_telegram_user_from_event(event)
+        logger.error("[DELETE SUBSCRIPTION] %s", e)
+        return ERROR
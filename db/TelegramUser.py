@@ -1,61 +1,18 @@
-from tortoise.exceptions import DoesNotExist
+from tortoise import connections
+from tortoise.transactions import in_transaction
 from datetime import datetime, timezone
 
 from utils.logger import logger
-from db.models import TelegramUser, Customer
+from utils.subscription_cache import subscription_cache
+from utils.metrics import UPDATED, SKIPPED
+from db.models import Customer
+from db.Entitlement import entitlement_upsert_sql, refresh_entitlements
+from db.notifier import notifier
 from typing import Optional
 
-async def get_telegram_user(
-        email: Optional[str] = None,
-        username: Optional[str] = None,
-        user_id: Optional[int] = None):
-    """
-    Search for TelegramUser.
-    Priority:
-      1) user_id
-      2) username
-      3) email
-
-    Returns object TelegramUser or None.
-    """
-    logger.info(f"[GET TG USER] Trying to find Telegram User with {locals().items()}...")
-    if user_id is not None:
-        try:
-            tgu = await TelegramUser.get(user_id=user_id)
-            logger.debug(f"[GET TG USER] Found Telegram User by id {user_id}")
-            return tgu
-        except DoesNotExist:
-            logger.debug(f"[GET TG USER] No Telegram User found by id {user_id}")
-
-    if username is not None:
-        try:
-            tgu = await TelegramUser.get(username=username)
-            logger.debug(f"[GET TG USER] Found Telegram User by username {username}")
-            return tgu
-        except DoesNotExist:
-            logger.debug(f"[GET TG USER] No Telegram User found by username {username}")
-
-    if email is not None:
-        try:
-            tgu = await TelegramUser.get(email=email)
-            logger.debug(f"[GET TG USER] Found Telegram User by email {email}")
-            return tgu
-        except DoesNotExist:
-            logger.debug(f"[GET TG USER] No Telegram User found by email {email}")
-
-    logger.info(f"[GET TG USER] No Telegram User found")
-    return None
-
-async def create_telegram_user(
-        user_id: int = None,
-        username: Optional[str] = None,
-        email: Optional[str] = None,
-        subscription_status: Optional[bool] = False,
-        full_name: Optional[str] = None
-):
-    data = {k: v for k, v in locals().items() if v is not None}
-    telegram_user = await TelegramUser.create(**data)
-    return telegram_user
+# Class id of the transaction advisory locks that serialize concurrent inserts
+# of the same Telegram user (two-key form, like JOB_LOCK_CLASS).
+TELEGRAM_USER_LOCK_CLASS = 7_300_003
 
 async def update_telegram_user_from_event(event):
     """
@@ -64,7 +21,7 @@ async def update_telegram_user_from_event(event):
     event: Stripe webhook event object (event.data.object)
     """
 
-    logger.info(f"[UPDATE TG USER] Updating Telegram User from event {event.type} {event.id}")
+    logger.info("[UPDATE TG USER] Updating Telegram User from event %s %s", event.type, event.id)
 
     data = event.data.object
     customer_id = data.customer
@@ -72,33 +29,250 @@ async def update_telegram_user_from_event(event):
     # Fetch the Customer and prefetch the related TelegramUser
     customer = await Customer.filter(id=customer_id).prefetch_related("user_id").first()
     if not customer or not customer.user_id:
-        logger.info(f"[UPDATE TG USER] No customer found!")
-        return
+        logger.info("[UPDATE TG USER] No customer found!")
+        return SKIPPED
 
     user = customer.user_id
 
     # Always update cancel_at_period_end if the field exists
     if hasattr(data, "cancel_at_period_end"):
-        logger.info(f"[UPDATE TG USER] Successfully updated cancel_at_period_end for {user.id}!")
+        logger.info("[UPDATE TG USER] Successfully updated cancel_at_period_end for %s!", user.id)
         user.cancel_at_period_end = data.cancel_at_period_end
 
     if event.type == "customer.subscription.updated":
         if hasattr(data, "current_period_end"):
             period_end = datetime.fromtimestamp(data.current_period_end, tz=timezone.utc)
-            logger.info(f"[UPDATE TG USER] Successfully updated period end date {period_end} for {user.id}")
+            logger.info("[UPDATE TG USER] Successfully updated period end date %s for %s", period_end, user.id)
             user.date_end = period_end
 
     # If the event is invoice.paid, also update the subscription end date
     if event.type == "invoice.paid":
         if hasattr(data, "lines") and len(data.lines.data) > 0:
             period_end = data.lines.data[0].period.end
-            logger.info(f"[UPDATE TG USER] Successfully updated prolongation and date {period_end} for {user.id}!")
+            logger.info("[UPDATE TG USER] Successfully updated prolongation and date %s for %s!", period_end, user.id)
             user.date_end = datetime.fromtimestamp(period_end, tz=timezone.utc)
 
     # If the event is subscription.deleted updating end date
     elif event.type == "customer.subscription.deleted":
         user.date_end = datetime.fromtimestamp(data.ended_at, tz=timezone.utc)
-        logger.info(f"[UPDATE TG USER] Successfully updated ended_at for deletion")
+        logger.info("[UPDATE TG USER] Successfully updated ended_at for deletion")
+
+    async with in_transaction():
+        await user.save()
+        await refresh_entitlements(customer_ids=[customer_id], telegram_user_ids=[user.id])
+    subscription_cache.invalidate(customer_id=customer_id, user_id=user.user_id)
+    notifier.notify(user.user_id, event.type)
+    return UPDATED
 
-    await user.save()
 
+TELEGRAM_USER_COLUMNS = (
+    "id", "user_id", "username", "full_name", "email", "subscription_status",
+    "date_end", "cancel_at_period_end", "is_admin", "created_at",
+)
+
+RESOLVE_SUBSCRIPTIONS_SQL = f"""
+WITH req AS (
+    SELECT * FROM unnest($1::int[], $2::bigint[], $3::varchar[], $4::varchar[], $5::varchar[], $6::varchar[])
+        AS r("idx", "user_id", "username", "email", "exact_username", "exact_email")
+), tg AS (
+    SELECT * FROM "telegram_user"
+    WHERE "user_id" = ANY($2::bigint[]) OR lower("username") = ANY($3::varchar[]) OR lower("email") = ANY($4::varchar[])
+), cus AS (
+    SELECT "id", "user_id_id", "email", "username" FROM "customer"
+    WHERE lower("email") = ANY($4::varchar[]) OR lower("username") = ANY($3::varchar[])
+)
+SELECT r."idx", {", ".join(f't."{c}" AS "tg_{c}"' for c in TELEGRAM_USER_COLUMNS)},
+       c."id" AS "customer_id", c."user_id_id" AS "customer_user_id", s."ending" AS "sub_ending"
+FROM req AS r
+LEFT JOIN LATERAL (
+    SELECT * FROM tg
+    WHERE tg."user_id" = r."user_id" OR lower(tg."username") = r."username" OR lower(tg."email") = r."email"
+    ORDER BY CASE WHEN tg."user_id" = r."user_id" THEN 1
+                  WHEN tg."username" = r."exact_username" THEN 2
+                  WHEN lower(tg."username") = r."username" THEN 3
+                  WHEN tg."email" = r."exact_email" THEN 4
+                  ELSE 5 END,
+             tg."id"
+    LIMIT 1
+) AS t ON true
+LEFT JOIN cus AS c ON lower(c."email") = r."email" OR lower(c."username") = r."username"
+LEFT JOIN LATERAL (
+    SELECT "ending", "updated" FROM "subscription"
+    WHERE "customer_id" = c."id" AND "status" = 'active'
+      AND (t."banned_at" IS NULL OR "updated" > t."banned_at")
+    ORDER BY "updated" DESC
+    LIMIT 1
+) AS s ON true
+ORDER BY r."idx", s."updated" DESC NULLS LAST
+"""
+
+# Telegram users whose entitlement an APPLY_SUBSCRIPTIONS_SQL run can change.
+APPLY_ENTITLED_USERS = """(
+    SELECT "id", "user_id" FROM created
+    UNION
+    SELECT "id", "user_id" FROM "telegram_user" WHERE "id" IN (
+        SELECT "tg_id" FROM links
+        UNION
+        SELECT c."user_id_id" FROM "customer" AS c JOIN links ON links."customer_id" = c."id"
+    )
+)"""
+# Customer ownership as of after the statement: its own link updates are not visible to it.
+APPLY_LINKED_CUSTOMERS = """(
+    SELECT "id", "user_id_id" FROM "customer"
+    WHERE "id" NOT IN (SELECT "customer_id" FROM links WHERE "tg_id" IS NOT NULL)
+    UNION ALL
+    SELECT "customer_id", "tg_id" FROM links WHERE "tg_id" IS NOT NULL
+)"""
+
+# A check racing another one that inserts the same user waits for it on the
+# advisory locks of the user's user_id, username and email (the unique keys),
+# then finds the committed row and takes it through ON CONFLICT DO UPDATE, so
+# the loser gets the winner's row from the same round-trip.
+APPLY_SUBSCRIPTIONS_SQL = f"""
+WITH locked AS (
+    SELECT count(pg_advisory_xact_lock({TELEGRAM_USER_LOCK_CLASS}, k."key")) AS "n"
+    FROM (
+        SELECT DISTINCT hashtext(k) AS "key"
+        FROM unnest(ARRAY(SELECT unnest($1::bigint[])::text) || ARRAY(SELECT 'u:' || unnest($2::varchar[]))
+                    || ARRAY(SELECT 'e:' || unnest($3::varchar[]))) AS k
+        WHERE k IS NOT NULL
+        ORDER BY 1
+    ) AS k
+), created AS (
+    INSERT INTO "telegram_user" ("user_id", "username", "email", "full_name", "subscription_status",
+                                 "date_end", "cancel_at_period_end", "is_admin", "created_at")
+    SELECT n."user_id", n."username", n."email", n."full_name", n."ending" IS NOT NULL, n."ending", false, false, now()
+    FROM unnest($1::bigint[], $2::varchar[], $3::varchar[], $4::varchar[], $5::timestamptz[])
+        AS n("user_id", "username", "email", "full_name", "ending")
+    WHERE (SELECT "n" FROM locked) >= 0
+    ON CONFLICT ("user_id") DO UPDATE SET "user_id" = excluded."user_id"
+    RETURNING {", ".join(f'"{c}"' for c in TELEGRAM_USER_COLUMNS)}
+), links AS (
+    SELECT l."customer_id", COALESCE(l."tg_id", created."id") AS "tg_id"
+    FROM unnest($6::varchar[], $7::int[], $8::bigint[]) AS l("customer_id", "tg_id", "tg_user_id")
+    LEFT JOIN created ON created."user_id" = l."tg_user_id"
+), linked AS (
+    UPDATE "customer" AS c SET "user_id_id" = links."tg_id"
+    FROM links
+    WHERE c."id" = links."customer_id" AND links."tg_id" IS NOT NULL
+      AND c."user_id_id" IS DISTINCT FROM links."tg_id"
+), activated AS (
+    UPDATE "telegram_user" AS t SET "subscription_status" = true, "date_end" = a."ending"
+    FROM unnest($9::int[], $10::timestamptz[]) AS a("id", "ending")
+    WHERE t."id" = a."id"
+), entitled AS ({entitlement_upsert_sql(APPLY_ENTITLED_USERS, APPLY_LINKED_CUSTOMERS)})
+SELECT * FROM created
+"""
+
+
+def _lower(value):
+    return value.lower() if value is not None else None
+
+
+async def resolve_subscriptions(identities):
+    """
+    Resolve subscription checks for many identities in at most two round-trips.
+
+    identities is a list of dicts with user_id, username, email and full_name.
+    username and email are matched case-insensitively, like Telegram and mail
+    servers treat them; the unique constraints are case-sensitive though, so
+    when several TelegramUsers differ only in case the exact spelling wins,
+    then the oldest one (lowest id). Every matching customer is linked.
+    One set-based query finds, per identity, the TelegramUser (priority user_id,
+    username, email), the customers matching email/username and the latest
+    active subscription written after the user's /ban, if any. A second statement creates the missing TelegramUsers,
+    links the customers that are not linked yet, stores active subscriptions
+    and refreshes the entitlements of the affected users; it is skipped when
+    nothing changes.
+
+    Returns a list, in input order, of (telegram user dict, customer ids,
+    active subscription end or None), or None where a new TelegramUser could
+    not be created (no user_id, or a username/email another new user of the
+    batch already takes). A new user inserted concurrently by another check
+    is returned as that check created it.
+    """
+    if not identities:
+        return []
+
+    conn = connections.get("default")
+    rows = await conn.execute_query_dict(RESOLVE_SUBSCRIPTIONS_SQL, [
+        list(range(len(identities))),
+        [i.get("user_id") for i in identities],
+        [_lower(i.get("username")) for i in identities],
+        [_lower(i.get("email")) for i in identities],
+        [i.get("username") for i in identities],
+        [i.get("email") for i in identities],
+    ])
+
+    resolved = [None] * len(identities)
+    for row in rows:
+        entry = resolved[row["idx"]]
+        if entry is None:
+            user = {c: row[f"tg_{c}"] for c in TELEGRAM_USER_COLUMNS} if row["tg_id"] is not None else None
+            entry = resolved[row["idx"]] = [user, {}, row["sub_ending"]]
+        if row["customer_id"] is not None:
+            entry[1][row["customer_id"]] = row["customer_user_id"]
+
+    new_users = {}
+    taken = set()
+    links = {}
+    activate = {}
+    for identity, (user, customers, active_end) in zip(identities, resolved):
+        if user is None:
+            unique = {(k, identity[k]) for k in ("username", "email") if identity.get(k) is not None}
+            if identity.get("user_id") is not None and (identity["user_id"] in new_users or not unique & taken):
+                taken |= unique
+                new_users[identity["user_id"]] = (identity, active_end)
+                links.update({cid: (None, identity["user_id"]) for cid in customers})
+            continue
+        links.update({cid: (user["id"], None) for cid, linked in customers.items() if linked != user["id"]})
+        if active_end is not None and (not user["subscription_status"] or user["date_end"] != active_end):
+            activate[user["id"]] = active_end
+
+    created = {}
+    if new_users or links or activate:
+        logger.info("[GET TG USER] Creating %s Telegram Users, linking %s customers, activating %s",
+                    len(new_users), len(links), len(activate))
+        result = await conn.execute_query_dict(APPLY_SUBSCRIPTIONS_SQL, [
+            list(new_users),
+            [i.get("username") for i, _ in new_users.values()],
+            [i.get("email") for i, _ in new_users.values()],
+            [i.get("full_name") for i, _ in new_users.values()],
+            [end for _, end in new_users.values()],
+            list(links),
+            [tg_id for tg_id, _ in links.values()],
+            [tg_user_id for _, tg_user_id in links.values()],
+            list(activate),
+            list(activate.values()),
+        ])
+        created = {row["user_id"]: row for row in result}
+
+    results = []
+    for identity, (user, customers, active_end) in zip(identities, resolved):
+        if user is None:
+            user = created.get(identity.get("user_id"))
+            if user is None:
+                results.append(None)
+                continue
+        elif user["id"] in activate:
+            user["subscription_status"] = True
+            user["date_end"] = active_end
+        results.append((user, list(customers), active_end))
+    return results
+
+
+async def resolve_subscription(
+        email: Optional[str] = None,
+        username: Optional[str] = None,
+        user_id: Optional[int] = None,
+        full_name: Optional[str] = None):
+    """
+    Resolve a single subscription check, see resolve_subscriptions().
+
+    Returns (telegram user dict, customer ids, active subscription end or None).
+    """
+    identity = {"email": email, "username": username, "user_id": user_id, "full_name": full_name}
+    result = (await resolve_subscriptions([identity]))[0]
+    if result is None:
+        raise ValueError(f"Could not create Telegram User for {identity}")
+    return result
@@ -0,0 +1,371 @@
+import os
+import asyncio
+from datetime import datetime, timedelta, UTC
+from dotenv import load_dotenv
+from tortoise.transactions import in_transaction
+
+from utils.logger import logger
+from utils.subscription_cache import subscription_cache
+from utils.metrics import CREATED, UPDATED, SKIPPED
+from db.Entitlement import refresh_entitlements
+from db.Revenue import rollup_snapshot, apply_rollup
+from db.notifier import notifier
+
+load_dotenv()
+BULK_WRITES = os.getenv("BULK_WRITES", "false").lower() in ("1", "true", "yes")
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 200))
+BULK_MAX_DELAY_MS = float(os.getenv("BULK_MAX_DELAY_MS", 5))
+
+PAYMENT_COLUMNS = ("id", "created_at", "updated", "amount", "currency", "email", "status", "statement", "description")
+CHARGE_COLUMNS = ("id", "created_at", "updated", "payment_intent_id", "amount", "currency", "status", "receipt_url", "email")
+CUSTOMER_COLUMNS = ("id", "created_at", "updated", "name", "email", "phone", "description")
+SUBSCRIPTION_COLUMNS = ("id", "created_at", "updated", "status", "customer_id", "started", "ending", "url", "cancel_at_period_end")
+# Model defaults for columns Stripe may leave out.
+SUBSCRIPTION_DEFAULTS = {"status": "'inactive'", "cancel_at_period_end": "false"}
+
+COLUMNS = {
+    "payment": PAYMENT_COLUMNS,
+    "charge": CHARGE_COLUMNS,
+    "customer": CUSTOMER_COLUMNS,
+    "subscription": SUBSCRIPTION_COLUMNS,
+}
+
+# Tables are flushed in this order so foreign keys resolve inside one batch.
+TABLE_ORDER = ("payment", "charge", "customer", "subscription")
+# asyncpg / Postgres limit of bind parameters in one statement.
+MAX_QUERY_PARAMS = 32767
+
+
+def _fromtimestamp(ts):
+    return datetime.fromtimestamp(ts, tz=UTC) if ts is not None else None
+
+
+def payment_intent_row(event):
+    intent = event["data"]["object"]
+    return {
+        "id": intent.get("id"),
+        "created_at": _fromtimestamp(intent.get("created")),
+        "updated": _fromtimestamp(event.get("created")),
+        "amount": intent.get("amount"),
+        "currency": intent.get("currency"),
+        "email": intent.get("receipt_email"),
+        "status": intent.get("status"),
+        "statement": intent.get("statement_descriptor"),
+        "description": intent.get("description"),
+    }
+
+
+def charge_row(event):
+    charge = event.get("data").get("object")
+    return {
+        "id": charge.get("id"),
+        # Receipt time only when Stripe left created out, like save_charge.
+        "created_at": _fromtimestamp(charge.get("created")) or datetime.now(UTC),
+        "updated": _fromtimestamp(event.get("created")),
+        "payment_intent_id": charge.get("payment_intent"),
+        "amount": charge.get("amount"),
+        "currency": charge.get("currency"),
+        "status": charge.get("status"),
+        "receipt_url": charge.get("receipt_url"),
+        "email": charge.get("billing_details").get("email"),
+    }
+
+
+def customer_row(event):
+    customer = event.get("data").get("object")
+    return {
+        "id": customer.get("id"),
+        "created_at": _fromtimestamp(customer.get("created")),
+        "updated": _fromtimestamp(event.get("created")),
+        "name": customer.get("name"),
+        "email": customer.get("email"),
+        "phone": customer.get("phone"),
+        "description": customer.get("description"),
+    }
+
+
+def subscription_row(event):
+    body = event.get("data").get("object")
+    return {
+        "id": body.get("id"),
+        "created_at": _fromtimestamp(event.get("created")),
+        "updated": _fromtimestamp(event.get("created")),
+        "status": body.get("status"),
+        "customer_id": body.get("customer"),
+        "started": _fromtimestamp(body.get("current_period_start")),
+        "ending": _fromtimestamp(body.get("current_period_end")),
+        "url": body.get("items").get("url"),
+        "cancel_at_period_end": body.get("cancel_at_period_end"),
+    }
+
+
+def _merge(old, new):
+    """Keep the newer row of two for the same id, filling its empty fields from the older one."""
+    if old is None:
+        return new
+    newer, older = (new, old) if new["updated"] >= old["updated"] else (old, new)
+    return {k: v if v not in (None, "") else older.get(k) for k, v in newer.items()}
+
+
+def _columns(columns):
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+def _values(columns, rows, placeholder=None):
+    params = []
+    groups = []
+    for row in rows:
+        slots = []
+        for column in columns:
+            params.append(row[column])
+            slot = f"${len(params)}"
+            slots.append(placeholder(column, slot) if placeholder else slot)
+        groups.append(f"({', '.join(slots)})")
+    return ", ".join(groups), params
+
+
+def upsert_sql(table, columns, update_columns, rows):
+    """
+    One INSERT … ON CONFLICT (id) DO UPDATE for all rows, keeping the
+    last-writer-wins rule on updated. RETURNING tells new rows from updated
+    ones; outdated rows are not returned at all.
+    """
+    values, params = _values(columns, rows)
+    sets = ", ".join(f'"{c}" = excluded."{c}"' for c in update_columns)
+    sql = (
+        f'INSERT INTO "{table}" ({_columns(columns)}) VALUES {values} '
+        f'ON CONFLICT ("id") DO UPDATE SET {sets} '
+        f'WHERE "{table}"."updated" < excluded."updated" '
+        f'RETURNING "id", (xmax = 0) AS inserted'
+    )
+    return sql, params
+
+
+def subscription_upsert_sql(rows):
+    """
+    Subscriptions keep the partial-update rule of save_subscription: newer
+    events overwrite non-empty fields, older ones only fill empty columns.
+    The customer link is only set when the customer row exists.
+    """
+    def placeholder(column, slot):
+        if column == "customer_id":
+            return f'(SELECT "id" FROM "customer" WHERE "id" = {slot})'
+        if column in SUBSCRIPTION_DEFAULTS:
+            return f"COALESCE({slot}, {SUBSCRIPTION_DEFAULTS[column]})"
+        return slot
+
+    columns = SUBSCRIPTION_COLUMNS
+    values, params = _values(columns, rows, placeholder)
+    newer = '"subscription"."updated" < excluded."updated"'
+    sets = ", ".join(
+        f'"{c}" = CASE WHEN {newer} THEN COALESCE(excluded."{c}", "subscription"."{c}") '
+        f'ELSE COALESCE("subscription"."{c}", excluded."{c}") END'
+        for c in columns if c not in ("id", "created_at")
+    )
+    sql = (
+        f'INSERT INTO "subscription" ({_columns(columns)}) VALUES {values} '
+        f'ON CONFLICT ("id") DO UPDATE SET {sets} '
+        f'RETURNING "id", (xmax = 0) AS inserted'
+    )
+    return sql, params
+
+
+def placeholder_payment_sql(charges):
+    """Placeholder payment intents for charges that arrive before their intent (see save_empty_payment_intent_from_charge)."""
+    old = datetime.now(UTC) - timedelta(days=365)
+    intents = {c["payment_intent_id"]: c for c in charges if c.get("payment_intent_id")}
+    rows = [{"id": pid, "amount": 0, "currency": c.get("currency") or "eur", "status": "placeholder",
+             "created_at": c["created_at"], "updated": old}
+            for pid, c in intents.items()]
+    columns = ("id", "amount", "currency", "status", "created_at", "updated")
+    values, params = _values(columns, rows)
+    sql = f'INSERT INTO "payment" ({_columns(columns)}) VALUES {values} ON CONFLICT ("id") DO NOTHING'
+    return sql, params
+
+
+def merge_row(rows, table, row):
+    """Add row to a {table: {id: row}} batch, merging it with a row already there for the same id."""
+    batch = rows[table]
+    batch[row["id"]] = _merge(batch.get(row["id"]), row)
+
+
+async def write_rows(conn, rows, rollup_slot=None):
+    """
+    Write a {table: {id: row}} batch on conn (inside a transaction) with one
+    set-based upsert per table, in TABLE_ORDER, update the revenue rollups of
+    the changed payments and charges (in rollup_slot if given, see
+    db.Revenue) and refresh the entitlements of the changed subscriptions.
+    Returns {(table, id): outcome} for the rows that were inserted or updated.
+    """
+    outcomes = {}
+    for table in TABLE_ORDER:
+        rows_of_table = list(rows[table].values())
+        # Split so one statement stays under the Postgres bind parameter limit.
+        step = MAX_QUERY_PARAMS // len(COLUMNS[table])
+        for start in range(0, len(rows_of_table), step):
+            batch = rows_of_table[start:start + step]
+            if table in ("payment", "charge"):
+                before = await rollup_snapshot(conn, table, [r["id"] for r in batch])
+            if table == "charge":
+                # Placeholders and fulfilled intents change payment rows too.
+                payment_ids = list({c["payment_intent_id"] for c in batch if c["payment_intent_id"]})
+                payments_before = await rollup_snapshot(conn, "payment", payment_ids)
+                await conn.execute_query(*placeholder_payment_sql(batch))
+                sql, params = upsert_sql("charge", CHARGE_COLUMNS, ("status", "updated"), batch)
+            elif table == "subscription":
+                sql, params = subscription_upsert_sql(batch)
+            elif table == "payment":
+                # created_at too: Stripe never changes it, and it replaces a placeholder's.
+                sql, params = upsert_sql("payment", PAYMENT_COLUMNS, PAYMENT_COLUMNS[1:], batch)
+            else:
+                columns = COLUMNS[table]
+                sql, params = upsert_sql(table, columns, columns[2:], batch)
+            _, result = await conn.execute_query(sql, params)
+            inserted = 0
+            for r in result:
+                outcomes[(table, r["id"])] = CREATED if r["inserted"] else UPDATED
+                inserted += r["inserted"]
+            logger.info("[BULK] %s: %s new, %s updated, %s skipped",
+                        table, inserted, len(result) - inserted, len(batch) - len(result))
+
+            if table == "charge":
+                succeeded = list({c["payment_intent_id"] for c in batch
+                                  if c["status"] == "succeeded" and c["payment_intent_id"]})
+                if succeeded:
+                    await conn.execute_query(
+                        'UPDATE "payment" SET "status" = \'succeeded\', "updated" = now() WHERE "id" = ANY($1)',
+                        [succeeded])
+                await apply_rollup(conn, "payment", payment_ids, payments_before, rollup_slot)
+            if table in ("payment", "charge"):
+                changed = {r["id"] for r in result}
+                await apply_rollup(conn, table, changed, [r for r in before if r["id"] in changed], rollup_slot)
+
+    changed = [sid for table, sid in outcomes if table == "subscription"]
+    if changed:
+        users = await refresh_entitlements(
+            customer_ids=[rows["subscription"][sid]["customer_id"] for sid in changed], conn=conn)
+        for user_id in users:
+            notifier.notify(user_id, "subscription")
+    return outcomes
+
+
+class BulkWriter:
+    """
+    Micro-batching write stage: rows are collected for up to max_delay seconds
+    or max_items rows, then written with one set-based upsert per table.
+    Batches are written one at a time in the order their rows came in, and
+    rows that arrive while a batch is being written join the next one.
+    enqueue() adds a row and returns an awaitable of its outcome, which
+    resolves once the batch holding it is committed; add() awaits it.
+    """
+
+    def __init__(self, max_items=BULK_MAX_ITEMS, max_delay=BULK_MAX_DELAY_MS / 1000):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.rows = {table: {} for table in TABLE_ORDER}
+        self.count = 0
+        self.future = None
+        self.timer = None
+        self.due = False
+        self.flusher = None
+        self.batches = 0
+        self.batched_rows = 0
+
+    def enqueue(self, table, row):
+        merge_row(self.rows, table, row)
+        self.count += 1
+
+        if self.future is None:
+            loop = asyncio.get_running_loop()
+            self.future = loop.create_future()
+            self.timer = loop.call_later(self.max_delay, self._start_flush)
+        future = self.future
+
+        if self.count >= self.max_items:
+            self._start_flush()
+        return self._outcome(future, table, row["id"])
+
+    async def add(self, table, row):
+        return await self.enqueue(table, row)
+
+    @staticmethod
+    async def _outcome(future, table, row_id):
+        outcomes = await future
+        return outcomes.get((table, row_id), SKIPPED)
+
+    def _start_flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.future is None:
+            return
+        self.due = True
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while self.due and self.future is not None:
+                rows, future = self.rows, self.future
+                self.rows = {table: {} for table in TABLE_ORDER}
+                self.count = 0
+                self.future = None
+                self.due = False
+                await self._flush(rows, future)
+        finally:
+            self.flusher = None
+
+    async def _flush(self, rows, future):
+        try:
+            async with in_transaction() as conn:
+                outcomes = await write_rows(conn, rows)
+            for row in rows["customer"].values():
+                subscription_cache.invalidate(customer_id=row["id"], email=row["email"])
+            for row in rows["subscription"].values():
+                subscription_cache.invalidate(customer_id=row["customer_id"])
+            self.batches += 1
+            self.batched_rows += sum(len(r) for r in rows.values())
+            future.set_result(outcomes)
+        except Exception as e:
+            logger.error("[ERROR] [BULK] %s", e)
+            future.set_exception(e)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "rows": self.batched_rows,
+            "rows_per_batch": round(self.batched_rows / self.batches, 2) if self.batches else 0.0,
+        }
+
+    async def close(self):
+        self._start_flush()
+        if self.flusher is not None:
+            await asyncio.gather(self.flusher, return_exceptions=True)
+
+
+writer = BulkWriter()
+
+
+async def upsert_payment_intent(event):
+    return await writer.add("payment", payment_intent_row(event))
+
+
+async def upsert_charge(event):
+    return await writer.add("charge", charge_row(event))
+
+
+async def upsert_customer(event):
+    return await writer.add("customer", customer_row(event))
+
+
+async def upsert_subscription(event):
+    return await writer.add("subscription", subscription_row(event))
+
+
+# The upsert handlers and the table and row they write.
+BULK_ROWS = {
+    upsert_payment_intent: ("payment", payment_intent_row),
+    upsert_charge: ("charge", charge_row),
+    upsert_customer: ("customer", customer_row),
+    upsert_subscription: ("subscription", subscription_row),
+}
@@ -0,0 +1,167 @@
+"""
+Background sweeper switching TelegramUser.subscription_status off once
+date_end has passed.
+
+Users whose subscription is set to cancel at period end expire right at
+date_end; the others keep access for EXPIRY_GRACE_PERIOD more seconds, so a
+renewal invoice that is paid a little late does not lock them out.
+"""
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta, UTC
+from dotenv import load_dotenv
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+from utils.logger import logger
+from utils.metrics import EXPIRY_SWEEP_SECONDS, EXPIRY_SWEEP_EXPIRED, EXPIRY_SWEEP_LAST_RUN
+from utils.subscription_cache import subscription_cache
+from db.notifier import notifier
+
+load_dotenv()
+EXPIRY_SWEEP_ENABLED = os.getenv("EXPIRY_SWEEP_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", 60))
+EXPIRY_GRACE_PERIOD = float(os.getenv("EXPIRY_GRACE_PERIOD", 86400))
+# Users expired per UPDATE statement.
+EXPIRY_SWEEP_CHUNK = int(os.getenv("EXPIRY_SWEEP_CHUNK", 1000))
+# pg advisory lock key shared by every instance of the service.
+EXPIRY_SWEEP_LOCK_KEY = int(os.getenv("EXPIRY_SWEEP_LOCK_KEY", 7_300_001))
+
+# Served by idx_telegram_user_active_date_end. SKIP LOCKED leaves rows that a
+# webhook is renewing right now for the next run.
+EXPIRE_USERS_SQL = """
+UPDATE "telegram_user" SET "subscription_status" = FALSE
+WHERE "id" IN (
+    SELECT "id" FROM "telegram_user"
+    WHERE "subscription_status" AND NOT "is_admin" AND "date_end" < $1
+      AND ("cancel_at_period_end" OR "date_end" < $2)
+    ORDER BY "date_end", "id"
+    LIMIT $3
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING "user_id"
+"""
+
+
+class SweepStats:
+    def __init__(self):
+        self.runs = 0
+        self.skipped_runs = 0
+        self.expired = 0
+        self.last_expired = 0
+        self.last_chunks = 0
+        self.last_duration = 0.0
+        self.last_run_at = None
+        self.errors = 0
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "errors": self.errors,
+            "expired_total": self.expired,
+            "last_expired": self.last_expired,
+            "last_chunks": self.last_chunks,
+            "last_duration_ms": round(self.last_duration * 1000, 3),
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+async def expire_chunk(conn, now, grace=EXPIRY_GRACE_PERIOD, limit=EXPIRY_SWEEP_CHUNK):
+    """Expire up to limit lapsed users in one statement, returns their Telegram user ids."""
+    rows = await conn.execute_query_dict(EXPIRE_USERS_SQL, [now, now - timedelta(seconds=grace), limit])
+    user_ids = [row["user_id"] for row in rows]
+    for uid in user_ids:
+        subscription_cache.invalidate(user_id=uid)
+        notifier.notify(uid, "expired")
+    return user_ids
+
+
+class ExpirySweeper:
+    """
+    Runs sweep() every interval seconds. Only the instance holding the
+    advisory lock sweeps; the others skip the run.
+    """
+
+    def __init__(self, interval=EXPIRY_SWEEP_INTERVAL, grace=EXPIRY_GRACE_PERIOD, chunk=EXPIRY_SWEEP_CHUNK,
+                 lock_key=EXPIRY_SWEEP_LOCK_KEY):
+        self.interval = interval
+        self.grace = grace
+        self.chunk = max(1, chunk)
+        self.lock_key = lock_key
+        self.task = None
+        self.metrics = SweepStats()
+
+    async def start(self):
+        if connections.get("default").capabilities.dialect != "postgres":
+            logger.warning("[EXPIRY] Sweeper needs Postgres, not started")
+            return
+        if self.task is None:
+            self.task = asyncio.create_task(self._loop())
+            logger.info("[EXPIRY] Sweeper started, every %ss with %ss grace", self.interval, self.grace)
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        logger.info("[EXPIRY] Sweeper stopped")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.errors += 1
+                logger.error("[EXPIRY] Sweep failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        """
+        Expire every lapsed user in chunks. Returns the expired Telegram user
+        ids, or None when another instance holds the lock.
+        """
+        start = time.perf_counter()
+        now = datetime.now(UTC)
+        expired = []
+        chunks = 0
+        # The transaction only holds the lock. The chunks run on the pool
+        # (fetched before entering it) and commit on their own.
+        conn = connections.get("default")
+        async with in_transaction() as lock_conn:
+            _, rows = await lock_conn.execute_query("SELECT pg_try_advisory_xact_lock($1) AS locked", [self.lock_key])
+            if not rows[0]["locked"]:
+                self.metrics.skipped_runs += 1
+                logger.debug("[EXPIRY] Another instance is sweeping, skipped")
+                return None
+            while True:
+                user_ids = await expire_chunk(conn, now, self.grace, self.chunk)
+                chunks += 1
+                expired.extend(user_ids)
+                if len(user_ids) < self.chunk:
+                    break
+
+        elapsed = time.perf_counter() - start
+        metrics = self.metrics
+        metrics.runs += 1
+        metrics.expired += len(expired)
+        metrics.last_expired = len(expired)
+        metrics.last_chunks = chunks
+        metrics.last_duration = elapsed
+        metrics.last_run_at = now
+        EXPIRY_SWEEP_SECONDS.observe(elapsed)
+        EXPIRY_SWEEP_EXPIRED.inc(len(expired))
+        EXPIRY_SWEEP_LAST_RUN.set(now.timestamp())
+        if expired:
+            logger.info("[EXPIRY] Expired %s users in %s chunks (%.1f ms)", len(expired), chunks, elapsed * 1000)
+        return expired
+
+
+expiry_sweeper = ExpirySweeper()
@@ -0,0 +1,139 @@
+"""
+Postgres job queue for Stripe events, drained by job_worker.py processes.
+
+A job is one event, keyed by the event's partition (its customer or payment
+intent, see api.webhook.worker.partition_key). Only the oldest unfinished job
+of a partition can be claimed, so one customer's events run in order no
+matter how many workers there are. Claims take a batch of such heads with
+FOR UPDATE SKIP LOCKED and lease them for the visibility timeout; a job whose
+lease ran out (its worker died) is claimed again. Failed jobs are retried
+with backoff until JOB_MAX_ATTEMPTS and then marked dead, which unblocks the
+rest of their partition.
+"""
+import os
+import random
+from datetime import datetime, UTC
+from dotenv import load_dotenv
+from tortoise import connections
+
+from utils.logger import logger
+
+load_dotenv()
+WEBHOOK_JOB_QUEUE = os.getenv("WEBHOOK_JOB_QUEUE", "false").lower() in ("1", "true", "yes")
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 2))
+JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", 600))
+# Class id of the per-partition advisory locks (two-key form, so they never
+# collide with other advisory locks such as the expiry sweeper's).
+JOB_LOCK_CLASS = int(os.getenv("JOB_LOCK_CLASS", 7_300_002))
+
+PENDING = "pending"
+RUNNING = "running"
+DEAD = "dead"
+
+ENQUEUE_SQL = """
+INSERT INTO "webhook_job" ("event_id", "event_type", "partition_key", "payload", "status", "attempts", "available_at", "created_at")
+SELECT j."event_id", j."event_type", j."partition_key", j."payload", 'pending', 0, now(), now()
+FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::text[]) WITH ORDINALITY
+    AS j("event_id", "event_type", "partition_key", "payload", "n")
+ORDER BY j."n"
+ON CONFLICT ("event_id") DO NOTHING
+RETURNING "id"
+"""
+
+CLAIM_SQL = """
+WITH next AS (
+    SELECT j."id" FROM "webhook_job" AS j
+    WHERE j."status" IN ('pending', 'running') AND j."available_at" <= now()
+      AND NOT EXISTS (
+          SELECT 1 FROM "webhook_job" AS p
+          WHERE p."partition_key" = j."partition_key" AND p."id" < j."id" AND p."status" IN ('pending', 'running')
+      )
+    ORDER BY j."available_at", j."id"
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE "webhook_job" AS j
+SET "status" = 'running', "attempts" = j."attempts" + 1,
+    "available_at" = now() + make_interval(secs => $2), "locked_by" = $3
+FROM next
+WHERE j."id" = next."id"
+RETURNING j."id", j."event_id", j."event_type", j."partition_key", j."payload", j."attempts"
+"""
+
+COMPLETE_SQL = 'DELETE FROM "webhook_job" WHERE "id" = ANY($1::bigint[]) AND "locked_by" = $2'
+
+FAIL_SQL = """
+UPDATE "webhook_job"
+SET "status" = CASE WHEN "attempts" >= $3 THEN 'dead' ELSE 'pending' END,
+    "available_at" = now() + make_interval(secs => $4), "last_error" = left($5, 2000), "locked_by" = NULL
+WHERE "id" = $1 AND "locked_by" = $2
+RETURNING "status"
+"""
+
+# A job whose partition is locked elsewhere goes back without using up an attempt.
+RELEASE_SQL = """
+UPDATE "webhook_job"
+SET "status" = 'pending', "attempts" = "attempts" - 1, "available_at" = now() + make_interval(secs => $3), "locked_by" = NULL
+WHERE "id" = $1 AND "locked_by" = $2
+"""
+
+STATS_SQL = """
+SELECT "status", count(*) AS "count", min("created_at") AS "oldest" FROM "webhook_job" GROUP BY "status"
+"""
+
+
+def retry_delay(attempts, base=JOB_RETRY_BACKOFF, cap=JOB_RETRY_BACKOFF_MAX):
+    """Jittered exponential delay in seconds before attempt attempts + 1."""
+    delay = min(cap, base * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+async def enqueue_jobs(jobs):
+    """
+    Queue (event_id, event_type, partition_key, payload) tuples in order.
+    Already queued event ids are ignored. Returns how many were added.
+    """
+    if not jobs:
+        return 0
+    conn = connections.get("default")
+    added, _ = await conn.execute_query(ENQUEUE_SQL, [list(column) for column in zip(*jobs)])
+    return added
+
+
+async def claim_jobs(limit, worker_id, visibility=JOB_VISIBILITY_TIMEOUT):
+    conn = connections.get("default")
+    return await conn.execute_query_dict(CLAIM_SQL, [limit, visibility, worker_id])
+
+
+async def complete_jobs(job_ids, worker_id):
+    if job_ids:
+        conn = connections.get("default")
+        await conn.execute_query(COMPLETE_SQL, [list(job_ids), worker_id])
+
+
+async def fail_job(job, worker_id, error, max_attempts=JOB_MAX_ATTEMPTS):
+    """Schedule a retry of a failed job, or mark it dead after max_attempts. Returns the new status."""
+    conn = connections.get("default")
+    rows = await conn.execute_query_dict(FAIL_SQL, [
+        job["id"], worker_id, max_attempts, retry_delay(job["attempts"]), str(error)])
+    status = rows[0]["status"] if rows else None
+    if status == DEAD:
+        logger.error("[JOBS] Event %s is dead after %s attempts: %s", job["event_id"], job["attempts"], error)
+    elif status:
+        logger.warning("[JOBS] Event %s failed (attempt %s), retrying: %s", job["event_id"], job["attempts"], error)
+    return status
+
+
+async def release_job(job, worker_id, delay=1.0):
+    conn = connections.get("default")
+    await conn.execute_query(RELEASE_SQL, [job["id"], worker_id, delay])
+
+
+async def job_stats():
+    conn = connections.get("default")
+    rows = await conn.execute_query_dict(STATS_SQL)
+    now = datetime.now(UTC)
+    return {row["status"]: {"count": row["count"], "oldest_age_s": round((now - row["oldest"]).total_seconds(), 3)}
+            for row in rows}
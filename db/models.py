@@ -12,6 +12,7 @@ class TelegramUser(models.Model):
     cancel_at_period_end = fields.BooleanField(default=False)
     is_admin = fields.BooleanField(default=False)
     created_at = fields.DatetimeField(auto_now_add=True)
+    banned_at = fields.DatetimeField(null=True, default=None)
     class Meta:
         table = "telegram_user"
 
@@ -77,3 +78,64 @@ class Subscription(StripeTable):
     url = fields.CharField(max_length=256, default=None)
     class Meta:
         table = "subscription"
+
+class ProcessedEvent(models.Model):
+    id = fields.CharField(max_length=128, pk=True)
+    type = fields.CharField(max_length=64, null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    class Meta:
+        table = "processed_event"
+
+class Entitlement(models.Model):
+    user_id = fields.BigIntField(pk=True, generated=False)
+    telegram_user = fields.OneToOneField(
+        "models.TelegramUser",
+        related_name="entitlement",
+        on_delete=fields.CASCADE
+    )
+    active = fields.BooleanField(default=False)
+    ends_at = fields.DatetimeField(null=True, default=None)
+    subscription_id = fields.CharField(max_length=128, null=True)
+    customer_id = fields.CharField(max_length=128, null=True)
+    cancel_at_period_end = fields.BooleanField(default=False)
+    updated = fields.DatetimeField(auto_now=True)
+    class Meta:
+        table = "entitlement"
+
+class NotificationBacklog(models.Model):
+    user_id = fields.BigIntField(pk=True, generated=False)
+    reasons = fields.CharField(max_length=256, default="")
+    attempts = fields.IntField(default=0)
+    next_attempt_at = fields.DatetimeField(index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    class Meta:
+        table = "notification_backlog"
+
+class WebhookJob(models.Model):
+    id = fields.BigIntField(pk=True)
+    event_id = fields.CharField(max_length=128, unique=True)
+    event_type = fields.CharField(max_length=64)
+    partition_key = fields.CharField(max_length=128)
+    payload = fields.TextField()
+    status = fields.CharField(max_length=16, default="pending")
+    attempts = fields.IntField(default=0)
+    available_at = fields.DatetimeField()
+    locked_by = fields.CharField(max_length=64, null=True)
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    class Meta:
+        table = "webhook_job"
+
+class RevenueRollup(models.Model):
+    id = fields.BigIntField(pk=True)
+    source = fields.CharField(max_length=16)
+    day = fields.DateField()
+    currency = fields.CharField(max_length=10)
+    status = fields.CharField(max_length=50)
+    slot = fields.SmallIntField(default=0)
+    count = fields.BigIntField(default=0)
+    amount = fields.BigIntField(default=0)
+    updated = fields.DatetimeField(auto_now=True)
+    class Meta:
+        table = "revenue_rollup"
+        unique_together = (("source", "day", "currency", "status", "slot"),)
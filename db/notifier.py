@@ -0,0 +1,327 @@
+"""
+Push notifications of entitlement changes to the bot.
+
+Write paths call notify(user_id, reason) after they change what a user is
+entitled to. Changes are coalesced per user for NOTIFY_WINDOW_MS and sent in
+batches of up to NOTIFY_BATCH_SIZE users as one POST to NOTIFY_URL:
+
+    {"sent_at": 1760000000, "changes": [{"user_id": 1, "entitled": true, "ends_at": "...",
+     "cancel_at_period_end": false, "subscription_id": "sub_...", "reasons": ["subscription"]}]}
+
+The entitlement state is read when the batch is built, so a coalesced user
+is sent once with its latest state. With NOTIFY_SECRET set the body is signed
+like Stripe does: X-Notify-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of
+"<t>.<body>">.
+
+Deliveries share a keep-alive connection pool, run at most
+NOTIFY_CONCURRENCY at a time and are retried with jittered exponential
+backoff. Batches that still fail, and changes pending at shutdown, go to
+the notification_backlog table and are retried from there until
+NOTIFY_BACKLOG_MAX_ATTEMPTS. Without NOTIFY_URL notify() does nothing.
+"""
+import os
+import hmac
+import json
+import time
+import random
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, UTC
+import httpx
+from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+from tortoise import connections
+
+from utils.logger import logger
+from utils.metrics import NOTIFY_CHANGES, NOTIFY_DELIVERY_SECONDS, NOTIFY_PENDING
+from db.Entitlement import ENTITLEMENT_COLUMNS, is_entitled
+from db.models import Entitlement
+
+load_dotenv()
+NOTIFY_URL = os.getenv("NOTIFY_URL")
+NOTIFY_SECRET = os.getenv("NOTIFY_SECRET")
+NOTIFY_WINDOW_MS = float(os.getenv("NOTIFY_WINDOW_MS", 500))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 100))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", 4))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", 5))
+# In-process attempts per batch before it goes to the backlog.
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", 3))
+NOTIFY_BACKOFF = float(os.getenv("NOTIFY_BACKOFF", 0.5))
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", 300))
+NOTIFY_BACKLOG_INTERVAL = float(os.getenv("NOTIFY_BACKLOG_INTERVAL", 10))
+NOTIFY_BACKLOG_MAX_ATTEMPTS = int(os.getenv("NOTIFY_BACKLOG_MAX_ATTEMPTS", 20))
+NOTIFY_DRAIN_TIMEOUT = float(os.getenv("NOTIFY_DRAIN_TIMEOUT", 10))
+
+# Claimed rows are leased by pushing next_attempt_at into the future; a
+# crashed instance's lease simply runs out. A delivered row is only deleted if
+# its lease is unchanged, so changes recorded meanwhile are kept.
+CLAIM_BACKLOG_SQL = """
+UPDATE "notification_backlog" SET "next_attempt_at" = $2
+WHERE "user_id" IN (
+    SELECT "user_id" FROM "notification_backlog"
+    WHERE "next_attempt_at" <= now()
+    ORDER BY "next_attempt_at"
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING "user_id", "reasons", "attempts"
+"""
+
+SAVE_BACKLOG_SQL = """
+INSERT INTO "notification_backlog" ("user_id", "reasons", "attempts", "next_attempt_at", "created_at")
+SELECT b."user_id", b."reasons", b."attempts", b."next_attempt_at", now()
+FROM unnest($1::bigint[], $2::varchar[], $3::int[], $4::timestamptz[]) AS b("user_id", "reasons", "attempts", "next_attempt_at")
+ON CONFLICT ("user_id") DO UPDATE SET
+    "reasons" = left(excluded."reasons", 256),
+    "attempts" = GREATEST("notification_backlog"."attempts", excluded."attempts"),
+    "next_attempt_at" = LEAST("notification_backlog"."next_attempt_at", excluded."next_attempt_at")
+"""
+
+DELETE_BACKLOG_SQL = """
+DELETE FROM "notification_backlog" AS b
+USING unnest($1::bigint[]) AS d("user_id")
+WHERE b."user_id" = d."user_id" AND b."next_attempt_at" = $2
+"""
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def backoff(attempt, base=NOTIFY_BACKOFF, cap=NOTIFY_BACKOFF_MAX):
+    """Full-jitter exponential backoff in seconds for the given attempt (0 based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def signature(body, secret, timestamp=None):
+    timestamp = timestamp or int(time.time())
+    sig = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={sig}"
+
+
+async def load_changes(batch):
+    """Notification items of batch ({user_id: reasons}) with their current entitlement."""
+    rows = await Entitlement.filter(user_id__in=list(batch)).values(*ENTITLEMENT_COLUMNS)
+    by_user = {row["user_id"]: row for row in rows}
+    now = datetime.now(UTC)
+    changes = []
+    for user_id, reasons in batch.items():
+        row = by_user.get(user_id)
+        changes.append({
+            "user_id": user_id,
+            "entitled": is_entitled(row, now),
+            "ends_at": row["ends_at"] if row else None,
+            "cancel_at_period_end": row["cancel_at_period_end"] if row else False,
+            "subscription_id": row["subscription_id"] if row else None,
+            "reasons": sorted(reasons),
+        })
+    return changes
+
+
+class EntitlementNotifier:
+    def __init__(self, url=NOTIFY_URL, secret=NOTIFY_SECRET, window=NOTIFY_WINDOW_MS / 1000,
+                 batch_size=NOTIFY_BATCH_SIZE, concurrency=NOTIFY_CONCURRENCY, retries=NOTIFY_RETRIES):
+        self.url = url
+        self.secret = secret
+        self.window = window
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.pending = {}
+        self.timer = None
+        self.client = None
+        self.semaphore = None
+        self.deliveries = set()
+        self.backlog_task = None
+        self.running = False
+        self.sent = 0
+        self.batches = 0
+        self.retried = 0
+        self.backlogged = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.url)
+
+    async def start(self):
+        if not self.enabled or self.running:
+            return
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(timeout=NOTIFY_TIMEOUT, limits=limits)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.running = True
+        if connections.get("default").capabilities.dialect == "postgres":
+            self.backlog_task = asyncio.create_task(self._backlog_loop())
+        logger.info("[NOTIFY] Notifier started, posting to %s", self.url)
+
+    async def stop(self):
+        """Send what is pending and wait for in-flight batches; the rest goes to the backlog."""
+        if not self.running:
+            return
+        self.running = False
+        if self.backlog_task is not None:
+            self.backlog_task.cancel()
+            await asyncio.gather(self.backlog_task, return_exceptions=True)
+            self.backlog_task = None
+        self._flush()
+        if self.deliveries:
+            _, unfinished = await asyncio.wait(self.deliveries, timeout=NOTIFY_DRAIN_TIMEOUT)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        await self.client.aclose()
+        self.client = None
+        logger.info("[NOTIFY] Notifier stopped")
+
+    def notify(self, user_id, reason):
+        """Record that user_id's entitlement changed; it is sent after the coalescing window."""
+        if not self.running or user_id is None:
+            return
+        self.pending.setdefault(user_id, set()).add(reason)
+        NOTIFY_PENDING.set(len(self.pending))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, {}
+        NOTIFY_PENDING.set(0)
+        users = list(pending)
+        for start in range(0, len(users), self.batch_size):
+            batch = {u: pending[u] for u in users[start:start + self.batch_size]}
+            self._spawn(self._deliver(batch))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.deliveries.add(task)
+        task.add_done_callback(self.deliveries.discard)
+
+    async def _post(self, batch):
+        body = json.dumps(jsonable_encoder({"sent_at": int(time.time()), "changes": await load_changes(batch)})).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers["X-Notify-Signature"] = signature(body, self.secret)
+        try:
+            response = await self.client.post(self.url, content=body, headers=headers)
+        except Exception as e:
+            raise DeliveryError(f"{type(e).__name__}: {e}")
+        if response.status_code < 300:
+            return
+        retry_after = response.headers.get("Retry-After")
+        retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+        permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+        raise DeliveryError(f"HTTP {response.status_code}", retry_after, permanent)
+
+    async def _send(self, batch, retries):
+        """POST batch with up to retries retries. Returns the last error, or None once delivered."""
+        for attempt in range(retries + 1):
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    await self._post(batch)
+                    NOTIFY_DELIVERY_SECONDS.observe(time.perf_counter() - start)
+                    self.batches += 1
+                    self.sent += len(batch)
+                    NOTIFY_CHANGES.labels("delivered").inc(len(batch))
+                    return None
+                except DeliveryError as e:
+                    error = e
+            if error.permanent or attempt == retries:
+                return error
+            self.retried += 1
+            logger.warning("[NOTIFY] Batch of %s failed (%s), retry %s/%s", len(batch), error, attempt + 1, retries)
+            await asyncio.sleep(error.retry_after or backoff(attempt))
+        return error
+
+    async def _deliver(self, batch, attempts=0):
+        try:
+            error = await self._send(batch, self.retries)
+        except asyncio.CancelledError:
+            error = DeliveryError("cancelled at shutdown")
+        except Exception as e:
+            error = DeliveryError(str(e))
+        if error is None:
+            return
+        if error.permanent:
+            self.dropped += len(batch)
+            NOTIFY_CHANGES.labels("dropped").inc(len(batch))
+            logger.error("[NOTIFY] Batch of %s rejected (%s), dropped", len(batch), error)
+            return
+        logger.error("[NOTIFY] Batch of %s failed (%s), moved to the backlog", len(batch), error)
+        await self._save_backlog(batch, attempts + 1)
+
+    async def _save_backlog(self, batch, attempts):
+        if connections.get("default").capabilities.dialect != "postgres":
+            self.dropped += len(batch)
+            NOTIFY_CHANGES.labels("dropped").inc(len(batch))
+            return
+        retry_at = datetime.now(UTC) + timedelta(seconds=backoff(attempts, NOTIFY_BACKLOG_INTERVAL))
+        conn = connections.get("default")
+        try:
+            await conn.execute_query(SAVE_BACKLOG_SQL, [
+                list(batch), [",".join(sorted(r)) for r in batch.values()], [attempts] * len(batch), [retry_at] * len(batch)])
+        except Exception as e:
+            self.dropped += len(batch)
+            NOTIFY_CHANGES.labels("dropped").inc(len(batch))
+            logger.error("[NOTIFY] Could not save %s changes to the backlog: %s", len(batch), e)
+            return
+        self.backlogged += len(batch)
+        NOTIFY_CHANGES.labels("backlogged").inc(len(batch))
+
+    async def _backlog_loop(self):
+        while True:
+            await asyncio.sleep(NOTIFY_BACKLOG_INTERVAL)
+            try:
+                while await self.replay_backlog() == self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("[NOTIFY] Backlog replay failed: %s", e)
+
+    async def replay_backlog(self):
+        """Send one batch of due backlog rows. Returns how many rows were claimed."""
+        conn = connections.get("default")
+        lease = datetime.now(UTC) + timedelta(seconds=NOTIFY_TIMEOUT * (self.retries + 2) + NOTIFY_BACKOFF_MAX)
+        rows = await conn.execute_query_dict(CLAIM_BACKLOG_SQL, [self.batch_size, lease])
+        if not rows:
+            return 0
+        batch = {row["user_id"]: set(filter(None, row["reasons"].split(","))) for row in rows}
+        attempts = max(row["attempts"] for row in rows)
+        error = await self._send(batch, 0)
+        if error is None:
+            await conn.execute_query(DELETE_BACKLOG_SQL, [list(batch), lease])
+            logger.info("[NOTIFY] Delivered %s changes from the backlog", len(batch))
+        elif error.permanent or attempts >= NOTIFY_BACKLOG_MAX_ATTEMPTS:
+            await conn.execute_query(DELETE_BACKLOG_SQL, [list(batch), lease])
+            self.dropped += len(batch)
+            NOTIFY_CHANGES.labels("dropped").inc(len(batch))
+            logger.error("[NOTIFY] Dropped %s backlog changes after %s attempts (%s)", len(batch), attempts, error)
+        else:
+            await self._save_backlog(batch, attempts + 1)
+            logger.warning("[NOTIFY] Backlog batch of %s failed again (%s)", len(batch), error)
+        return len(rows)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "pending": len(self.pending),
+            "in_flight": len(self.deliveries),
+            "sent": self.sent,
+            "batches": self.batches,
+            "retried": self.retried,
+            "backlogged": self.backlogged,
+            "dropped": self.dropped,
+        }
+
+
+notifier = EntitlementNotifier()
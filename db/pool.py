@@ -0,0 +1,88 @@
+"""
+Tortoise engine: the asyncpg client with an acquire timeout and pool metrics.
+
+Selected with "engine": "db.pool" in tortoise_config.
+"""
+import time
+import asyncio
+
+from tortoise import connections
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.acquire_time = 0.0
+        self.acquire_time_max = 0.0
+
+
+class MeteredPool:
+    """Proxy around asyncpg.Pool that times acquire() and applies the acquire timeout."""
+
+    def __init__(self, pool, acquire_timeout, metrics):
+        self._pool = pool
+        self._acquire_timeout = acquire_timeout
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    async def acquire(self, *, timeout=None):
+        metrics = self.metrics
+        metrics.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=timeout or self._acquire_timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        finally:
+            metrics.waiting -= 1
+        elapsed = time.perf_counter() - start
+        metrics.acquired += 1
+        metrics.acquire_time += elapsed
+        metrics.acquire_time_max = max(metrics.acquire_time_max, elapsed)
+        return connection
+
+
+class MeteredAsyncpgDBClient(AsyncpgDBClient):
+    def __init__(self, *args, **kwargs):
+        acquire_timeout = kwargs.pop("acquire_timeout", None)
+        super().__init__(*args, **kwargs)
+        self.acquire_timeout = float(acquire_timeout) if acquire_timeout else None
+        self.metrics = PoolMetrics()
+
+    async def create_pool(self, **kwargs):
+        pool = await super().create_pool(**kwargs)
+        return MeteredPool(pool, self.acquire_timeout, self.metrics)
+
+
+client_class = MeteredAsyncpgDBClient
+
+
+def pool_stats(connection_name="default"):
+    """In-use, idle and waiting counts plus acquire latency of a connection pool."""
+    client = connections.get(connection_name)
+    pool = getattr(client, "_pool", None)
+    metrics = getattr(client, "metrics", None)
+    if pool is None or metrics is None:
+        return {"initialized": False}
+
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {
+        "initialized": True,
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+        "size": size,
+        "in_use": size - idle,
+        "idle": idle,
+        "waiting": metrics.waiting,
+        "acquired": metrics.acquired,
+        "timeouts": metrics.timeouts,
+        "acquire_avg_ms": round(metrics.acquire_time / metrics.acquired * 1000, 3) if metrics.acquired else 0.0,
+        "acquire_max_ms": round(metrics.acquire_time_max * 1000, 3),
+    }
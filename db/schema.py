@@ -0,0 +1,46 @@
+import os
+from dotenv import load_dotenv
+from tortoise import connections
+from tortoise.exceptions import OperationalError
+
+from utils.logger import logger
+
+load_dotenv()
+# "check" (the default) compares the applied aerich migration with the newest
+# one in migrations/ and refuses to start on a mismatch, so a database older
+# than the code is caught at boot. "generate" runs generate_schemas() on boot,
+# which only creates missing tables: it adds no columns or indexes to existing
+# ones, so use it for throwaway databases only. "none" skips both.
+DB_SCHEMA_MODE = os.getenv("DB_SCHEMA_MODE", "check").lower()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations", "models")
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def latest_migration(path=MIGRATIONS_DIR):
+    """File name of the newest aerich migration, which is what aerich stores as the version."""
+    names = [n for n in os.listdir(path) if n.endswith(".py") and n.split("_", 1)[0].isdigit()]
+    if not names:
+        return None
+    return max(names, key=lambda n: int(n.split("_", 1)[0]))
+
+
+async def applied_migration(app="models"):
+    conn = connections.get("default")
+    try:
+        rows = await conn.execute_query_dict(
+            'SELECT "version" FROM "aerich" WHERE "app" = $1 ORDER BY "id" DESC LIMIT 1', [app])
+    except OperationalError:
+        return None
+    return rows[0]["version"] if rows else None
+
+
+async def check_schema_version():
+    expected = latest_migration()
+    applied = await applied_migration()
+    if applied != expected:
+        raise SchemaVersionError(f"Database schema is at {applied}, this build expects {expected}. Run `aerich upgrade`.")
+    logger.info("[SCHEMA] Database schema is at %s", applied)
@@ -0,0 +1,79 @@
+"""
+Read the raw webhook archive (api/webhook/archive.py).
+
+    python event_archive.py get EVENT_ID
+    python event_archive.py stream OBJECT_ID [--since UNIX_TS] [--all]
+    python event_archive.py stats
+    python event_archive.py reindex
+
+get prints the last archived delivery of an event. stream prints every event
+referencing a customer, payment intent, subscription or other object id in
+event.created order, one JSON payload per line; --all keeps Stripe's
+redeliveries. reindex writes the index of segments a crash left without one;
+it refuses to run while the service holds the directory.
+Pass --dir to read another directory than ARCHIVE_DIR.
+"""
+import os
+import sys
+import json
+import fcntl
+import argparse
+from datetime import datetime, UTC
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from api.webhook.archive import ARCHIVE_DIR, ArchiveReader, EventArchive
+
+
+def received(record):
+    return datetime.fromtimestamp(record.received_at, UTC).isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help=f"archive directory (default {ARCHIVE_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    get = commands.add_parser("get", help="print an archived event")
+    get.add_argument("event_id")
+    stream = commands.add_parser("stream", help="print the events of an object in created order")
+    stream.add_argument("object_id")
+    stream.add_argument("--since", type=int, help="skip events created before this unix time")
+    stream.add_argument("--all", action="store_true", help="include redeliveries of the same event")
+    commands.add_parser("stats", help="segment and index sizes")
+    commands.add_parser("reindex", help="index segments left unsealed by a crash")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"[ARCHIVE] No archive at {args.dir}", file=sys.stderr)
+        return 1
+    if args.command == "reindex":
+        with open(os.path.join(args.dir, ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"[ARCHIVE] {args.dir} is in use by the service", file=sys.stderr)
+                return 1
+            EventArchive(args.dir, enabled=True).recover()
+        return 0
+
+    with ArchiveReader(args.dir) as reader:
+        if args.command == "get":
+            record = reader.get(args.event_id)
+            if record is None:
+                print(f"[ARCHIVE] {args.event_id} not found in {args.dir}", file=sys.stderr)
+                return 1
+            print(f"# received {received(record)}", file=sys.stderr)
+            print(record.payload.decode())
+        elif args.command == "stream":
+            count = 0
+            for record in reader.stream(args.object_id, since=args.since, unique=not args.all):
+                print(record.payload.decode())
+                count += 1
+            print(f"# {count} events for {args.object_id}", file=sys.stderr)
+        else:
+            print(json.dumps(reader.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Worker process for the Postgres job queue (db/jobs.py).
+
+    python job_worker.py [--concurrency 4] [--batch 20] [--visibility 60] [--max-attempts 5] [--drain]
+
+The webhook enqueues events instead of processing them when WEBHOOK_JOB_QUEUE
+is set; any number of these processes, on any number of nodes, then drain the
+queue. Each of the --concurrency slots claims up to --batch partition heads at
+a time and runs them through the same claim_event dedupe and dispatcher as the
+webhook. Before running a job a slot takes the session advisory lock of the
+job's partition, so even a job whose lease expired while its first worker is
+still busy never runs twice at once. A job whose handler raises or reports
+ERROR is unclaimed and retried with backoff, and marked dead after
+--max-attempts. --drain exits once nothing is left to claim, otherwise the
+worker polls until SIGTERM/SIGINT and then finishes the batch at hand.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+
+# The bulk upserts batch writes in the API process' event loop; the worker
+# runs the row-by-row save functions and orders work itself.
+os.environ["BULK_WRITES"] = "false"
+
+from tortoise import Tortoise, connections
+
+from tortoise_config import TORTOISE_ORM
+from api.webhook.event import parse_event
+from api.webhook.stripe_webhook import process_event
+from db.jobs import (JOB_LOCK_CLASS, JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS, PENDING, RUNNING, DEAD,
+                     claim_jobs, complete_jobs, fail_job, release_job, job_stats)
+from db.notifier import notifier
+from utils.logger import logger
+from utils.metrics import ERROR
+
+LOCK_SQL = "SELECT pg_try_advisory_lock($1, hashtext($2))"
+UNLOCK_SQL = "SELECT pg_advisory_unlock($1, hashtext($2))"
+
+
+class JobWorker:
+    def __init__(self, concurrency, batch, visibility, max_attempts, drain, poll_interval=0.5):
+        self.concurrency = concurrency
+        self.batch = batch
+        self.visibility = visibility
+        self.max_attempts = max_attempts
+        self.drain = drain
+        self.poll_interval = poll_interval
+        self.token = f"{socket.gethostname()[:40]}:{os.getpid()}"
+        self.stopping = asyncio.Event()
+        self.done = 0
+        self.failed = 0
+        self.dead = 0
+        self.released = 0
+        self.started = time.monotonic()
+
+    async def run(self):
+        await asyncio.gather(*(self._slot(n) for n in range(self.concurrency)))
+
+    def stop(self):
+        self.stopping.set()
+
+    async def _slot(self, n):
+        worker_id = f"{self.token}:{n}"
+        async with connections.get("default").acquire_connection() as lock_conn:
+            while not self.stopping.is_set():
+                jobs = await claim_jobs(self.batch, worker_id, self.visibility)
+                if not jobs:
+                    if self.drain and not await self._has_work():
+                        return
+                    try:
+                        await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                finished = []
+                for job in jobs:
+                    if await self._run_job(lock_conn, worker_id, job):
+                        finished.append(job["id"])
+                await complete_jobs(finished, worker_id)
+                self.done += len(finished)
+
+    async def _run_job(self, lock_conn, worker_id, job):
+        """Run one claimed job, True when it can be deleted from the queue."""
+        if not await lock_conn.fetchval(LOCK_SQL, JOB_LOCK_CLASS, job["partition_key"]):
+            await release_job(job, worker_id)
+            self.released += 1
+            return False
+        try:
+            try:
+                event = parse_event(job["payload"])
+                outcomes = await process_event(event)
+            except Exception as e:
+                error = repr(e)
+            else:
+                if not outcomes or ERROR not in outcomes:
+                    return True
+                # process_event already released the event for the retry.
+                error = f"{event.type} handler returned {ERROR}"
+            self.failed += 1
+            if await fail_job(job, worker_id, error, self.max_attempts) == DEAD:
+                self.dead += 1
+            return False
+        finally:
+            await lock_conn.fetchval(UNLOCK_SQL, JOB_LOCK_CLASS, job["partition_key"])
+
+    async def _has_work(self):
+        stats = await job_stats()
+        return any(status in stats for status in (PENDING, RUNNING))
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        print(f"[JOBS] {self.token}: {self.done} done, {self.failed} failed, {self.dead} dead, "
+              f"{self.released} released | {self.done / elapsed if elapsed else 0:.0f} events/s", flush=True)
+
+
+async def report_loop(worker, interval):
+    while not worker.stopping.is_set():
+        try:
+            await asyncio.wait_for(worker.stopping.wait(), interval)
+        except asyncio.TimeoutError:
+            worker.report()
+
+
+async def run(args):
+    config = TORTOISE_ORM.copy()
+    config["connections"] = {"default": {**TORTOISE_ORM["connections"]["default"]}}
+    credentials = config["connections"]["default"]["credentials"] = {
+        **TORTOISE_ORM["connections"]["default"]["credentials"]}
+    # One connection per slot is held for the advisory locks, the rest run the jobs.
+    credentials["maxsize"] = max(credentials.get("maxsize") or 0, 2 * args.concurrency + 2)
+    await Tortoise.init(config=config)
+
+    worker = JobWorker(args.concurrency, args.batch, args.visibility, args.max_attempts, args.drain)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    await notifier.start()
+    reporter = asyncio.create_task(report_loop(worker, args.report_interval)) if args.report_interval else None
+    logger.info("[JOBS] Worker %s started with %s slots", worker.token, args.concurrency)
+    try:
+        await worker.run()
+    finally:
+        worker.stop()
+        if reporter is not None:
+            await reporter
+        await notifier.stop()
+        await Tortoise.close_connections()
+    worker.report()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs processed at once (default 4)")
+    parser.add_argument("--batch", type=int, default=20, help="jobs claimed per query (default 20)")
+    parser.add_argument("--visibility", type=float, default=JOB_VISIBILITY_TIMEOUT,
+                        help=f"seconds a claim is held before the job is handed out again (default {JOB_VISIBILITY_TIMEOUT:g})")
+    parser.add_argument("--max-attempts", type=int, default=JOB_MAX_ATTEMPTS,
+                        help=f"attempts before a job is marked dead (default {JOB_MAX_ATTEMPTS})")
+    parser.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+    parser.add_argument("--report-interval", type=float, default=30, help="seconds between stats lines, 0 to disable")
+    args = parser.parse_args()
+    if args.concurrency < 1 or args.batch < 1 or args.max_attempts < 1:
+        parser.error("--concurrency, --batch and --max-attempts must be positive")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
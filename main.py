@@ -2,29 +2,96 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from tortoise import Tortoise
 from tortoise_config import TORTOISE_ORM
+from db.pool import pool_stats
+from db.expiry import EXPIRY_SWEEP_ENABLED, expiry_sweeper
+from db.jobs import WEBHOOK_JOB_QUEUE, job_stats
+from db.notifier import notifier
+from db.schema import DB_SCHEMA_MODE, check_schema_version
 from utils.logger import logger
+from utils.query_counter import instrument_db_client
+from utils.subscription_cache import subscription_cache
+from api.admission import admission, AdmissionMiddleware
+from api.metrics import router as metrics_router, MetricsMiddleware, preallocate_route_metrics
 from api.subscription import router as sub_router
-from api.webhook.stripe_webhook import router as webhook_router
+from api.revenue import router as revenue_router
+from api.webhook.archive import archive
+from api.webhook.stripe_webhook import router as webhook_router, worker_pool
 
 logger.info('Started webhook service')
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    instrument_db_client()
+    preallocate_route_metrics(app)
     await Tortoise.init(config=TORTOISE_ORM)
-    await Tortoise.generate_schemas()
+    if DB_SCHEMA_MODE == "generate":
+        await Tortoise.generate_schemas()
+    elif DB_SCHEMA_MODE == "check":
+        await check_schema_version()
     logger.info("Tortoise ORM initialized")
+    if WEBHOOK_JOB_QUEUE and subscription_cache.enabled:
+        # Webhook writes happen in job_worker processes, which cannot invalidate this process' cache.
+        logger.warning("[CACHE] WEBHOOK_JOB_QUEUE is set, /subscription/check answers are not cached")
+        subscription_cache.ttl = 0
+    archive.start()
+    await notifier.start()
+    await worker_pool.start()
+    if EXPIRY_SWEEP_ENABLED:
+        await expiry_sweeper.start()
     try:
         yield
     finally:
+        await expiry_sweeper.stop()
+        await worker_pool.stop()
+        await notifier.stop()
+        archive.stop()
         await Tortoise.close_connections()
         logger.info("Tortoise ORM connections closed")
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics_router)
 app.include_router(sub_router, prefix="/api")
+app.include_router(revenue_router, prefix="/api")
 app.include_router(webhook_router, prefix="/api")
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    saturation = admission.saturation()
+    pool = worker_pool.stats()
+    queue_saturation = round(pool["queued"] / pool["queue_size"], 3) if pool["queue_size"] else 0.0
+    saturated = saturation >= 1 or queue_saturation >= 1
+    return {"status": "saturated" if saturated else "ok", "saturation": saturation, "queue_saturation": queue_saturation}
+
+
+@app.get("/health/admission")
+async def health_admission():
+    return admission.stats()
+
+
+@app.get("/health/db")
+async def health_db():
+    return pool_stats()
+
+
+@app.get("/health/expiry")
+async def health_expiry():
+    return expiry_sweeper.metrics.stats()
+
+
+@app.get("/health/notify")
+async def health_notify():
+    return notifier.stats()
+
+
+@app.get("/health/archive")
+async def health_archive():
+    return archive.stats()
+
+
+@app.get("/health/jobs")
+async def health_jobs():
+    return {"enabled": WEBHOOK_JOB_QUEUE, "jobs": await job_stats() if WEBHOOK_JOB_QUEUE else {}}
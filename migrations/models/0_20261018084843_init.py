@@ -0,0 +1,115 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "payment" (
+    "id" VARCHAR(128) NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT '1970-01-01T00:00:00+00:00',
+    "updated" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "amount" INT NOT NULL,
+    "currency" VARCHAR(10) NOT NULL,
+    "status" VARCHAR(50) NOT NULL,
+    "description" VARCHAR(128),
+    "statement" VARCHAR(128),
+    "email" VARCHAR(255)
+);
+CREATE TABLE IF NOT EXISTS "charge" (
+    "id" VARCHAR(128) NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT '1970-01-01T00:00:00+00:00',
+    "updated" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "amount" INT NOT NULL,
+    "currency" VARCHAR(10) NOT NULL,
+    "status" VARCHAR(50) NOT NULL,
+    "receipt_url" VARCHAR(256) NOT NULL,
+    "email" VARCHAR(128),
+    "phone" VARCHAR(16),
+    "payment_intent_id" VARCHAR(128) REFERENCES "payment" ("id") ON DELETE SET NULL
+);
+CREATE TABLE IF NOT EXISTS "processed_event" (
+    "id" VARCHAR(128) NOT NULL PRIMARY KEY,
+    "type" VARCHAR(64),
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "telegram_user" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "user_id" BIGINT NOT NULL UNIQUE,
+    "username" VARCHAR(256) UNIQUE,
+    "full_name" VARCHAR(256),
+    "email" VARCHAR(255) UNIQUE,
+    "subscription_status" BOOL NOT NULL DEFAULT False,
+    "date_end" TIMESTAMPTZ,
+    "cancel_at_period_end" BOOL NOT NULL DEFAULT False,
+    "is_admin" BOOL NOT NULL DEFAULT False,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "customer" (
+    "id" VARCHAR(128) NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT '1970-01-01T00:00:00+00:00',
+    "updated" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "name" VARCHAR(128),
+    "email" VARCHAR(128),
+    "phone" VARCHAR(128),
+    "username" VARCHAR(128),
+    "description" VARCHAR(128),
+    "user_id_id" INT REFERENCES "telegram_user" ("id") ON DELETE SET NULL
+);
+CREATE TABLE IF NOT EXISTS "subscription" (
+    "id" VARCHAR(128) NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT '1970-01-01T00:00:00+00:00',
+    "updated" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "status" VARCHAR(64) NOT NULL DEFAULT 'inactive',
+    "started" TIMESTAMPTZ NOT NULL,
+    "ending" TIMESTAMPTZ NOT NULL,
+    "cancel_at_period_end" BOOL NOT NULL DEFAULT False,
+    "url" VARCHAR(256) NOT NULL,
+    "customer_id" VARCHAR(128) REFERENCES "customer" ("id") ON DELETE SET NULL
+);
+CREATE TABLE IF NOT EXISTS "aerich" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "version" VARCHAR(255) NOT NULL,
+    "app" VARCHAR(100) NOT NULL,
+    "content" JSONB NOT NULL
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        """
+
+
+MODELS_STATE = (
+    "eJztXG1P2zoU/itVPzGNTW3oC9u3lpW73gGdoNx7tWmK3MSUiMTpEgdWTfz32c6783JjSG"
+    "lTLCFoj89x7Of47Tw55nfbsnVouu9PboGzhO2Prd9tBCz6gSs5bLXBahXLqQCDhclUtVhn"
+    "4WIHaJhIb4DpQiLSoas5xgobNiJS5JkmFdoaUTTQMhZ5yPjpQRXbS4hvoUMKvv8gYgPp8B"
+    "d0w6+rO/XGgKaeaqqh02czuYrXKyaj7T5lmvRxC1WzTc9CsfZqjW9tFKmT1lDpEiLoAAz1"
+    "RAdo+4KehiK/rUSAHQ9GjdRjgQ5vgGfiRIcroqDZiCJoIOyyLlrgl2pCtMS35GtXOX70ex"
+    "P31VejXfhndHnyeXR5QLTe0L7YxBG+fy6CIsUve2SVAAz8ahi2MZiaAykAKsBZUD+REmxY"
+    "MB/YtCUHsB6Yvg8/PAXuUBDjHY+yEPB298Ow867TJT+tTucj+3nLfref7ocS2OfT88nVfH"
+    "T+lVZvue5PkyE1mk9oicKka056MOA8FFXS+nc6/9yiX1vfZhcTBqTt4qXDnhjrzb+1aZuA"
+    "h20V2Q8q0JNohOJQRFRjB3srnUEu6N2E2V65tk1GrT5D5jqYvQ1xdbDQJDwdND52NLBsD+"
+    "XM4inC+S6ODTgPG750Ez595vrINq13Src37B0fDXrHRIW1JZIMS/w5vZizxTCx+HmOA5G2"
+    "FtlPkjb17CovgFt6X+lU2VY6xbtK5w2Ho4sB9lwRFGOLZmLYr4JhvxjDfgZDB2qQtEr1HF"
+    "MESM6smWgq/UEFOIlWIZ6sLA0otIAhBGVk8CQQgxV6e7O6vtNijOGK4ABFMIwMmolhlWHY"
+    "LR6F3cwgXIG1BRFWyfPYH6HQJde4mcDWNThpUHhzlxvJpNHK4nxqO9BYoi9wzdCekuYCpO"
+    "UN1iAW/upXOI3q2zmQH8MRE0rjVjjgIQqd8wcS6TDpJsSsy1eTeevi+uyszRBeAO3uATi6"
+    "moKaltiKzUki3WyRpVi8BCCwZFDQDtHmh7yD52LbYjxAlpMIyw5LWYmkluQlJC8heQnJSz"
+    "THtfvLS7C/AgtjqP+6DzoykpGRzK5h6LnQEZ3NSRuJZIhksmUCYHJmEs/kyCRhTW58Xch/"
+    "p42exIFvAcwaKPCSIDrApIboeU5iy6UDrGsX7uawrBo8p4eJcNScYMm9RcmsHwfWp18uoQ"
+    "kKpniA7RVXU2Owfdwkh5Dma3KIhAyhU8wmBIyJJBPakkyQZIIkE5rl2v0lE2SSg0xykEkO"
+    "jU1ykHFvvXEvHWHQyn3dWT4sIyOJ5StlWZV+v1LOTb8k56af+0q+Sizs55DnrKYiYXCcrL"
+    "5zWG8nAHZsDbou1Cf3RRFwWuOwNAQOdVV4L0PhfQmFGSICcIb6jVzjBr0KgA56hXjSIu4w"
+    "3XAm4Zno7ktc6TMIAjvXJpftFJubs2jzbG/xks0zzHK9bvx63fQFR1KXkrp8lVtMhrpsBn"
+    "9ECsmGYdzD5/hww4cwgovzhCmTMGvm8ashc6HSsgeRTrsq6MLYSnpw2x7UaP6HSY4X6go6"
+    "hq2rxDk5fI5tmxCggiNKQRWccxekjk35U/RcXN2h49nsLOXL8XTOrXHX5+MJOSEyJxIlw8"
+    "8qyb7CEbwTKO8CZsL24HKI4AUszqyRHMhLXL1K3r15ZtpY8rLPziFbNWWMGzc7ddMqlZeX"
+    "wzbweXvFbAMONFXP3bVrV4XpAFVzPQOvbpVsqCUPoJhZKEz1HBvL/8uZrQbiTlA2PoofFO"
+    "XoaKh0jgbH/d5w2D/uRHBmi8pwHU//otCmlsqcDXsXMuVflg3byL59Qx6sigKZMmrknr2P"
+    "/w/hpUdjTW+3U7xDgl5Xi+ic0oCnoAYZ73BpQqTT+eFkOT2QtKuBINjaAVPyA5IfEJkvhk"
+    "scYxl5t0rK4E2aSUjli/49fAsj/KK/CqkhlKPWRD5jo1lqI7KUa7ftHOohKDksIx1ArCPZ"
+    "hjpn/IbZhnvouIJZ3wmTplLZGwhC6NQQADFQbyaA3U61Wxxl1zgydxDIE/P/QdjfV7OLgi"
+    "09NuGAvEakg991Q8OHLdNw8Y/dhLUERdrr1NYdgndwPvqPx/XkbDbm92RawVgsD7z+7eXx"
+    "DySxqR0="
+)
@@ -0,0 +1,81 @@
+from tortoise import BaseDBAsyncClient
+
+# The indexes are built with CREATE INDEX CONCURRENTLY, so the webhook and
+# /check keep writing to these tables meanwhile. That cannot run in a
+# transaction, nor in a multi-statement script (an implicit transaction), so
+# upgrade() runs them one by one and leaves a no-op for aerich to run.
+RUN_IN_TRANSACTION = False
+
+INDEXES = {
+    "idx_customer_email_lower": 'ON "customer" (lower("email"))',
+    "idx_customer_username_lower": 'ON "customer" (lower("username"))',
+    "idx_customer_user_id": 'ON "customer" ("user_id_id")',
+    "idx_telegram_user_email_lower": 'ON "telegram_user" (lower("email"))',
+    "idx_telegram_user_username_lower": 'ON "telegram_user" (lower("username"))',
+    "idx_telegram_user_date_end": 'ON "telegram_user" ("date_end", "id")',
+    "idx_subscription_customer_updated": 'ON "subscription" ("customer_id", "updated" DESC)',
+    "idx_subscription_customer_active": 'ON "subscription" ("customer_id", "updated" DESC) WHERE "status" = \'active\'',
+}
+
+# A concurrent build that failed leaves an invalid index behind, which IF NOT
+# EXISTS would keep; it is dropped and built again.
+INVALID_INDEX_SQL = """
+SELECT 1 FROM "pg_index" AS i JOIN "pg_class" AS c ON c."oid" = i."indexrelid"
+WHERE c."relname" = $1 AND NOT i."indisvalid"
+"""
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    for name, definition in INDEXES.items():
+        _, invalid = await db.execute_query(INVALID_INDEX_SQL, [name])
+        if invalid:
+            await db.execute_script(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+        await db.execute_script(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" {definition}')
+    return "SELECT 1;"
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_customer_email_lower";
+        DROP INDEX IF EXISTS "idx_customer_username_lower";
+        DROP INDEX IF EXISTS "idx_customer_user_id";
+        DROP INDEX IF EXISTS "idx_telegram_user_email_lower";
+        DROP INDEX IF EXISTS "idx_telegram_user_username_lower";
+        DROP INDEX IF EXISTS "idx_telegram_user_date_end";
+        DROP INDEX IF EXISTS "idx_subscription_customer_updated";
+        DROP INDEX IF EXISTS "idx_subscription_customer_active";"""
+
+
+MODELS_STATE = (
+    "eJztXG1P2zoU/itVPzGNTW3oC9u3lpW73gGdoNx7tWmK3MSUiMTpEgdWTfz32c6783JjSG"
+    "lTLCFoj89x7Of47Tw55nfbsnVouu9PboGzhO2Prd9tBCz6gSs5bLXBahXLqQCDhclUtVhn"
+    "4WIHaJhIb4DpQiLSoas5xgobNiJS5JkmFdoaUTTQMhZ5yPjpQRXbS4hvoUMKvv8gYgPp8B"
+    "d0w6+rO/XGgKaeaqqh02czuYrXKyaj7T5lmvRxC1WzTc9CsfZqjW9tFKmT1lDpEiLoAAz1"
+    "RAdo+4KehiK/rUSAHQ9GjdRjgQ5vgGfiRIcroqDZiCJoIOyyLlrgl2pCtMS35GtXOX70ex"
+    "P31VejXfhndHnyeXR5QLTe0L7YxBG+fy6CIsUve2SVAAz8ahi2MZiaAykAKsBZUD+REmxY"
+    "MB/YtCUHsB6Yvg8/PAXuUBDjHY+yEPB298Ow867TJT+tTucj+3nLfref7ocS2OfT88nVfH"
+    "T+lVZvue5PkyE1mk9oicKka056MOA8FFXS+nc6/9yiX1vfZhcTBqTt4qXDnhjrzb+1aZuA"
+    "h20V2Q8q0JNohOJQRFRjB3srnUEu6N2E2V65tk1GrT5D5jqYvQ1xdbDQJDwdND52NLBsD+"
+    "XM4inC+S6ODTgPG750Ez595vrINq13Src37B0fDXrHRIW1JZIMS/w5vZizxTCx+HmOA5G2"
+    "FtlPkjb17CovgFt6X+lU2VY6xbtK5w2Ho4sB9lwRFGOLZmLYr4JhvxjDfgZDB2qQtEr1HF"
+    "MESM6smWgq/UEFOIlWIZ6sLA0otIAhBGVk8CQQgxV6e7O6vtNijOGK4ABFMIwMmolhlWHY"
+    "LR6F3cwgXIG1BRFWyfPYH6HQJde4mcDWNThpUHhzlxvJpNHK4nxqO9BYoi9wzdCekuYCpO"
+    "UN1iAW/upXOI3q2zmQH8MRE0rjVjjgIQqd8wcS6TDpJsSsy1eTeevi+uyszRBeAO3uATi6"
+    "moKaltiKzUki3WyRpVi8BCCwZFDQDtHmh7yD52LbYjxAlpMIyw5LWYmkluQlJC8heQnJSz"
+    "THtfvLS7C/AgtjqP+6DzoykpGRzK5h6LnQEZ3NSRuJZIhksmUCYHJmEs/kyCRhTW58Xch/"
+    "p42exIFvAcwaKPCSIDrApIboeU5iy6UDrGsX7uawrBo8p4eJcNScYMm9RcmsHwfWp18uoQ"
+    "kKpniA7RVXU2Owfdwkh5Dma3KIhAyhU8wmBIyJJBPakkyQZIIkE5rl2v0lE2SSg0xykEkO"
+    "jU1ykHFvvXEvHWHQyn3dWT4sIyOJ5StlWZV+v1LOTb8k56af+0q+Sizs55DnrKYiYXCcrL"
+    "5zWG8nAHZsDbou1Cf3RRFwWuOwNAQOdVV4L0PhfQmFGSICcIb6jVzjBr0KgA56hXjSIu4w"
+    "3XAm4Zno7ktc6TMIAjvXJpftFJubs2jzbG/xks0zzHK9bvx63fQFR1KXkrp8lVtMhrpsBn"
+    "9ECsmGYdzD5/hww4cwgovzhCmTMGvm8ashc6HSsgeRTrsq6MLYSnpw2x7UaP6HSY4X6go6"
+    "hq2rxDk5fI5tmxCggiNKQRWccxekjk35U/RcXN2h49nsLOXL8XTOrXHX5+MJOSEyJxIlw8"
+    "8qyb7CEbwTKO8CZsL24HKI4AUszqyRHMhLXL1K3r15ZtpY8rLPziFbNWWMGzc7ddMqlZeX"
+    "wzbweXvFbAMONFXP3bVrV4XpAFVzPQOvbpVsqCUPoJhZKEz1HBvL/8uZrQbiTlA2PoofFO"
+    "XoaKh0jgbH/d5w2D/uRHBmi8pwHU//otCmlsqcDXsXMuVflg3byL59Qx6sigKZMmrknr2P"
+    "/w/hpUdjTW+3U7xDgl5Xi+ic0oCnoAYZ73BpQqTT+eFkOT2QtKuBINjaAVPyA5IfEJkvhk"
+    "scYxl5t0rK4E2aSUjli/49fAsj/KK/CqkhlKPWRD5jo1lqI7KUa7ftHOohKDksIx1ArCPZ"
+    "hjpn/IbZhnvouIJZ3wmTplLZGwhC6NQQADFQbyaA3U61Wxxl1zgydxDIE/P/QdjfV7OLgi"
+    "09NuGAvEakg991Q8OHLdNw8Y/dhLUERdrr1NYdgndwPvqPx/XkbDbm92RawVgsD7z+7eXx"
+    "DySxqR0="
+)
@@ -0,0 +1,74 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "entitlement" (
+    "user_id" BIGINT NOT NULL PRIMARY KEY,
+    "active" BOOL NOT NULL DEFAULT False,
+    "ends_at" TIMESTAMPTZ,
+    "subscription_id" VARCHAR(128),
+    "customer_id" VARCHAR(128),
+    "cancel_at_period_end" BOOL NOT NULL DEFAULT False,
+    "updated" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "telegram_user_id" INT NOT NULL UNIQUE REFERENCES "telegram_user" ("id") ON DELETE CASCADE
+);
+INSERT INTO "entitlement" ("user_id", "telegram_user_id", "active", "ends_at", "subscription_id", "customer_id",
+                           "cancel_at_period_end", "updated")
+SELECT t."user_id", t."id", s."id" IS NOT NULL, s."ending", s."id", s."customer_id",
+       COALESCE(s."cancel_at_period_end", false), now()
+FROM "telegram_user" AS t
+LEFT JOIN LATERAL (
+    SELECT sub."id", sub."ending", sub."customer_id", sub."cancel_at_period_end"
+    FROM "customer" AS c
+    JOIN "subscription" AS sub ON sub."customer_id" = c."id" AND sub."status" = 'active'
+    WHERE c."user_id_id" = t."id"
+    ORDER BY sub."updated" DESC, sub."id"
+    LIMIT 1
+) AS s ON true
+ON CONFLICT ("user_id") DO NOTHING;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "entitlement";"""
+
+
+MODELS_STATE = (
+    "eJztXG1v2joU/iuIT5sum4BC6fYNOnrHXQtVS++92jRFJnFp1MRhidMOTf3vs01enZfFEF"
+    "5CLVVtOfYx9mP72OfxsX/VTUuDhvP+/AHYc1j/WPtVR8Ck/3ApjVodLBahnAowmBksqxrm"
+    "mTnYBiom0ntgOJCINOiotr7AuoWIFLmGQYWWSjLqaB6KXKT/cKGCrTnED9AmCd++E7GONP"
+    "gTOv7HxaNyr0NDi1VV1+h3M7mClwsmo/W+YDnp180U1TJcE4W5F0v8YKEgO6kNlc4hgjbA"
+    "UIs0gNbPa6kvWtWVCLDtwqCSWijQ4D1wDRxpcEEUVAtRBHWEHdZEE/xUDIjm+IF8bLXPXl"
+    "atCdu6ykab8G//5vxz/+YNyfWWtsUiHbHqn7GX1F6lvbBCAAarYhi2IZiqDSkACsBJUD+R"
+    "FKybMB3YuCYHsOapvvf/WQduXxDiHY4yH/B660Ov+a7ZIj+1ZvMj+/mL/a6v3w85sE9HV8"
+    "Pbaf/qmhZvOs4PgyHVnw5pSptJl5z0zSnXQ0Ehtf9G0881+rH2dTIeMiAtB89t9o1hvunX"
+    "Oq0TcLGlIOtZAVoUDV/si0jWsIPdhcYgF+zdiNpRdW2djFptgoylN3sr0tWeoYn0tFf5sK"
+    "OBabkoZRaPEE7v4lCB62F9Jd1Gn25oH9mi9a7d6vQ6ZyennTOShdUlkPRy+nM0njJjGDF+"
+    "rm1DpC5F1pOoTjmryg5wi68rzSLLSjN7VWm+5XB0MMCuI4JiqFFNDLtFMOxmY9hNYGhDFZ"
+    "JaKa5tiADJqVUTzXb3tACcJFcmniwtDig0gS4EZaCwFoiehd7frC5vtxhiuCA4QBEMA4Vq"
+    "YlhkGLayR2ErMQgXYGlChBXyfeyPkOuSqlxNYMsanNQpvH9M9WTiaCVxvrBsqM/RF7hkaI"
+    "9IdQFS0war5wtfrwocBeUdHMgv/ojxpWEtbPAcuM7pA4k0mDQTYtbk2+G0Nr67vKwzhGdA"
+    "fXwGtqbEoKYpVtviJEHeZJLZNnkJQGDOoKANotX3eQfXwZbJeIAkJ+GnNXJZiWguyUtIXk"
+    "LyEpKXqE7XHi8vwf4KGEY//+ve6EhPRnoyh4ah60BbdDZHdSSSPpLRmgmAyalJPKMjk7g1"
+    "qf51Jv8dV1qLA98DmCVQ4DlOtIdJCd7zlPiWcxuYdw48zGFZ1HmODxNhrznCkruznFk/8L"
+    "QvvtxAA2RMcQ/bW66kymD7sk0OYYiwjg1ImY56Co0QTW7kMQmQy7gXMiFzIg70+Z8sWnlH"
+    "elsnFlbW7EO7fXLSazdPTs+6nV6ve9YMzFoyKc++DUZ/UxMXWzj8Y79sroF0rv6UsqsZWJ"
+    "YBAco4PQ2UOKhnRGtbrqfoACzOHwwmk8uYPzkYcTiO764GQ7Iys3WZZNJxDN6Iu4I0Zw3e"
+    "JqJWgme/N5t36B57IXImulQJHlqkqMp9ahhwsCKpBTHl1CSeAZ50D2oQq6EsoK1bmkKMiK"
+    "AdzypCWnXOxaosX7vhKD5aYhZ7HpqSudfM3GimqVZqx1mu/yxyZpqBfxL8CYJTi/zajr+9"
+    "c+CLuttpQyvmdJ/3b8/7n4acz72R5xg/6U/xHROhANneo3fWLo+htzB35TG06Nonj6HlMb"
+    "Tc7dASZHi8DI+X4fGVDY+XJ6blMid0hAVHHCLDMlCSWL7S+Jx2t1votkY357ZGNzWYu8gp"
+    "6ur2cYo1FTlADa85HxzWezk6vbYtFToO1IZPWR5wPEcj1wX28yrwSbrCx+IKM0QE4PTzV9"
+    "LGnXYKAHraycSTJnGb6YozCZJFjzAIGzHA5ZntWBxQitHm44SyTTYfmyTtdeXtddUNjqQu"
+    "JXX5KpeYBHVZDf6IJIYxcQe6CSO42GtMmYhaNbdfFZkLhcweRBptqmAXhlqyB/fdgzJqa3"
+    "dRW2KvychXZGTE5k4f7Yi+2rDhhaPoMxEHh2zR6Cdu3BzUGx2xCLMUtoGPQMtmGxKRb4dD"
+    "N2SGAxQNcvR6teoxjo0cZkHeTSr7btKB3bHeLRu2lXX7nnyxIgpkTKmSa/YxvqS369FY0u"
+    "l25n2qLDon1+HJKEH6O1yYEGl0ujuZTw9E9eTtQ8kPvJb5ojukY0w97T2CPHijahJSedB/"
+    "hKcwwgf9RUgNoRi1KvIZYlFqUVI/9uZGOmr+jbg/Y8e99VEt+AQomT5Z3NSHegoZ46U08m"
+    "gYEOaR/EuZNnDL/MsTtB3BOPiISlXJ/S24ZXRqCIDoZa8mgK1msXsteRdbErcyyDemP7b9"
+    "z+1knLHJCVU4IO8QaeA3TVdxo2boDv5+mLDmoEhbHdvM+OC9uer/z+N6fjkZ8LsUWsBg0x"
+    "vmmzL+L78BRnSZvg=="
+)
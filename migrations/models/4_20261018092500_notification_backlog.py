@@ -0,0 +1,60 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "notification_backlog" (
+    "user_id" BIGINT NOT NULL PRIMARY KEY,
+    "reasons" VARCHAR(256) NOT NULL DEFAULT '',
+    "attempts" INT NOT NULL DEFAULT 0,
+    "next_attempt_at" TIMESTAMPTZ NOT NULL,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS "idx_notificatio_next_at_3102a5" ON "notification_backlog" ("next_attempt_at");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "notification_backlog";"""
+
+
+MODELS_STATE = (
+    "eJztXdtu2zgQ/RXDTy02LWwnTtK+2am79Taxi8bZXbQoBFpiHKES5ZWotEaRf1+S1oWiKV"
+    "X0VXIIBLkMZ2TykBpyDofMr6brWdAJXl89AH8Gm28bv5oIuPQXoeSk0QTzeSqnAgymDlM1"
+    "U51pgH1gYiK9B04AiciCgenbc2x7iEhR6DhU6JlE0UazVBQi+78QGtibQfwAfVLw9RsR28"
+    "iCP2EQ/zn/btzb0LEyVbUt+tlMbuDFnMlovd8zTfpxU8P0nNBFqfZ8gR88lKiT2lDpDCLo"
+    "AwwtrgG0flFLY9GyrkSA/RAmlbRSgQXvQehgrsElUTA9RBG0EQ5YE13w03AgmuEH8me7c/"
+    "m0bE3a1qUabcLfvc9XH3qfXxCtl7QtHumIZf+MoqLOsuyJPQRgsHwMwzYF0/QhBcAAeBXU"
+    "d6QE2y6UA5u1FAC2ItPX8S/rwB0LUrzTURYD3my/uWi9arXJV6PVesu+/mDfm+v3QwHsk+"
+    "HN4HbSu/lEH+8GwX8OQ6o3GdCSDpMuBOmLc6GHkoc0/hlOPjTon40v49GAAekFeOazT0z1"
+    "Jl+atE4gxJ6BvB8GsHg0YnEsIqppB4dzi0Gu2Luc2VF1bZOMWmuMnEX09takqyNHw/V0VP"
+    "m0o4HrhUjyFg8RlndxaiD0sL2U7qJPN/SPbNJ61WmfXZxdnp6fXRIVVpdEclHQn8PRhDlD"
+    "zvmFvg+RuVCZT3ib7cwqe8AtO6+0ykwrrfxZpfVSwDHAAIeBCoqpRT0x7JbBsJuPYXcFQx"
+    "+akNTKCH1HBUjBrJ5odrrnJeAkWrl4srIsoNAFthKUicFaIEYe+nBv9fZWiymGc4IDVMEw"
+    "MagnhmWGYTt/FLZXBuEcLFyIsEE+j/1QCl2kxvUEdluDkwaF99+lkUwWrVWc33s+tGfoI1"
+    "wwtIekugCZssEaxcKflg8cJs+rHMhP8YiJpWktfPAjCZ3lA4k0mDQTYtbk28GkMbq7vm4y"
+    "hKfA/P4D+JaRgZqWeB1PkCS6q0VuxxUlAIEZg4I2iFY/5h3CAHsu4wFWOYm47KSQleC1NC"
+    "+heQnNS2heoj5de7y8BPup4Bhj/ee90NGRjI5kqoZhGEBf9W3mbTSSMZJ8zRTAFMw0nvzI"
+    "JGGNNL7O5b+zRmtx4AcAcwsUeEEQHWGyheh5QmLLmQ/cuwBWc1iWDZ6zw0Q5auZY8nBa8N"
+    "b3I+v3Hz9DB+S84hG2t8KTaoPt0y45hAHCNnYgZTqaEhqBLz4pYhKgoHgQMiH3Rezbs995"
+    "tO1t6e2cWFh6szedzunpRad1en7ZPbu46F62Ere2WlTk3/rDP6mLy0wc8bZfPtdAOtd+lK"
+    "xq+p7nQIBydk8TIwHqKbHaVeipOgDL8wf98fg6E0/2hwKOo7ub/oDMzGxeJko2zsDLhSvI"
+    "CtbgbTizLUT2B/N5VY/YS5Ez/FSluGkhMdXr1DThYElSK2IqmGk8EzzpGtQhXsOYQ9/2LI"
+    "M4EUU/nvcI7dWFEKu2fO2Go/hoiVkcRWhG7lozd6EpM63VinO78bPKnmkO/qvgjxGceOTb"
+    "buLtvQNfNtyWDa1M0H3Vu73qvRsIMfdGkePIw/a9bbKom8bhjjdrSiJImdpJUSSJOANjyl"
+    "nokPLIQ0oyaQSkXiqLPM5kf1l8zU22LHefwwcwhu4cS3DMz2rmTPaX19w67IyU2W+FP7ER"
+    "obBGGC4x38/CbTfzTdXXaaXC8bonw+gVONexG60et7fmyWY3SlY7K+mP+eucKL/wcEsbnX"
+    "rHT7I69U6n3unUu+c3v+gjgfpI4Jrzij4SWMEjgTpLbLu7RXSEJWkdKsMyMdJYPtOc5E63"
+    "W4rd6hawW13pAbYymWPLG1ck3lQlaSy92qVyWB8kXeyT75kwCKA1eMyLgLMaJ4UhcKxrwE"
+    "cdCh9LKMwQUYAz1q+ljzs/KwHo+VkunrRIWEzXnEnQvGX1eMtM7rPEaYu50fkuW8zH1v66"
+    "9v667g5HU5eaunyWU8wKdVkP/ogUpucAKroII7j4a7wynFk9l181eRdKuT2ILNpUxS5MrX"
+    "QPHroHdab6/jLV1W7Q0zfn6VMqe72ojL+pKout8iFr/mqsyiFbNuNbGDeVupcsk1UvYRvE"
+    "rPt8tmEl2786dENuOkDZvO+oVyuQ9r1hHkA+s6CT57edPF+xe2X2y4btZN6+Jx9sqAKZMa"
+    "rlnH2MtwfvezRuaXc79wx5Hp1TGPDkPEHHO0KaEGm0PJwspgd4O33jguYHnsv7YgekY1xb"
+    "dgdTEby8mYZUb/Qf4S6M8kZ/GVJDKUetjnyGWpYaT+pn7hmToxbfAvB77IT7zeoFnwIl0y"
+    "OTm/nQlJAxUclJEQ0DUh3Nv2zTB+6Yf3mEfqCYB8+Z1JXc30FYRl8NBRAj9XoC2G6VO9dS"
+    "dLBl5VQG+UT5Pxj563Y8ylnkpCYCkHeINPCrZZv4pOHYAf5WTVgLUKStzixmYvBe3PT+FX"
+    "G9uh73xVUKfUB/01t1NmX8n/4HONR1dA=="
+)
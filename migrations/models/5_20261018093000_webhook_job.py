@@ -0,0 +1,73 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "webhook_job" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "event_id" VARCHAR(128) NOT NULL UNIQUE,
+    "event_type" VARCHAR(64) NOT NULL,
+    "partition_key" VARCHAR(128) NOT NULL,
+    "payload" TEXT NOT NULL,
+    "status" VARCHAR(16) NOT NULL DEFAULT 'pending',
+    "attempts" INT NOT NULL DEFAULT 0,
+    "available_at" TIMESTAMPTZ NOT NULL,
+    "locked_by" VARCHAR(64),
+    "last_error" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS "idx_webhook_job_claim" ON "webhook_job" ("available_at", "id")
+    WHERE "status" IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS "idx_webhook_job_partition" ON "webhook_job" ("partition_key", "id")
+    WHERE "status" IN ('pending', 'running');"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "webhook_job";"""
+
+
+MODELS_STATE = (
+    "eJztXW1v2joU/isonzZdNgEtbbdv0LGNrYVppXfTpikyiUtzmxeWOG3R1P9+bZMQJzhZzG"
+    "tMLVV9sc8J9mPn+JzHx+4fzfFMaAevz2+BP4Ha29ofzQUO+SVTU69pYDpNykkBAmObihqJ"
+    "zDhAPjAQLr0BdgBxkQkDw7emyPJcXOqGtk0KPQMLWu4kKQpd63cIdeRNILqFPq74+QsXW6"
+    "4JH2EQ/zm9028saJupplom+WxarqPZlJaRdr+nkuTjxrrh2aHjJtLTGbr13IU4bg0pnUAX"
+    "+gBBk+kAaV/U07ho3lZcgPwQLhppJgUmvAGhjZgOl0TB8FyCoOWigHbRAY+6Dd0JusV/Nl"
+    "tnT/PeJH2di5Eu/Nv5ev6x8/UFlnpJ+uLhgZiPzyCqas3rnuhDAALzx1BsEzANHxIAdICW"
+    "QX2Ha5DlQD6wac0MwGak+jr+ZRW444IE72SWxYBrzTenjVeNJv6qNRpv6dc/9Lu2+jgUwD"
+    "7qX/auRp3LL+TxThD8tilSnVGP1LRo6SxT+uIkM0KLh9S+9Ucfa+TP2o/hoEeB9AI08ekn"
+    "JnKjHxppEwiRp7vegw5MFo24OC7CoskAh1OTQi44uozaQQ2thmetOXTtWfT2SjLUkaFhRj"
+    "pqfDLQwPFCl/MW913EH+JEITPC1rx0G2O6pn2ki9arVvP49Pjs6OT4DIvQtixKTgvGsz8Y"
+    "UWPIGL/Q96FrzETWE1ZnM6vKDnBLryuNMstKI39VabzM4BgggMJABMVEQ04M22UwbOdj2F"
+    "7C0IcGxK3SQ98WATKjJiearfZJCTixVC6etC4NKHSAJQTlQmElECMLvb+3enPeYoLhFOMA"
+    "RTBcKMiJYZlp2Myfhc2lSTgFMwe6SMefR38IhS5cZTmB3dTkJEHhzR03kkmjtYzze8+H1s"
+    "T9DGcU7T5uLnAN3mSNYuEv8wf2F8+rHMhP8YyJS5NW+OBhETrzJxLuMO4mRLTLV71RbXB9"
+    "caFRhMfAuHsAvqmnoCY1XsvLlCxkl6uclpMtAS6YUChIh0jzY94hDJDnUB5gmZOI6+qFrA"
+    "QrpXgJxUsoXkLxEvIM7eHyEvSngGGM5Z+3o6MiGRXJVA3DMIC+6NvM6igkYyTZlgmAmVFT"
+    "eLIzE4c13Pg6l/9OK63Ege8BzA1Q4AVBdITJBqLnEY4tJz5wrgNYzWlZNnhOTxPhqJlhyc"
+    "NxwVvfjbTff/4KbZDzikfYXmWeJA22T9vkEHouspANCdOhcWgEtrpexCTAjOBeyITcF7Fr"
+    "Tf5m0Ta3pbd1YmFuzd60WkdHp63G0clZ+/j0tH3WWJi15aoi+9btfyAmLrVwxNt++VwDHl"
+    "zrnuPVdD3PhsDN2T1dKGWgHmOtbYWeohOwPH/QHQ4vUvFkt5/BcXB92e3hlZmuy1jIQil4"
+    "mXDFNYMVeBtGbQOR/d5sXtUj9lLkDLtUCW5acFSVn5okHMxJakFMM2oKzwWexAe1sdXQp9"
+    "C3PFPHRkTQjuc9Qln1TIglLV+75iw+WGIWRRGanutr5jqaPFWpPM7Nxs8ie6Y5+C+DP3Th"
+    "yMPfthNv7xz4suE2b2qlgu7zztV5510vE3OvFTkOPGTdWAaNukkcbnsTjRNB8sTqRZGkyy"
+    "joY0ZDhZQHHlLiRSPA7RJx8hiV3WXxaetsWW4/hw8gBJ0p4uCYn9XMqOwur7mx3xUptd8K"
+    "H5EeobBCGM5R343jtp31pup+WqlwXPZkGOWBMwO7lve4OZ8nnd3I8XaW0h/z/Zwov3B/ro"
+    "1KvWMXWZV6p1LvVOrd81tf1JFAdSRwxXVFHQms4JFAlSW22d0iMsMWaR0i03KhpLB8pjnJ"
+    "rXa7FLvVLmC32twDbGUyx+Y3rnCsqUjSWHK1S+Ww3ku62BffM2AQQLN3nxcBpyXqhSFwLK"
+    "vDexUKH0ooTBERgDOWl9LGnRyXAPTkOBdPUpVxpiVnEhRvWT3eMpX7zDHa2dzofJOdzcdW"
+    "9lp6ey27wVHUpaIun+USs0RdysEf4crkHEBFnTCMi7/CK8Ooyel+SfIulDJ70DVJVwWHMN"
+    "FSI7jvEVSZ6rvLVBe7QU/dnKdOqez0ojL2pqo0tsKHrNmrsSqHbNmM78y8qdS9ZKmseg7b"
+    "kM26z2cblrL9q0M35KYDlM37jka1Amnfa+YB5DMLKnl+08nzFbtXZrds2FbW7Rv8wbookC"
+    "klKdfsQ7w9eNezcUO727lnyPPonMKAJ+cJKt7JpAnhTvPDyWJ6gNVTNy4ofuC5vC9WgAfG"
+    "sXh3MBXBy6opSNVG/wHuwghv9JchNYRy1GTkM8Sy1FhSP3XPGB+1+BaAv2OXud9MLvgEKJ"
+    "lvcHzreXefvLHGIWSY2noRHfMwl9P/iwQrQ8YU8Qny8TF7PoZPczEFaWxW55kn2mSBFE2H"
+    "TGvJucOy+Q35KfCxpSYx7R0UOme0pCgnotu53xvMbA9wXvQRfMyxpoyKLEAWeZa976OUUx"
+    "nD9eKy8/1lyrG8GA4+xOIMvOcXw66Up7i0aZLpUNH/A6UuMhE/ignugUX7skJYmdWVM7CU"
+    "JJAsRXDZnnGH4/yx0IqXUpJyc2Lz7oMNAqRD3/c4sXb+YpfWkgTKXS93isZ6njTWNjNIOt"
+    "C3jFuNQ1VENfUimgIkMpVhKA6Inthausg99APBY/uMiizhyA52kcmrIQBiJC4ngM1GuWs4"
+    "iu7hWLpEAn8i//+hfroaDnIWs0QlA+S1izv407QMVK/ZVoB+VRPWAhRJr4v9hqyLkFmNyA"
+    "O6614CvO7y8vQ/3fTGIw=="
+)
@@ -0,0 +1,86 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "revenue_rollup" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "source" VARCHAR(16) NOT NULL,
+    "day" DATE NOT NULL,
+    "currency" VARCHAR(10) NOT NULL,
+    "status" VARCHAR(50) NOT NULL,
+    "slot" SMALLINT NOT NULL DEFAULT 0,
+    "count" BIGINT NOT NULL DEFAULT 0,
+    "amount" BIGINT NOT NULL DEFAULT 0,
+    "updated" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT "uid_revenue_rol_source_702822" UNIQUE ("source", "day", "currency", "status", "slot")
+);
+CREATE INDEX IF NOT EXISTS "idx_payment_created_at" ON "payment" ("created_at");
+CREATE INDEX IF NOT EXISTS "idx_charge_created_at" ON "charge" ("created_at");
+-- Placeholder intents used to be dated a year back and kept that date once their
+-- real event arrived; date them like their first charge. The placeholder was
+-- stamped now() - 365 days right before the charge that created it was stamped
+-- now(), so those rows sit 365 days (plus the write time) before their first
+-- charge. The window of a day around that keeps out real intents that were
+-- charged a long time after they were created.
+UPDATE "payment" AS p SET "created_at" = c."created_at"
+FROM (SELECT "payment_intent_id", min("created_at") AS "created_at" FROM "charge" GROUP BY 1) AS c
+WHERE c."payment_intent_id" = p."id"
+  AND p."created_at" > c."created_at" - INTERVAL '366 days'
+  AND p."created_at" <= c."created_at" - INTERVAL '364 days';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_payment_created_at";
+        DROP INDEX IF EXISTS "idx_charge_created_at";
+        DROP TABLE IF EXISTS "revenue_rollup";"""
+
+
+MODELS_STATE = (
+    "eJztXW1v2joY/StVPm26bKK0tN2+Qcc2thamlt1Nm6bIJC7NbYhZ4rRFU//7tUNenOBkMQ"
+    "SIqaWqL7afYB87fnyOH7t/tCkyoe29Pr8F7gRqbw/+aA6Y0l8yOY0DDcxmSTpNwGBsB0WN"
+    "pMzYwy4wMEm9AbYHSZIJPcO1ZthCDkl1fNumicggBS1nkiT5jvXbhzpGE4hvoUsyfv4iyZ"
+    "ZjwkfoRX/O7vQbC9pmqqqWST87SNfxfBak0Xq/D0rSjxvrBrL9qZOUns3xLXLi4qQ2NHUC"
+    "HegCDE2mAbR+YUujpEVdSQJ2fRhX0kwSTHgDfBszDS6JgoEciqDlYC9o4hQ86jZ0JviW/H"
+    "nYOntatCZp66IYbcK/navzj52rF6TUS9oWRDpi0T+DMKu1yHsKHgIwWDwmwDYB03AhBUAH"
+    "eBnUdyQHW1PIBzZtmQHYDE1fR7+sAneUkOCdjLIIcO3wzWnzVfOQfB00m2+Dr3+C79rq/V"
+    "AA+6h/2bsedS6/0MdPPe+3HSDVGfVoTitInWdSX5xkeih+yMG3/ujjAf3z4Mdw0AuARB6e"
+    "uMEnJuVGPzRaJ+BjpDvoQQcmi0aUHCWRokkH+zMzgFywdxmzvepajYxac+jY8/DtlaSrw4"
+    "mG6emw8klHgynyHc5b3Hcwv4sTg0wPW4vUTfTpmvNj4LRetQ6PT4/Pjk6Oz0iRoC5xymlB"
+    "f/YHo2AyZCY/33WhY8xF/AlrU41X2QJuab/SLONWmvlepfkyg6OHAfY9ERQTCzkxbJfBsJ"
+    "2PYXsJQxcakNRK911bBMiMmZxottonJeAkpXLxDPLSgMIpsISgjA1WAjGcoXf3Vle3Wkww"
+    "nBEcoAiGsYGcGJYZhof5o/BwaRDOwHwKHayTzwt+CFEXrrGcwFY1OCkpvLnjMpk0Wss4v0"
+    "cutCbOZzgP0O6T6gLH4A3WkAt/WTywHz+vdiA/RSMmSk1q4YKHmDrzBxJpMGkmxEGTr3uj"
+    "g8HXiwstQHgMjLsH4Jp6Cmqag1ookxKXXc6atqbZFOCASQAFbRCtfqQ7+B5G00AHWNYkor"
+    "xGoSrBllK6hNIllC6hdAl5unZ/dYngp8DEGJV/3gsdxWQUk6kbhr4HXdG3mbVRSEZIsjUT"
+    "ADNjpvBkRyahNVx+nat/p41W0sB3AGYFEngBiQ4xqYA9jwi3nLhg+tWD9RyWZclzepgIs2"
+    "ZGJffHBW99N7R+//kK2iDnFQ+xvc48SRpsnzapIfQcbGEbUqVD48gIbHajSEmAmYI7ERNy"
+    "X8SuNfnbjFbdlt7GhYXFbPam1To6Om01j07O2senp+2zZjytLWcVzW/d/gc6xaUcR7Ttl6"
+    "81kM617jmrmi5CNgROzu5pbJSBekysNkU9RQdgef2gOxxepPhkt5/BcfD1stsjnjnwy6SQ"
+    "hVPwMnTFMb0VdBvGrAJmv7M5r+6MvZQ4w7oqwU0LjqlapyYBBwuRWhDTjJnCM8aTrkFtMm"
+    "voM+hayNTJJCI4j+c9Qs3qGYolrV675ijeW2EWhwxNz11r5i40eaZSrTir5c8ie6Y5+C+D"
+    "P3TgCJFvm+HbWwe+LN3mDa0U6T7vXJ933vUynHst5jhA2LqxjIB1Ux5uo4nGYZC8Yo0iJu"
+    "kwBvqYsVCUcs8pJXEaHqmXyCKPMdleFJ+2zpbl5mP4AMZwOsMcHPOjmhmT7cU1N3frkVL7"
+    "rfAR6yEKK9Bwjvl2Fm6b8Td1X6eVouOyB8OoFTjTsWutHqtb86SjGzmrnaXwx/x1ThhfuL"
+    "uljQq9Y52sCr1ToXcq9O75+Rd1JFAdCVzRr6gjgTU8EqiixKrdLaIjLA7rEBmWsZHC8pnG"
+    "JLfa7VLqVrtA3WpzD7CViRxb3LjCmU1FgsaSq11qh/VOwsW+uMiAngfN3n0eA06XaBRS4K"
+    "isDu8VFd4XKhwgIgBnVF7KOe7kuASgJ8e5eNKszGJaciVB6Zb10y2v6Pzqwytk2/6MN2un"
+    "CxRO2u6iqO4mZSuds39qHvLdxa69CQJ+yHLFhPF4NsLar3Wm+KI93LLbt2HPq93bpNdKs4"
+    "TYQk7yWv3NF+F4X570c0gr4MknqZm+njgW4EZnaiUvaUpeqqe8FDidJQSvp8C2c11JZCNT"
+    "ZMVR6/Qkdh/0jyKHcX3ZubjgyMJ8Ib3I6xrbl9LXx2orjvfvGxRFuO5ij0I6YOXd4lOcK9"
+    "nLqwnlSh035TCu7HHUfMKVPQKrJDLpJTLZNR4VLaKiRZ6vh5GPU5HM5Oh1TXVvgou7wivD"
+    "mMm5+pLkXSg17UHHpE0V7MLESvXgrntQHQ7e3uFgsUvL1WXl6mKArd4NzV4OnMZW+F4r9j"
+    "bi2iFb9pBtZtzU6iro1EFmjtqQPeicrzYsHbCuj9ywR3u1a4Ze5ysL6rzyBvXhOlzluV01"
+    "bCN++4Z8sC4KZMpISp+9j/+wZdujsaKA4txru/LknELCk/MExXeywS0Y8ulksTzA2qlL7p"
+    "Q+8FzeF8sjHTO1eNfeFsHLmilIVWz1Hu7CCMdWlxE1hI4FyahniB0MYkX91NXOfNSii9f+"
+    "jl3mSmm54BOQZL7B8S1Cd5/QWOMIMkxuo0iOeViU0/8LC9ZGjFGx8xXGzgfH3wRlbNbmmQ"
+    "faZIEUPYGWtpJzh6X6DfkZcMlMTTntHRSKvV8ylBPRzfxLJTC3EeC86CP4mDObMiayAFm0"
+    "sux9H6UWlRFcLy4731+mFpYXw8GHqDgD7/nFsCvlyQZtlkQ61PQAkro7Uvz2G3APrKAtK9"
+    "DKrK2cxFISIllK4LKRcUd4/ljI46WMpNycqH75YAMP69B1EYdr5zu7tJUkUG7b3SkZ63nK"
+    "WJuMIOlA1zJuNY5UEeY0imQKkJSpjUKxR/LExsJF7qHrCd6UxpjIQke2sItMXw0BEMPicg"
+    "J42Cx3NL3obPrSwWryiZirMH+6Hg5ynFlikgHyq0Ma+NO0DNw4sC0P/6onrAUo0lYXrxuy"
+    "S4SMN6IP6K77f1fWdS9P/wNKEgbw"
+)
@@ -0,0 +1,60 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "telegram_user" ADD "banned_at" TIMESTAMPTZ;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "telegram_user" DROP COLUMN "banned_at";"""
+
+
+MODELS_STATE = (
+    "eJztXW1P2zoU/isonzbdbiqFAtu3lnVbN2gn6O6mTVPkJqbkkpcucYBq4r9f282LkzpZ3N"
+    "e4WEK82Oek9mPnHJ/Hx+aP5ngmtIPX57fAn0Dt7cEfzQUO+SVX0zjQwHSalpMCBMY2FTVS"
+    "mXGAfGAgXHoD7ADiIhMGhm9NkeW5uNQNbZsUegYWtNxJWhS61u8Q6sibQHQLfVzx8xcutl"
+    "wTPsIg/nN6p99Y0DYzTbVM8tm0XEezKS0j7X5PJcnHjXXDs0PHTaWnM3TruYk4bg0pnUAX"
+    "+gBBk+kAaV/U07ho3lZcgPwQJo000wIT3oDQRkyHK6JgeC5B0HJRQLvogEfdhu4E3eI/D1"
+    "tnT/PepH2di5Eu/Nu5Ov/YuXqBpV6Svnh4IObjM4iqWvO6J/oQgMD8MRTbFEzDhwQAHaBF"
+    "UN/hGmQ5kA9sVjMHsBmpvo5/WQbuuCDFO51lMeDa4ZvT5qvmIf46aDbf0q9/6Hdt+XEogX"
+    "3Uv+xdjzqXX8jjnSD4bVOkOqMeqWnR0lmu9MVJboSShxx8648+HpA/D34MBz0KpBegiU8/"
+    "MZUb/dBIm0CIPN31HnRgsmjExXERFk0HOJyaFHLB0WXU9mpoNTxrzaFrz6K3V5KhjgwNM9"
+    "JR49OBBo4Xupy3uO8i/hCnCrkRtualmxjTFe0jdVqvWofHp8dnRyfHZ1iEtiUpOS0Zz/5g"
+    "RI0hY/xC34euMRPxJ6zOerzKFnDL+pVmFbfSLPYqzZc5HAMEUBiIoJhqyIlhuwqG7WIM2w"
+    "sY+tCAuFV66NsiQObU5ESz1T6pACeWKsST1mUBhQ6whKBMFJYCMbLQu3ur17daTDGcYhyg"
+    "CIaJgpwYVpmGh8Wz8HBhEk7BzIEu0vHn0R9CoQtXWU5g1zU5SVB4c8eNZLJoLeL83vOhNX"
+    "E/wxlFu4+bC1yDN1mjWPjL/IH95Hm1A/kpnjFxadoKHzwkoTN/IuEO425CRLt83RsdDL5e"
+    "XGgU4TEw7h6Ab+oZqEmN1/JyJYnsYpXTcvIlwAUTCgXpEGl+zDuEAfIcygMschJxXaOUlW"
+    "ClFC+heAnFSyheQp6h3V9egv4UMIyx/PNe6KhIRkUydcMwDKAv+jazOgrJGEm2ZQJg5tQU"
+    "nuzMxGENN74u5L+zSktx4DsAcw0UeEkQHWGyhuh5hGPLiQ+crwGs57SsGjxnp4lw1Myw5O"
+    "G45K3vRtrvP19BGxS84hG217knSYPt0yY5hJ6LLGRDwnRoHBqBrW6UMQkwJ7gTMqHwRexa"
+    "k79ZtPVt6W2cWJhbszet1tHRaat5dHLWPj49bZ81E7O2WFVm37r9D8TEZRxHvO1XzDXgwb"
+    "XuOauarufZELgFu6eJUg7qMdbaVOgpOgGr8wfd4fAiE092+zkcB18vuz3smalfxkIWysDL"
+    "hCuuGSzB2zBqa4jsd2bz6h6xVyJnWFcluGnBUVXr1DThYE5SC2KaU1N4JniSNaiNrYY+hb"
+    "7lmTo2IoJ2vOgRyqrnQixp+doVZ/HeErMoitD0wrVm4UKTpyrVinO98bPInmkB/ovgD104"
+    "8vC3zcTbWwe+arjNm1qZoPu8c33eedfLxdwrRY4DD1k3lkGjbhKH295E40SQPLFGWSTpMg"
+    "r6mNFQIeWeh5TYaQS4XSKLPEZle1l82ipblpvP4QMIQWeKODgWZzUzKtvLa27u1iNl9lvh"
+    "I9IjFJYIwznq21m4bcbf1H2dVikclz0ZRq3AmYFdafW4vjVPNruRs9pZSH8sXudE+YW7W9"
+    "qo1DvWyarUO5V6p1Lvnp9/UUcC1ZHAJf2KOhJYwyOBKktsvbtFZIYlaR0i0zJRUlg+05zk"
+    "Vrtdid1ql7Bbbe4BtiqZY/MbVzjWVCRpLL3apXZY7yRd7IvvGTAIoNm7L4qAsxKN0hA4lt"
+    "XhvQqF9yUUpogIwBnLS2njTo4rAHpyXIgnqcotpiVnEhRvWT/e8orY1xBeebYdTnlWOytQ"
+    "arT9uajup7Jrtdk/tcAL/fmuvQlofMjGimnEE9ge0n6tYuLL9nCrbt9GI692b9NRqxwlJB"
+    "pyBq/rv/kimu+LRr8gaAU8+iRj6euJYwluxFIreklT9FI96SXqdBYQvHaAbRe6klhHpsyK"
+    "o9bpSeI+yB9lDuP6snNxwaGF+UR6mdc1tk+lr47VVhzv3zcoynDdxR6FdMDKu8WnYq50L6"
+    "8mIVfmuCkn4sofRy0OuPJHYBVFJj1FJjvHo7JFVLbI8/Uw8sVUuDI9el1T3hvj4i/xyjBq"
+    "cq6+JHkXKpk96Jqkq4JDmGqpEdz1CKrDwds7HCx2abm6rFxdDLDVu6HZy4Gz2Arfa8XeRl"
+    "w7ZKsess3Nm1pdBZ05yMxhG/IHnYvZhoUD1vWhG/Zor3bF1OtiZkGdV94gP1yHqzy3y4Zt"
+    "xG/f4A/WRYHMKEnps/fxH7ZsezauKaG48NquIjqnNOApeIKKd/LJLQjyw8lyeoDVU5fcKX"
+    "7gubwvVoAHxrF4196WwcuqKUhVbvUe7sIsmqUxcN2lxjWjqLzLDrzLcoe7CrkpodNdMtJS"
+    "Yue72L2ZzA3dfNTi+/P+jl3uZnC54BNg1r7B8a3n3X3yxhqHV2NqG2Ws2sNcTv8vEqwNp6"
+    "aOQKzxCAQ9xSi4G8HqPPN8qTyQogcJs1pybpStP69iCnxsqQk1cQeFjlAsKMqJ6Gb+MxaY"
+    "2R7gvOgj+FhgTRkVWYAsW1r2vo8yq8oYrheXne8vMyvLi+HgQyzOwHt+MexKeUBFm6YJKz"
+    "U9R6auABW/xAjcA4v2ZYkoMq8rJz8geyTJjqbtGXc4rh8LebyMkpR7TOtfPtggQDr0fY8T"
+    "axc7u6yWJFBu290pNnKP2MiaHDvqQN8ybjUOVRHVNMpoCpDK1Iah2CN6YmNZP/fQDwQvvG"
+    "NUZAlHtpAMQF4NARAjcTkBPGxWu2Gg7IqBhfPx+BMRl2H+dD0cFDizVCUH5FcXd/CnaRmo"
+    "cWBbAfpVT1hLUCS9Ll835JcIOW9EHtBd9d/nrOpenv4HIHWXxQ=="
+)
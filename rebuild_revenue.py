@@ -0,0 +1,58 @@
+"""
+Rebuild or check the daily revenue rollups (db/Revenue.py) from the payment
+and charge tables.
+
+    python rebuild_revenue.py [--source payment|charge] [--chunk-days 31] [--check]
+
+Walks each table in chunks of --chunk-days days of created_at. Every chunk is
+compared with its rollups and then recomputed in its own short transaction,
+which briefly holds back the webhook writers of rollups, so it can run
+against a live service and is also how the rollups are filled the first
+time. --check only reports and exits with 1 when a mismatch was found, so it
+can run from cron.
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from tortoise import Tortoise
+
+from tortoise_config import TORTOISE_ORM
+from db.Revenue import SOURCES, rebuild_source
+
+
+async def run(args):
+    await Tortoise.init(config=TORTOISE_ORM)
+    mismatches = 0
+    try:
+        for source in args.source or SOURCES:
+            def report(start, end, found):
+                print(f"[REVENUE] {source} {start}..{end}: {found} mismatched buckets", flush=True)
+
+            result = await rebuild_source(source, args.chunk_days, args.check, report if args.verbose else None)
+            mismatches += result["mismatches"]
+            action = "checked" if args.check else "rebuilt"
+            print(f"[REVENUE] {source}: {result['days']} days {action} in {result['chunks']} chunks, "
+                  f"{result['mismatches']} mismatched buckets, {result['rebuilt']} repaired")
+    finally:
+        await Tortoise.close_connections()
+    return 1 if args.check and mismatches else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", action="append", choices=SOURCES, help="table to process (default both)")
+    parser.add_argument("--chunk-days", type=int, default=31, help="days per transaction (default 31)")
+    parser.add_argument("--check", action="store_true", help="only compare, do not rewrite")
+    parser.add_argument("--verbose", action="store_true", help="print every chunk")
+    args = parser.parse_args()
+    if args.chunk_days < 1:
+        parser.error("--chunk-days must be positive")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
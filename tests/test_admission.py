@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from api.admission import AdmissionController, AdmissionMiddleware, RouteLimiter, parse_limits
+from utils.query_counter import db_latency
+
+
+@pytest.fixture
+def latency(monkeypatch):
+    """Set the DB round-trip average the limiters see, in seconds."""
+    def set_latency(seconds):
+        monkeypatch.setattr(db_latency, "value", seconds)
+    set_latency(0.0)
+    return set_latency
+
+
+def test_parse_limits_skips_bad_entries():
+    assert parse_limits("/a=4, /b=x,/c=0,=3,/d=2,") == {"/a": 4, "/d": 2}
+
+
+def test_over_the_limit_is_rejected(latency):
+    limiter = RouteLimiter("/test/reject", 2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+    assert limiter.stats()["admitted"] == 3 and limiter.stats()["rejected"] == 1
+    assert limiter.saturation == 1.0
+
+
+def test_slow_db_cuts_the_limit_once_per_interval(latency):
+    limiter = RouteLimiter("/test/decrease", 100, min_ratio=0.5, target=0.05, decrease=0.5, decrease_interval=60)
+    latency(0.2)
+    for _ in range(3):
+        limiter.try_acquire()
+        limiter.release()
+    assert limiter.stats()["limit"] == 50
+
+    limiter.last_decrease -= 60
+    limiter.try_acquire()
+    limiter.release()
+    # Never below the floor.
+    assert limiter.stats()["limit"] == limiter.min_limit == 50
+
+
+def test_limit_grows_back_by_one_per_limit_of_requests(latency):
+    limiter = RouteLimiter("/test/increase", 20, min_ratio=0.1, target=0.05, decrease=0.5, decrease_interval=0)
+    latency(0.2)
+    limiter.try_acquire()
+    limiter.release()
+    assert limiter.stats()["limit"] == 10
+
+    latency(0.01)
+    for _ in range(11):
+        limiter.try_acquire()
+        limiter.release()
+    assert limiter.stats()["limit"] == 11
+    for _ in range(200):
+        limiter.try_acquire()
+        limiter.release()
+    assert limiter.stats()["limit"] == 20
+
+
+def test_middleware_answers_503_over_the_limit(latency, monkeypatch):
+    monkeypatch.setattr("api.admission.ADMISSION_ENABLED", True)
+    controller = AdmissionController({"/limited": 1})
+    release = asyncio.Event()
+    sent = []
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = AdmissionMiddleware(app, controller)
+
+    async def request(path):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await middleware({"type": "http", "path": path}, None, send)
+        sent.append((path, messages[0]["status"]))
+
+    async def scenario():
+        first = asyncio.create_task(request("/limited"))
+        await asyncio.sleep(0)
+        await request("/limited")
+        release.set()
+        await request("/other")
+        await first
+
+    asyncio.run(scenario())
+    assert sent == [("/limited", 503), ("/other", 200), ("/limited", 200)]
+    assert controller.limiters["/limited"].in_flight == 0
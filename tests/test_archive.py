@@ -0,0 +1,87 @@
+import os
+import json
+
+from api.webhook.archive import BLOCK_HEADER, ArchiveReader, EventArchive, segment_path
+from api.webhook.event import parse_event
+
+
+def _payload(n, customer="cus_1"):
+    return json.dumps({"id": f"evt_{n}", "type": "invoice.paid", "created": 1_700_000_000 + n,
+                       "data": {"object": {"id": f"in_{n}", "customer": customer}}}).encode()
+
+
+def _crashed_segment(directory, blocks):
+    """Write blocks of payloads to segment 1 like the writer thread, then stop without sealing it."""
+    archive = EventArchive(directory=str(directory), enabled=True)
+    archive._open_segment()
+    offsets = []
+    for payloads in blocks:
+        offsets.append(archive.file.tell())
+        archive._write_block([(0.0, parse_event(p), p) for p in payloads])
+    archive.file.close()
+    return segment_path(str(directory), 1), offsets
+
+
+def _event_ids(records):
+    return [json.loads(record.payload)["id"] for record in records]
+
+
+def test_sealed_segments_serve_lookups_and_streams(tmp_path):
+    archive = EventArchive(directory=str(tmp_path), enabled=True, block_events=2, flush_interval=0.01)
+    archive.start()
+    for n in (3, 1, 2):
+        archive.append(parse_event(_payload(n)), _payload(n))
+    archive.append(parse_event(_payload(9, "cus_2")), _payload(9, "cus_2"))
+    archive.append(parse_event(_payload(1)), _payload(1))
+    archive.stop()
+
+    with ArchiveReader(str(tmp_path)) as reader:
+        assert reader.stats()["sealed"] == 1
+        assert json.loads(reader.get("evt_2").payload)["id"] == "evt_2"
+        assert reader.get("evt_404") is None
+        assert _event_ids(reader.stream("cus_1")) == ["evt_1", "evt_2", "evt_3"]
+        assert _event_ids(reader.stream("cus_1", unique=False)) == ["evt_1", "evt_1", "evt_2", "evt_3"]
+        assert _event_ids(reader.stream("cus_1", since=1_700_000_002)) == ["evt_2", "evt_3"]
+        assert _event_ids(reader.stream("in_9")) == ["evt_9"]
+
+
+def test_unsealed_segment_is_scanned(tmp_path):
+    _crashed_segment(tmp_path, [[_payload(1), _payload(2)]])
+    with ArchiveReader(str(tmp_path)) as reader:
+        assert reader.stats()["sealed"] == 0
+        assert _event_ids(reader.stream("cus_1")) == ["evt_1", "evt_2"]
+
+
+def test_recovery_cuts_off_a_torn_tail(tmp_path):
+    path, _ = _crashed_segment(tmp_path, [[_payload(1)], [_payload(2)], [_payload(3)]])
+    size = os.path.getsize(path)
+    os.truncate(path, size - 5)
+
+    archive = EventArchive(directory=str(tmp_path), enabled=True)
+    archive.recover()
+
+    assert os.path.exists(segment_path(str(tmp_path), 1, ".idx"))
+    with ArchiveReader(str(tmp_path)) as reader:
+        assert _event_ids(reader.stream("cus_1")) == ["evt_1", "evt_2"]
+        assert reader.get("evt_3") is None
+    # New deliveries go to the next segment.
+    archive.start()
+    archive.append(parse_event(_payload(4)), _payload(4))
+    archive.stop()
+    with ArchiveReader(str(tmp_path)) as reader:
+        assert _event_ids(reader.stream("cus_1")) == ["evt_1", "evt_2", "evt_4"]
+
+
+def test_recovery_stops_at_a_corrupt_block(tmp_path):
+    path, offsets = _crashed_segment(tmp_path, [[_payload(1)], [_payload(2)], [_payload(3)]])
+    with open(path, "r+b") as f:
+        f.seek(offsets[1] + BLOCK_HEADER.size + 3)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    EventArchive(directory=str(tmp_path), enabled=True).recover()
+
+    assert os.path.getsize(path) == offsets[1]
+    with ArchiveReader(str(tmp_path)) as reader:
+        assert _event_ids(reader.stream("cus_1")) == ["evt_1"]
@@ -0,0 +1,76 @@
+import time
+import asyncio
+import itertools
+
+from api.webhook.event import StripeView
+from api.webhook.worker import WorkerPool, release_lane, wait_for_lane
+from db.bulk import BulkWriter, customer_row, subscription_row
+from db.models import Customer, Subscription
+from utils.metrics import CREATED
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+
+
+def _customer_event(customer_id, created, name):
+    return StripeView({"id": f"evt_{customer_id}_{created}", "type": "customer.updated", "created": created,
+                       "data": {"object": {"id": customer_id, "object": "customer", "name": name,
+                                           "email": None, "phone": None, "description": None, "created": created}}})
+
+
+def test_lanes_batch_beyond_the_lane_count(db):
+    """Lanes hand off after queueing a row, so one batch collects rows of many events per lane."""
+    writer = BulkWriter(max_items=1000, max_delay=0.05)
+    seen = {}
+
+    async def handler(event):
+        obj = event.data.object
+        if obj["name"] == "read":
+            # Row-by-row handlers wait for the lane's earlier rows to be committed.
+            await wait_for_lane()
+            seen[obj["id"]] = (await Customer.get(id=obj["id"])).name
+            return None
+        queued = writer.enqueue("customer", customer_row(event))
+        release_lane()
+        return await queued
+
+    async def run(customers):
+        pool = WorkerPool(handler, workers=4, queue_size=400)
+        await pool.start()
+        now = int(time.time())
+        for k, customer_id in enumerate(customers):
+            for version in range(3):
+                assert await pool.submit(_customer_event(customer_id, now + version, f"v{version}"))
+        for customer_id in customers:
+            assert await pool.submit(_customer_event(customer_id, now + 5, "read"))
+        await pool.stop()
+
+    n = next(_ids)
+    customers = [f"cus_bulkwriter{n}_{k}" for k in range(40)]
+    db(run(customers))
+
+    # Awaiting every row's flush would take at least one batch per lane and version.
+    assert writer.stats()["batches"] < 40 * 3 / 4
+    assert seen == {customer_id: "v2" for customer_id in customers}
+
+
+def test_batches_commit_in_arrival_order(db):
+    """A batch queued while another is written commits after it, so its foreign keys resolve."""
+    writer = BulkWriter(max_items=1, max_delay=0.05)
+    n = next(_ids)
+    customer_id, subscription_id = f"cus_bulkorder{n}", f"sub_bulkorder{n}"
+    now = int(time.time())
+    subscription = StripeView({
+        "id": f"evt_{subscription_id}", "type": "customer.subscription.created", "created": now,
+        "data": {"object": {"id": subscription_id, "object": "subscription", "customer": customer_id,
+                            "status": "active", "current_period_start": now, "current_period_end": now + 86400,
+                            "cancel_at_period_end": False, "items": {"url": "/v1/subscription_items"}}}})
+
+    async def write():
+        first = writer.enqueue("customer", customer_row(_customer_event(customer_id, now, "first")))
+        await asyncio.sleep(0)
+        second = writer.enqueue("subscription", subscription_row(subscription))
+        return await asyncio.gather(first, second)
+
+    assert db(write()) == [CREATED, CREATED]
+    assert writer.stats()["batches"] == 2
+    assert db(Subscription.get(id=subscription_id)).customer_id == customer_id
@@ -0,0 +1,116 @@
+import json
+import time
+import asyncio
+import itertools
+from datetime import datetime, timedelta, UTC
+
+from starlette.responses import JSONResponse
+
+from api.subscription.check import (CHECK_QUERY_BUDGET, SubscriptionCheckRequest, check_subscription,
+                                    check_subscription_batch)
+from db.models import Customer, Subscription, TelegramUser
+from utils.query_counter import count_queries
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100 + 5_000_000_000, 10)
+
+
+def _subscribed_customer(db, n, active=True):
+    now = datetime.now(UTC)
+    db(Customer.create(id=f"cus_budget{n}", email=f"budget{n}@example.com", username=f"budget{n}"))
+    db(Subscription.create(id=f"sub_budget{n}", customer_id=f"cus_budget{n}", status="active" if active else "canceled",
+                           started=now, ending=now + timedelta(days=30), url="/v1/subscription_items"))
+
+
+async def _counted(coro):
+    with count_queries() as queries:
+        response = await coro
+    return response, queries.count
+
+
+def _check(db, **identity):
+    response, count = db(_counted(check_subscription(SubscriptionCheckRequest(**identity))))
+    assert isinstance(response, JSONResponse) and response.status_code == 200, response
+    return json.loads(response.body), count
+
+
+def test_check_new_user_without_customer(db):
+    body, count = _check(db, user_id=next(_ids), username="nobody")
+    assert body["subscription_status"] is False
+    assert count <= CHECK_QUERY_BUDGET
+
+
+def test_check_creates_links_and_activates_in_budget(db):
+    n = next(_ids)
+    _subscribed_customer(db, n)
+
+    body, count = _check(db, user_id=n, email=f"Budget{n}@example.com")
+
+    assert body["subscription_status"] is True and body["user_id"] == n
+    assert count <= CHECK_QUERY_BUDGET
+    assert db(Customer.get(id=f"cus_budget{n}")).user_id_id == body["id"]
+
+
+def test_repeated_check_is_one_query(db):
+    n = next(_ids)
+    _subscribed_customer(db, n)
+    _check(db, user_id=n, username=f"budget{n}")
+
+    body, count = _check(db, user_id=n, username=f"budget{n}")
+
+    assert body["subscription_status"] is True
+    assert count == 1
+
+
+def test_concurrent_checks_of_a_new_user(db):
+    """Checks racing to create the same Telegram user stay in budget and agree on the row."""
+    for _ in range(5):
+        n = next(_ids)
+        _subscribed_customer(db, n)
+
+        async def race():
+            return await asyncio.gather(*(
+                _counted(check_subscription(SubscriptionCheckRequest(user_id=n, username=f"budget{n}")))
+                for _ in range(8)))
+
+        results = db(race())
+        bodies = [json.loads(response.body) for response, _ in results]
+        assert max(count for _, count in results) <= CHECK_QUERY_BUDGET
+        assert {body.get("id") for body in bodies} == {db(TelegramUser.get(user_id=n)).id}
+        assert all(body["subscription_status"] is True for body in bodies)
+
+
+def test_batch_check_in_budget(db):
+    identities = []
+    for k in range(60):
+        n = next(_ids)
+        if k % 3 == 0:
+            _subscribed_customer(db, n)
+        elif k % 3 == 1:
+            _subscribed_customer(db, n, active=False)
+            db(TelegramUser.create(user_id=n, username=f"budget{n}"))
+        identities.append(SubscriptionCheckRequest(user_id=n, username=f"BUDGET{n}"))
+    identities.append(SubscriptionCheckRequest())
+
+    response, count = db(_counted(check_subscription_batch(identities)))
+
+    results = json.loads(response.body)
+    assert count <= CHECK_QUERY_BUDGET
+    assert [r.get("subscription_status") for r in results[:3]] == [True, False, False]
+    assert results[-1] == {"error": "Bad filters passed"}
+    assert not any("error" in r for r in results[:-1])
+
+
+def test_concurrent_batches_sharing_new_users(db):
+    ids = [next(_ids) for _ in range(20)]
+    for n in ids:
+        _subscribed_customer(db, n)
+
+    async def race():
+        return await asyncio.gather(*(
+            _counted(check_subscription_batch([SubscriptionCheckRequest(user_id=n, username=f"budget{n}") for n in ids]))
+            for _ in range(4)))
+
+    results = db(race())
+    assert max(count for _, count in results) <= CHECK_QUERY_BUDGET
+    for response, _ in results:
+        assert all(r["subscription_status"] is True for r in json.loads(response.body))
@@ -0,0 +1,29 @@
+import time
+import itertools
+from datetime import datetime, timedelta, UTC
+
+from api.webhook.event import StripeView
+from db.models import Customer, Entitlement, Subscription, TelegramUser
+from db.TelegramUser import update_telegram_user_from_event
+from utils.metrics import UPDATED
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+
+
+def test_telegram_user_update_refreshes_the_entitlement(db):
+    n = next(_ids)
+    now = datetime.now(UTC)
+    user = db(TelegramUser.create(user_id=n, username=f"entitled{n}"))
+    db(Customer.create(id=f"cus_entitled{n}", email=f"entitled{n}@example.com", user_id_id=user.id))
+    # Written without the refresh, like a row the table drifted from.
+    db(Subscription.create(id=f"sub_entitled{n}", customer_id=f"cus_entitled{n}", status="active",
+                           started=now, ending=now + timedelta(days=30), url="/v1/subscription_items"))
+    period_end = int((now + timedelta(days=30)).timestamp())
+    event = StripeView({"id": f"evt_entitled{n}", "type": "invoice.paid", "created": int(now.timestamp()),
+                        "data": {"object": {"id": f"in_entitled{n}", "customer": f"cus_entitled{n}",
+                                            "lines": {"data": [{"period": {"end": period_end}}]}}}})
+
+    assert db(update_telegram_user_from_event(event)) == UPDATED
+
+    entitlement = db(Entitlement.get(user_id=n))
+    assert entitlement.active and entitlement.subscription_id == f"sub_entitled{n}"
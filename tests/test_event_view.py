@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from api.webhook.event import ListView, StripeView, parse_event
+
+
+PAYLOAD = {
+    "id": "evt_1",
+    "type": "invoice.paid",
+    "data": {
+        "object": {
+            "id": "in_1",
+            "object": "invoice",
+            "customer": "cus_1",
+            "discount": None,
+            "lines": {"data": [{"id": "il_1", "price": {"id": "price_1"}}, {"id": "il_2"}]},
+            "metadata": {},
+        }
+    },
+}
+
+
+@pytest.fixture
+def event():
+    return parse_event(json.dumps(PAYLOAD).encode())
+
+
+def test_attribute_and_item_access(event):
+    obj = event.data.object
+    assert obj.customer == "cus_1"
+    assert obj["customer"] == "cus_1"
+    assert event["data"]["object"].id == "in_1"
+    assert obj.discount is None
+    assert obj.lines.data[0].price.id == "price_1"
+
+
+def test_missing_fields(event):
+    obj = event.data.object
+    assert obj.get("subscription") is None
+    assert obj.get("subscription", "sub_x") == "sub_x"
+    assert not hasattr(obj, "subscription")
+    assert "lines" in obj and "subscription" not in obj
+    with pytest.raises(KeyError):
+        obj["subscription"]
+
+
+def test_children_are_wrapped_lazily_once(event):
+    obj = event.data.object
+    assert obj._children is None
+    assert obj.customer == "cus_1"
+    # Scalars are never cached.
+    assert obj._children is None
+    lines = obj.lines
+    assert obj._children == {"lines": lines}
+    assert obj.lines is lines
+    assert obj.get("lines") is lines
+    assert obj["lines"] is lines
+    assert event.data is event.data
+
+
+def test_view_is_read_only(event):
+    with pytest.raises(AttributeError):
+        event.data.object.customer = "cus_2"
+    assert event.data.object.customer == "cus_1"
+
+
+def test_list_view():
+    lines = StripeView(PAYLOAD).data.object.lines.data
+    assert isinstance(lines, ListView)
+    assert len(lines) == 2 and lines
+    assert [line.id for line in lines] == ["il_1", "il_2"]
+    assert lines[-1].id == "il_2"
+    tail = lines[1:]
+    assert isinstance(tail, ListView) and [line.id for line in tail] == ["il_2"]
+    assert lines.to_list() is PAYLOAD["data"]["object"]["lines"]["data"]
+    assert not ListView([])
+
+
+def test_dict_protocol(event):
+    obj = event.data.object
+    assert obj == PAYLOAD["data"]["object"]
+    assert obj == StripeView(dict(PAYLOAD["data"]["object"]))
+    assert obj.to_dict() == PAYLOAD["data"]["object"]
+    assert list(obj) == list(obj.keys()) == list(PAYLOAD["data"]["object"])
+    assert len(obj) == len(PAYLOAD["data"]["object"])
+    items = dict(obj.items())
+    assert isinstance(items["metadata"], StripeView) and items["metadata"] == {}
+    assert items["customer"] == "cus_1"
+    assert "in_1" in repr(obj)
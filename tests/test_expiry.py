@@ -0,0 +1,40 @@
+import time
+import itertools
+from datetime import datetime, timedelta, UTC
+
+from db.expiry import ExpirySweeper
+from db.models import TelegramUser
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+
+
+def _user(db, ends_in, cancel_at_period_end=False, is_admin=False):
+    n = next(_ids)
+    return db(TelegramUser.create(user_id=n, username=f"expiry{n}", subscription_status=True, is_admin=is_admin,
+                                  date_end=datetime.now(UTC) + ends_in, cancel_at_period_end=cancel_at_period_end))
+
+
+def test_sweep_expires_after_the_grace_unless_cancelling(db):
+    grace = timedelta(hours=1)
+    cancelling = _user(db, -timedelta(minutes=1), cancel_at_period_end=True)
+    in_grace = _user(db, -timedelta(minutes=1))
+    past_grace = _user(db, -timedelta(hours=2))
+    cancelling_future = _user(db, timedelta(minutes=1), cancel_at_period_end=True)
+    admin = _user(db, -timedelta(hours=2), is_admin=True)
+    users = [cancelling, in_grace, past_grace, cancelling_future, admin]
+
+    expired = db(ExpirySweeper(grace=grace.total_seconds(), chunk=1).sweep())
+
+    assert {cancelling.user_id, past_grace.user_id} <= set(expired)
+    assert not {in_grace.user_id, cancelling_future.user_id, admin.user_id} & set(expired)
+    status = dict(db(TelegramUser.filter(id__in=[u.id for u in users]).values_list("user_id", "subscription_status")))
+    assert status == {cancelling.user_id: False, in_grace.user_id: True, past_grace.user_id: False,
+                      cancelling_future.user_id: True, admin.user_id: True}
+
+
+def test_sweep_ends_the_grace_period(db):
+    user = _user(db, -timedelta(minutes=1))
+    sweeper = ExpirySweeper(grace=3600)
+    assert user.user_id not in db(sweeper.sweep())
+    assert user.user_id in db(ExpirySweeper(grace=0).sweep())
+    assert sweeper.metrics.stats()["runs"] == 1
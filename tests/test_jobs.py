@@ -0,0 +1,74 @@
+import time
+import itertools
+
+from tortoise import connections
+
+from db.jobs import DEAD, claim_jobs, complete_jobs, enqueue_jobs, fail_job
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+
+
+def _enqueue(db, *partitions):
+    """Queue one job per partition key given, in order; returns their event ids."""
+    n = next(_ids)
+    event_ids = [f"evt_jobs{n}_{i}" for i in range(len(partitions))]
+    assert db(enqueue_jobs([(e, "invoice.paid", p, "{}") for e, p in zip(event_ids, partitions)])) == len(partitions)
+    return event_ids
+
+
+async def _retry_now(event_id):
+    await connections.get("default").execute_query(
+        'UPDATE "webhook_job" SET "available_at" = now() WHERE "event_id" = $1', [event_id])
+
+
+def _claim(db, event_ids, worker="test-worker", visibility=60):
+    return {job["event_id"]: job for job in db(claim_jobs(1000, worker, visibility)) if job["event_id"] in event_ids}
+
+
+def test_only_the_partition_head_is_claimed(db):
+    n = next(_ids)
+    a1, a2, b1, a3 = events = _enqueue(db, f"cus_a{n}", f"cus_a{n}", f"cus_b{n}", f"cus_a{n}")
+
+    claimed = _claim(db, events)
+    assert set(claimed) == {a1, b1}
+    # A running head still holds its partition.
+    assert _claim(db, events) == {}
+
+    db(complete_jobs([claimed[a1]["id"], claimed[b1]["id"]], "test-worker"))
+    claimed = _claim(db, events)
+    assert set(claimed) == {a2}
+    db(complete_jobs([claimed[a2]["id"]], "test-worker"))
+    assert set(_claim(db, events)) == {a3}
+
+
+def test_duplicate_events_are_queued_once(db):
+    n = next(_ids)
+    (event_id,) = _enqueue(db, f"cus_dup{n}")
+    assert db(enqueue_jobs([(event_id, "invoice.paid", f"cus_dup{n}", "{}")])) == 0
+
+
+def test_a_failed_head_blocks_its_partition_until_dead(db):
+    n = next(_ids)
+    first, second = events = _enqueue(db, f"cus_fail{n}", f"cus_fail{n}")
+
+    job = _claim(db, events)[first]
+    assert db(fail_job(job, "test-worker", "boom", max_attempts=2)) == "pending"
+    # Waiting for its retry, and the next event waits behind it.
+    assert _claim(db, events) == {}
+
+    db(_retry_now(first))
+    job = _claim(db, events)[first]
+    assert job["attempts"] == 2
+    assert db(fail_job(job, "test-worker", "boom", max_attempts=2)) == DEAD
+    assert set(_claim(db, events)) == {second}
+
+
+def test_an_expired_lease_is_claimed_again(db):
+    n = next(_ids)
+    (event_id,) = events = _enqueue(db, f"cus_lease{n}")
+    assert _claim(db, events, "dead-worker", visibility=0)[event_id]["attempts"] == 1
+    job = _claim(db, events, "live-worker")[event_id]
+    assert job["attempts"] == 2
+    # The first worker's late completion does not remove the job.
+    db(complete_jobs([job["id"]], "dead-worker"))
+    assert _claim(db, events) == {}
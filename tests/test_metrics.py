@@ -0,0 +1,30 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.metrics import MetricsMiddleware
+from utils.metrics import HTTP_REQUEST_SECONDS
+
+
+def _count(method, route, status):
+    child = HTTP_REQUEST_SECONDS.children.get((method, route, status))
+    return child.count if child else 0
+
+
+def test_unknown_methods_and_paths_share_one_label():
+    app = FastAPI()
+
+    @app.get("/metrics-test")
+    async def endpoint():
+        return {}
+
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+    unmatched, matched = _count("OTHER", "unmatched", "4xx"), _count("GET", "/metrics-test", "2xx")
+
+    for n in range(3):
+        client.request(f"X-SCAN-{n}", f"/random-{n}")
+    client.get("/metrics-test")
+
+    assert _count("OTHER", "unmatched", "4xx") == unmatched + 3
+    assert _count("GET", "/metrics-test", "2xx") == matched + 1
+    assert not any(method.startswith("X-SCAN") for method, _, _ in HTTP_REQUEST_SECONDS.children)
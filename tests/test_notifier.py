@@ -0,0 +1,118 @@
+import time
+import asyncio
+import itertools
+from datetime import datetime, timedelta, UTC
+
+from tortoise import connections
+
+from db.notifier import DeliveryError, EntitlementNotifier
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+
+
+class RecordingNotifier(EntitlementNotifier):
+    """Keeps the batches instead of posting them."""
+
+    def __init__(self, **kwargs):
+        super().__init__(url="http://bot.invalid/notify", **kwargs)
+        self.running = True
+        self.delivered = []
+
+    async def _deliver(self, batch, attempts=0):
+        self.delivered.append(batch)
+
+
+def test_changes_are_coalesced_per_user_within_the_window():
+    async def scenario():
+        notifier = RecordingNotifier(window=0.02, batch_size=10)
+        notifier.notify(1, "subscription")
+        notifier.notify(2, "charge")
+        notifier.notify(1, "expired")
+        notifier.notify(None, "charge")
+        assert notifier.delivered == [] and notifier.stats()["pending"] == 2
+        await asyncio.sleep(0.05)
+        return notifier.delivered
+
+    assert asyncio.run(scenario()) == [{1: {"subscription", "expired"}, 2: {"charge"}}]
+
+
+def test_a_full_batch_is_sent_without_waiting_for_the_window():
+    async def scenario():
+        notifier = RecordingNotifier(window=10, batch_size=2)
+        notifier.notify(1, "subscription")
+        notifier.notify(1, "charge")
+        notifier.notify(2, "charge")
+        await asyncio.sleep(0)
+        delivered = list(notifier.delivered)
+        notifier.notify(3, "charge")
+        assert notifier.timer is not None
+        notifier._flush()
+        await asyncio.sleep(0)
+        return delivered, notifier.delivered
+
+    first, delivered = asyncio.run(scenario())
+    assert first == [{1: {"subscription", "charge"}, 2: {"charge"}}]
+    assert delivered == first + [{3: {"charge"}}]
+
+
+def test_stopped_notifier_ignores_changes():
+    notifier = EntitlementNotifier(url="http://bot.invalid/notify")
+    notifier.notify(1, "subscription")
+    assert notifier.pending == {}
+
+
+def _backlog_row(db, user_id, reasons="subscription", attempts=1):
+    db(connections.get("default").execute_query(
+        'INSERT INTO "notification_backlog" ("user_id", "reasons", "attempts", "next_attempt_at") VALUES ($1, $2, $3, $4)',
+        [user_id, reasons, attempts, datetime.now(UTC) - timedelta(seconds=1)]))
+
+
+def _backlog(db, user_id):
+    rows = db(connections.get("default").execute_query_dict(
+        'SELECT "reasons", "attempts", "next_attempt_at" FROM "notification_backlog" WHERE "user_id" = $1', [user_id]))
+    return rows[0] if rows else None
+
+
+def test_delivered_backlog_rows_are_deleted(db):
+    user_id = next(_ids)
+    _backlog_row(db, user_id, "subscription,expired")
+    notifier = EntitlementNotifier(url="http://bot.invalid/notify")
+    sent = []
+
+    async def send(batch, retries):
+        sent.append(batch)
+
+    notifier._send = send
+    assert db(notifier.replay_backlog()) >= 1
+    assert sent[0][user_id] == {"subscription", "expired"}
+    assert _backlog(db, user_id) is None
+
+
+def test_a_change_saved_during_delivery_keeps_the_backlog_row(db):
+    user_id = next(_ids)
+    _backlog_row(db, user_id)
+    notifier = EntitlementNotifier(url="http://bot.invalid/notify")
+
+    async def send(batch, retries):
+        # Another delivery fails for the same user while this one is in flight.
+        await notifier._save_backlog({user_id: {"expired"}}, 1)
+
+    notifier._send = send
+    db(notifier.replay_backlog())
+    row = _backlog(db, user_id)
+    assert row is not None and row["reasons"] == "expired"
+    assert row["next_attempt_at"] < datetime.now(UTC) + timedelta(minutes=5)
+
+
+def test_failed_backlog_rows_are_rescheduled(db):
+    user_id = next(_ids)
+    _backlog_row(db, user_id, attempts=2)
+    notifier = EntitlementNotifier(url="http://bot.invalid/notify")
+
+    async def send(batch, retries):
+        return DeliveryError("HTTP 503")
+
+    notifier._send = send
+    db(notifier.replay_backlog())
+    row = _backlog(db, user_id)
+    assert row is not None and row["attempts"] == 3
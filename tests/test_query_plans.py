@@ -0,0 +1,26 @@
+import json
+
+from tortoise import connections
+
+from benchmarks.query_plans import SEED_SQL, hot_queries, seq_scans
+
+SEED_ROWS = 20000
+
+
+def test_hot_queries_use_indexes(db):
+    """No hot lookup may plan a sequential scan on a looked-up table (see benchmarks/query_plans.py)."""
+    async def explain_all():
+        conn = connections.get("default")
+        for statement in SEED_SQL.split(";"):
+            if statement.strip():
+                await conn.execute_query(statement, [SEED_ROWS] if "$1" in statement else None)
+        scans = {}
+        for name, (sql, params) in hot_queries().items():
+            rows = await conn.execute_query_dict(f"EXPLAIN (FORMAT JSON) {sql}", params or None)
+            plan = rows[0]["QUERY PLAN"]
+            plan = plan if isinstance(plan, list) else json.loads(plan)
+            scans[name] = seq_scans(plan[0]["Plan"])
+        return scans
+
+    scans = db(explain_all())
+    assert {name: found for name, found in scans.items() if found} == {}
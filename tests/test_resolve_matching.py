@@ -0,0 +1,53 @@
+import itertools
+import time
+
+from db.models import TelegramUser, Customer
+from db.TelegramUser import resolve_subscription
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+
+
+def test_username_and_email_match_case_insensitively(db):
+    n = next(_ids)
+    user = db(TelegramUser.create(user_id=n, username=f"Mixed{n}", email=f"Mixed{n}@Example.com"))
+
+    by_username, _, _ = db(resolve_subscription(username=f"mixed{n}"))
+    by_email, _, _ = db(resolve_subscription(email=f"MIXED{n}@example.COM"))
+
+    assert by_username["id"] == user.id
+    assert by_email["id"] == user.id
+
+
+def test_case_variants_prefer_exact_spelling_then_oldest(db):
+    n = next(_ids)
+    upper = db(TelegramUser.create(user_id=n, username=f"Dup{n}", email=f"Dup{n}@example.com"))
+    lower = db(TelegramUser.create(user_id=n + 1, username=f"dup{n}", email=f"dup{n}@example.com"))
+
+    assert db(resolve_subscription(username=f"dup{n}"))[0]["id"] == lower.id
+    assert db(resolve_subscription(username=f"Dup{n}"))[0]["id"] == upper.id
+    assert db(resolve_subscription(username=f"DUP{n}"))[0]["id"] == upper.id
+    assert db(resolve_subscription(email=f"dup{n}@example.com"))[0]["id"] == lower.id
+    assert db(resolve_subscription(email=f"DUP{n}@EXAMPLE.COM"))[0]["id"] == upper.id
+
+
+def test_priority_is_user_id_then_username_then_email(db):
+    n = next(_ids)
+    by_id = db(TelegramUser.create(user_id=n))
+    by_username = db(TelegramUser.create(user_id=n + 1, username=f"prio{n}"))
+    db(TelegramUser.create(user_id=n + 2, email=f"prio{n}@example.com"))
+
+    assert db(resolve_subscription(user_id=n, username=f"PRIO{n}", email=f"prio{n}@example.com"))[0]["id"] == by_id.id
+    assert db(resolve_subscription(username=f"Prio{n}", email=f"prio{n}@example.com"))[0]["id"] == by_username.id
+
+
+def test_customers_of_every_case_variant_are_linked_to_the_chosen_user(db):
+    n = next(_ids)
+    user = db(TelegramUser.create(user_id=n, username=f"link{n}"))
+    db(Customer.create(id=f"cus_link{n}_a", username=f"Link{n}"))
+    db(Customer.create(id=f"cus_link{n}_b", username=f"LINK{n}"))
+
+    _, customers, _ = db(resolve_subscription(username=f"link{n}"))
+
+    assert sorted(customers) == [f"cus_link{n}_a", f"cus_link{n}_b"]
+    linked = db(Customer.filter(id__in=customers).values_list("user_id_id", flat=True))
+    assert set(linked) == {user.id}
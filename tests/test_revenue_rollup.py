@@ -0,0 +1,78 @@
+import time
+import itertools
+from datetime import datetime, timedelta, UTC
+
+from tortoise import connections
+
+from backfill import Progress, apply_chunk
+from api.webhook.event import StripeView
+from db.Charge import save_charge
+from db.Revenue import REVENUE_ROLLUP_SLOTS, daily_revenue
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+DAY = 86400
+
+
+def _charge_event(n, created, currency):
+    charge = {"id": f"ch_rollup{n}", "object": "charge", "payment_intent": f"pi_rollup{n}", "amount": 700,
+              "currency": currency, "status": "succeeded", "created": created,
+              "receipt_url": f"https://pay.example.com/r/{n}", "billing_details": {"email": f"rollup{n}@example.com"}}
+    return {"id": f"evt_rollup{n}", "type": "charge.succeeded", "created": created + 5, "data": {"object": charge}}
+
+
+def _rollup_days(db, currency):
+    today = datetime.now(UTC).date()
+    rows = db(daily_revenue(today - timedelta(days=30), today + timedelta(days=1), currency=currency))
+    return {(r["source"], r["day"]) for r in rows}
+
+
+def _check_dated_by_charge(db, currency, created):
+    day = datetime.fromtimestamp(created, tz=UTC).date()
+    assert _rollup_days(db, currency) == {("charge", day), ("payment", day)}
+
+
+def test_backfilled_charge_lands_on_its_own_day(db):
+    n = next(_ids)
+    currency = f"b{n % 10**6}"
+    created = int(time.time()) - 10 * DAY
+
+    db(apply_chunk([StripeView(_charge_event(n, created, currency))], 2, False, Progress()))
+
+    _check_dated_by_charge(db, currency, created)
+
+
+def test_webhook_charge_lands_on_its_own_day(db):
+    n = next(_ids)
+    currency = f"w{n % 10**6}"
+    created = int(time.time()) - 10 * DAY
+
+    db(save_charge(_charge_event(n, created, currency)))
+
+    _check_dated_by_charge(db, currency, created)
+
+
+def test_charge_without_created_is_dated_on_receipt(db):
+    n = next(_ids)
+    currency = f"r{n % 10**6}"
+    event = _charge_event(n, int(time.time()), currency)
+    del event["data"]["object"]["created"]
+
+    db(apply_chunk([StripeView(event)], 1, False, Progress()))
+
+    assert _rollup_days(db, currency) == {("charge", datetime.now(UTC).date()), ("payment", datetime.now(UTC).date())}
+
+
+def test_backfill_connections_write_their_own_rollup_slots(db):
+    n = next(_ids)
+    currency = f"s{n % 10**6}"
+    created = int(time.time()) - 3 * DAY
+    events = [StripeView(_charge_event(n + i, created + i, currency)) for i in range(8)]
+
+    db(apply_chunk(events, 3, False, Progress()))
+
+    slots = db(connections.get("default").execute_query_dict(
+        'SELECT DISTINCT "slot" FROM "revenue_rollup" WHERE "currency" = $1', [currency]))
+    assert {row["slot"] for row in slots} <= set(range(REVENUE_ROLLUP_SLOTS, REVENUE_ROLLUP_SLOTS + 3))
+    totals = {r["source"]: (r["count"], r["amount"]) for r in db(daily_revenue(
+        datetime.fromtimestamp(created, tz=UTC).date(), datetime.now(UTC).date(), currency=currency))}
+    assert totals == {"charge": (8, 8 * 700), "payment": (8, 0)}
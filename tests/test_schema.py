@@ -0,0 +1,25 @@
+import importlib
+
+import pytest
+from tortoise import connections
+
+from db import schema
+
+
+def test_check_is_the_default_mode(monkeypatch):
+    monkeypatch.delenv("DB_SCHEMA_MODE", raising=False)
+    monkeypatch.setattr("dotenv.load_dotenv", lambda *args, **kwargs: False)
+    assert importlib.reload(schema).DB_SCHEMA_MODE == "check"
+
+
+def test_check_refuses_a_database_behind_the_code(db):
+    conn = connections.get("default")
+    db(conn.execute_query('DELETE FROM "aerich"'))
+    db(conn.execute_query('INSERT INTO "aerich" ("version", "app", "content") VALUES ($1, $2, $3)',
+                          ["0_20261018084843_init.py", "models", "{}"]))
+    with pytest.raises(schema.SchemaVersionError):
+        db(schema.check_schema_version())
+
+    db(conn.execute_query('INSERT INTO "aerich" ("version", "app", "content") VALUES ($1, $2, $3)',
+                          [schema.latest_migration(), "models", "{}"]))
+    db(schema.check_schema_version())
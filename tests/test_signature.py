@@ -0,0 +1,75 @@
+import pytest
+
+from api.webhook.signature import SignatureVerifier, SignatureVerificationError, parse_signature_header
+from benchmarks.event_stream import sign
+
+PAYLOAD = b'{"id": "evt_1", "type": "charge.succeeded"}'
+NOW = 1_700_000_000
+
+
+def test_valid_signature_returns_the_timestamp():
+    verifier = SignatureVerifier(["whsec_a"], tolerance=300)
+    assert verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_a", NOW), now=NOW) == NOW
+
+
+@pytest.mark.parametrize("skew", [-300, 300])
+def test_tolerance_is_inclusive(skew):
+    verifier = SignatureVerifier(["whsec_a"], tolerance=300)
+    assert verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_a", NOW), now=NOW + skew) == NOW
+
+
+@pytest.mark.parametrize("skew", [-301, 301])
+def test_timestamp_outside_the_tolerance_is_rejected(skew):
+    verifier = SignatureVerifier(["whsec_a"], tolerance=300)
+    with pytest.raises(SignatureVerificationError, match="tolerance"):
+        verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_a", NOW), now=NOW + skew)
+
+
+def test_zero_tolerance_accepts_any_timestamp():
+    verifier = SignatureVerifier(["whsec_a"], tolerance=0)
+    assert verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_a", NOW), now=NOW + 10**6) == NOW
+
+
+def test_any_configured_secret_verifies_while_rotating():
+    verifier = SignatureVerifier(["whsec_old", "whsec_new"], tolerance=300)
+    assert verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_old", NOW), now=NOW) == NOW
+    assert verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_new", NOW), now=NOW) == NOW
+    with pytest.raises(SignatureVerificationError, match="No signatures found"):
+        verifier.verify(PAYLOAD, sign(PAYLOAD, "whsec_other", NOW), now=NOW)
+
+
+def test_any_v1_signature_in_the_header_may_match():
+    verifier = SignatureVerifier(["whsec_a"], tolerance=300)
+    good = sign(PAYLOAD, "whsec_a", NOW).split(",v1=")[1]
+    header = f"t={NOW},v1={'0' * 64},v0=ignored,v1={good}"
+    assert verifier.verify(PAYLOAD, header, now=NOW) == NOW
+
+
+def test_tampered_payload_is_rejected():
+    verifier = SignatureVerifier(["whsec_a"], tolerance=300)
+    with pytest.raises(SignatureVerificationError):
+        verifier.verify(PAYLOAD + b" ", sign(PAYLOAD, "whsec_a", NOW), now=NOW)
+
+
+def test_verifier_is_reusable_across_requests():
+    # The keyed hmac objects are copied per request, never updated in place.
+    verifier = SignatureVerifier(["whsec_a"], tolerance=300)
+    for n in range(3):
+        payload = PAYLOAD + str(n).encode()
+        assert verifier.verify(payload, sign(payload, "whsec_a", NOW), now=NOW) == NOW
+
+
+def test_no_secret_configured():
+    with pytest.raises(SignatureVerificationError, match="No webhook secret"):
+        SignatureVerifier([]).verify(PAYLOAD, sign(PAYLOAD, "whsec_a", NOW), now=NOW)
+
+
+@pytest.mark.parametrize("header, error", [
+    ("v1=abc", "timestamp"),
+    ("t=soon,v1=abc", "timestamp"),
+    (f"t={NOW}", "No v1 signatures"),
+    (f"t={NOW},v0=abc", "No v1 signatures"),
+])
+def test_malformed_headers(header, error):
+    with pytest.raises(SignatureVerificationError, match=error):
+        parse_signature_header(header)
@@ -0,0 +1,84 @@
+from utils import subscription_cache as cache_module
+from utils.subscription_cache import SubscriptionCache
+
+ACTIVE = {"subscription_status": True}
+
+
+def test_write_drops_the_answers_tagged_with_it():
+    cache = SubscriptionCache(maxsize=10, ttl=30)
+    key = cache.key(user_id=1, username="Alice")
+    cache.set(key, ACTIVE, [("customer", "cus_1")])
+
+    assert cache.get(cache.key(user_id=1, username="ALICE")) == ACTIVE
+    cache.invalidate(customer_id="cus_2")
+    assert cache.get(key) == ACTIVE
+    cache.invalidate(customer_id="cus_1")
+    assert cache.get(key) is None
+
+
+def test_answer_read_before_an_invalidation_is_not_stored():
+    cache = SubscriptionCache(maxsize=10, ttl=30)
+    key = cache.key(user_id=1)
+
+    generation = cache.generation
+    # The deletion webhook commits and invalidates while the check is querying.
+    cache.invalidate(customer_id="cus_1")
+    cache.set(key, ACTIVE, [("customer", "cus_1")], generation)
+    assert cache.get(key) is None
+
+    cache.set(key, ACTIVE, [("customer", "cus_1")], cache.generation)
+    assert cache.get(key) == ACTIVE
+
+
+def test_unrelated_invalidation_does_not_block_set():
+    cache = SubscriptionCache(maxsize=10, ttl=30)
+    key = cache.key(email="a@example.com")
+
+    generation = cache.generation
+    cache.invalidate(customer_id="cus_other", username="bob")
+    cache.set(key, ACTIVE, [("customer", "cus_1")], generation)
+    assert cache.get(key) == ACTIVE
+
+
+def test_identity_tags_count_as_invalidated_too():
+    cache = SubscriptionCache(maxsize=10, ttl=30)
+    key = cache.key(username="Alice")
+
+    generation = cache.generation
+    cache.invalidate(username="ALICE")
+    cache.set(key, ACTIVE, (), generation)
+    assert cache.get(key) is None
+
+
+def test_forgotten_invalidations_are_treated_as_stale():
+    cache = SubscriptionCache(maxsize=2, ttl=30)
+    key = cache.key(user_id=1)
+
+    generation = cache.generation
+    for n in range(3):
+        cache.invalidate(customer_id=f"cus_{n}")
+    # cus_0 fell out of the invalidation log: the read cannot be proven fresh.
+    cache.set(key, ACTIVE, [("customer", "cus_9")], generation)
+    assert cache.get(key) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = SubscriptionCache(maxsize=10, ttl=30)
+    key = cache.key(user_id=1)
+    cache.set(key, ACTIVE)
+
+    now[0] += 29
+    assert cache.get(key) == ACTIVE
+    now[0] += 2
+    assert cache.get(key) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SubscriptionCache(maxsize=10, ttl=0)
+    key = cache.key(user_id=1)
+    cache.set(key, ACTIVE)
+    cache.invalidate(user_id=1)
+    assert cache.get(key) is None
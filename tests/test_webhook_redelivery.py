@@ -0,0 +1,55 @@
+import json
+import time
+import itertools
+
+import httpx
+from fastapi import FastAPI
+
+from api.webhook import stripe_webhook
+from api.webhook.event import parse_event
+from api.webhook.signature import SignatureVerifier
+from benchmarks.event_stream import sign
+from db.models import ProcessedEvent
+from utils.metrics import CREATED, ERROR
+
+_ids = itertools.count(int(time.time() * 1000) % 10**9 * 100, 10)
+SECRET = "whsec_redelivery"
+
+
+def _charge_payload(n, amount):
+    # amount is NOT NULL: None makes save_charge catch the failed insert and report ERROR.
+    charge = {"id": f"ch_redeliver{n}", "object": "charge", "payment_intent": None, "amount": amount,
+              "currency": "eur", "status": "succeeded", "created": int(time.time()),
+              "receipt_url": f"https://pay.example.com/r/{n}", "billing_details": {"email": None}}
+    return json.dumps({"id": f"evt_redeliver{n}", "object": "event", "type": "charge.succeeded",
+                       "created": int(time.time()), "data": {"object": charge}}).encode()
+
+
+def test_handler_error_leaves_the_event_claimable(db):
+    n = next(_ids)
+
+    assert db(stripe_webhook.process_event(parse_event(_charge_payload(n, None)))) == [ERROR]
+    assert not db(ProcessedEvent.exists(id=f"evt_redeliver{n}"))
+
+    assert db(stripe_webhook.process_event(parse_event(_charge_payload(n, 500)))) == [CREATED]
+    assert db(ProcessedEvent.exists(id=f"evt_redeliver{n}"))
+    assert db(stripe_webhook.process_event(parse_event(_charge_payload(n, 500)))) is None
+
+
+def test_sync_webhook_answers_non_2xx_on_handler_error(db, monkeypatch):
+    monkeypatch.setattr(stripe_webhook, "verifier", SignatureVerifier([SECRET]))
+    monkeypatch.setattr(stripe_webhook, "WEBHOOK_JOB_QUEUE", False)
+    monkeypatch.setattr(stripe_webhook, "WEBHOOK_FAST_ACK", False)
+    app = FastAPI()
+    app.include_router(stripe_webhook.router)
+    n = next(_ids)
+
+    async def deliver(payload):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/stripe_webhook", content=payload,
+                                     headers={"Stripe-Signature": sign(payload, SECRET)})
+
+    assert db(deliver(_charge_payload(n, None))).status_code == 500
+    assert db(deliver(_charge_payload(n, 500))).status_code == 200
+    assert db(ProcessedEvent.exists(id=f"evt_redeliver{n}"))
@@ -0,0 +1,202 @@
+import asyncio
+
+import pytest
+
+from api.webhook.event import StripeView
+from api.webhook.worker import WorkerPool, partition_key
+
+
+def _event(event_type, obj, event_id="evt_1"):
+    return StripeView({"id": event_id, "type": event_type, "data": {"object": obj}})
+
+
+@pytest.mark.parametrize("event_type, obj, key", [
+    ("payment_intent.succeeded", {"id": "pi_1"}, "pi_1"),
+    ("charge.succeeded", {"id": "ch_1", "payment_intent": "pi_1"}, "pi_1"),
+    ("charge.succeeded", {"id": "ch_1", "payment_intent": None}, "ch_1"),
+    ("customer.created", {"id": "cus_1"}, "cus_1"),
+    ("customer.subscription.updated", {"id": "sub_1", "customer": "cus_1"}, "cus_1"),
+    ("customer.discount.created", {"id": "di_1", "customer": "cus_1"}, "cus_1"),
+    ("invoice.paid", {"id": "in_1", "customer": "cus_1"}, "cus_1"),
+    ("checkout.session.completed", {"id": "cs_1", "customer": "cus_1"}, "cus_1"),
+    ("checkout.session.completed", {"id": "cs_1", "customer": None}, "cs_1"),
+    ("balance.available", {}, "evt_1"),
+])
+def test_partition_key_is_the_owning_object(event_type, obj, key):
+    assert partition_key(_event(event_type, obj)) == key
+
+
+def test_related_events_share_a_lane():
+    pool = WorkerPool(lambda event: None, workers=8)
+    asyncio.run(pool.start())
+    assert pool.lane_for(_event("payment_intent.created", {"id": "pi_1"})) is \
+        pool.lane_for(_event("charge.succeeded", {"id": "ch_1", "payment_intent": "pi_1"}))
+    assert pool.lane_for(_event("customer.created", {"id": "cus_1"})) is \
+        pool.lane_for(_event("invoice.paid", {"id": "in_1", "customer": "cus_1"}))
+
+
+def test_one_key_runs_in_order_while_keys_run_in_parallel():
+    async def scenario():
+        log = []
+        release = asyncio.Event()
+
+        async def handler(event):
+            if event["id"] == "evt_a1":
+                await release.wait()
+            log.append(event["id"])
+
+        pool = WorkerPool(handler, workers=4)
+        await pool.start()
+        lanes = {}
+        for n in range(40):
+            lanes.setdefault(id(pool.lane_for(_event("customer.created", {"id": f"cus_{n}"}))), f"cus_{n}")
+        first, other = list(lanes.values())[:2]
+        await pool.submit(_event("customer.created", {"id": first}, "evt_a1"))
+        await pool.submit(_event("customer.updated", {"id": first}, "evt_a2"))
+        await pool.submit(_event("customer.created", {"id": other}, "evt_b1"))
+        await asyncio.sleep(0.01)
+        assert log == ["evt_b1"]
+        release.set()
+        await pool.stop()
+        return log
+
+    assert asyncio.run(scenario()) == ["evt_b1", "evt_a1", "evt_a2"]
+
+
+async def _blocked_pool(on_full, wait_timeout=0.05):
+    """A one-lane pool of one slot whose worker is stuck on the first event, with the slot taken."""
+    release = asyncio.Event()
+    handled = []
+
+    async def handler(event):
+        await release.wait()
+        handled.append(event["id"])
+        return event["id"]
+
+    pool = WorkerPool(handler, workers=1, queue_size=1, on_full=on_full, wait_timeout=wait_timeout)
+    await pool.start()
+    assert await pool.submit(_event("customer.created", {"id": "cus_1"}, "evt_1"))
+    await asyncio.sleep(0)
+    assert await pool.submit(_event("customer.created", {"id": "cus_1"}, "evt_2"))
+    return pool, release, handled
+
+
+def test_reject_policy_refuses_when_the_lane_is_full():
+    async def scenario():
+        pool, release, handled = await _blocked_pool("reject")
+        accepted = await pool.submit(_event("customer.created", {"id": "cus_1"}, "evt_3"))
+        release.set()
+        await pool.stop()
+        return accepted, handled
+
+    assert asyncio.run(scenario()) == (False, ["evt_1", "evt_2"])
+
+
+def test_wait_policy_gives_up_after_the_timeout():
+    async def scenario():
+        pool, release, handled = await _blocked_pool("wait", wait_timeout=0.05)
+        accepted = await pool.submit(_event("customer.created", {"id": "cus_1"}, "evt_3"))
+        release.set()
+        await pool.stop()
+        return accepted, handled
+
+    assert asyncio.run(scenario()) == (False, ["evt_1", "evt_2"])
+
+
+def test_wait_policy_accepts_once_there_is_room():
+    async def scenario():
+        pool, release, handled = await _blocked_pool("wait", wait_timeout=5)
+        asyncio.get_running_loop().call_later(0.02, release.set)
+        accepted = await pool.submit(_event("customer.created", {"id": "cus_1"}, "evt_3"))
+        await pool.stop()
+        return accepted, handled
+
+    assert asyncio.run(scenario()) == (True, ["evt_1", "evt_2", "evt_3"])
+
+
+def test_inline_policy_waits_for_the_result():
+    async def scenario():
+        pool, release, handled = await _blocked_pool("inline")
+        asyncio.get_running_loop().call_later(0.02, release.set)
+        accepted = await pool.submit(_event("customer.created", {"id": "cus_1"}, "evt_3"))
+        # Inline submissions return once the event was processed.
+        processed = list(handled)
+        await pool.stop()
+        return accepted, processed
+
+    assert asyncio.run(scenario()) == (True, ["evt_1", "evt_2", "evt_3"])
+
+
+def test_unknown_policy_is_refused():
+    with pytest.raises(ValueError):
+        WorkerPool(lambda event: None, on_full="drop")
+
+
+def test_stopped_pool_rejects_and_runs_inline():
+    async def scenario():
+        async def handler(event):
+            return event["id"]
+
+        pool = WorkerPool(handler)
+        return (await pool.submit(_event("customer.created", {"id": "cus_1"})),
+                await pool.run(_event("customer.created", {"id": "cus_1"}, "evt_inline")))
+
+    assert asyncio.run(scenario()) == (False, "evt_inline")
+
+
+def test_run_returns_the_result_and_raises_the_error():
+    async def scenario():
+        async def handler(event):
+            if event["id"] == "evt_bad":
+                raise RuntimeError("boom")
+            return event["id"]
+
+        pool = WorkerPool(handler, workers=2)
+        await pool.start()
+        try:
+            assert await pool.run(_event("customer.created", {"id": "cus_1"}, "evt_ok")) == "evt_ok"
+            with pytest.raises(RuntimeError):
+                await pool.run(_event("customer.created", {"id": "cus_1"}, "evt_bad"))
+            # The lane survives the failure.
+            assert await pool.run(_event("customer.created", {"id": "cus_1"}, "evt_after")) == "evt_after"
+        finally:
+            await pool.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_the_queued_events():
+    async def scenario():
+        handled = []
+
+        async def handler(event):
+            await asyncio.sleep(0.001)
+            handled.append(event["id"])
+
+        pool = WorkerPool(handler, workers=2, queue_size=100)
+        await pool.start()
+        for n in range(50):
+            assert await pool.submit(_event("customer.created", {"id": f"cus_{n % 7}"}, f"evt_{n}"))
+        await pool.stop()
+        return handled, pool.stats()
+
+    handled, stats = asyncio.run(scenario())
+    assert sorted(handled) == sorted(f"evt_{n}" for n in range(50))
+    assert stats["running"] is False and stats["queued"] == 0
+    assert sum(lane["processed"] for lane in stats["lanes"]) == 50
+
+
+def test_stop_gives_up_after_the_drain_timeout():
+    async def scenario():
+        async def handler(event):
+            await asyncio.sleep(10)
+
+        pool = WorkerPool(handler, workers=1, queue_size=10)
+        await pool.start()
+        for n in range(3):
+            await pool.submit(_event("customer.created", {"id": "cus_1"}, f"evt_{n}"))
+        await asyncio.wait_for(pool.stop(timeout=0.05), 2)
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] is False
@@ -7,11 +7,35 @@ DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
 DB_NAME = os.getenv("DB_NAME")
 DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
+DB_PORT = os.getenv("DB_PORT") or 5432
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Recycle a connection after this many queries / seconds idle.
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", 50000))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", 300))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Seconds to wait for a free connection before failing the query (0 waits forever).
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", 10))
 
 TORTOISE_ORM = {
     "connections": {
-        "default": f"postgres://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        "default": {
+            "engine": "db.pool",
+            "credentials": {
+                "host": DB_HOST,
+                "port": DB_PORT,
+                "user": DB_USER,
+                "password": DB_PASS,
+                "database": DB_NAME,
+                "minsize": DB_POOL_MIN_SIZE,
+                "maxsize": DB_POOL_MAX_SIZE,
+                "max_queries": DB_POOL_MAX_QUERIES,
+                "max_inactive_connection_lifetime": DB_POOL_MAX_INACTIVE_LIFETIME,
+                "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+                "acquire_timeout": DB_ACQUIRE_TIMEOUT,
+            },
+        }
     },
     "apps": {
         "models": {
@@ -19,4 +43,4 @@ TORTOISE_ORM = {
             "default_connection": "default",
         },
     },
-}
\ No newline at end of file
+}
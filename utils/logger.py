@@ -1,16 +1,128 @@
+import os
+import json
+import queue
+import atexit
+import random
 import logging
+import logging.handlers
+from dotenv import load_dotenv
 
+load_dotenv()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "./logs/webhook.log")
+# "text" keeps the old line format, "json" writes one object per line.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Records waiting for the writer thread; when it is full new records are dropped
+# instead of blocking the event loop. 0 means unbounded.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Per-category sample rates below WARNING, e.g. "RECEIVE=0.1,GET TG USER=0.01".
+# The category is the first [TAG] of the message.
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+
+TEXT_FILE_FORMAT = "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
+TEXT_STREAM_FORMAT = "[%(asctime)s] %(levelname)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_sampling(spec):
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        category, _, rate = item.rpartition("=")
+        rates[category.strip().strip("[]")] = float(rate)
+    return rates
+
+
+def category_of(record):
+    msg = record.msg
+    if isinstance(msg, str) and msg.startswith("["):
+        end = msg.find("]")
+        if end > 0:
+            return msg[1:end]
+    return None
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of the records of sampled categories; warnings and errors always pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(category_of(record))
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "category": category_of(record),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread. Only the %-merge of the message runs on
+    the caller's thread; timestamps, JSON and tracebacks are formatted by the
+    listener.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter(text_format, datefmt=None):
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(text_format, datefmt=datefmt)
+
+
+def _setup():
+    """
+    Route the root logger through one queue; a single listener thread owns the
+    file and stream handlers. The stream only carries the app's own records,
+    like before.
+    """
+    file_handler = logging.FileHandler(LOG_FILE)
+    file_handler.setFormatter(_formatter(TEXT_FILE_FORMAT, DATE_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(_formatter(TEXT_STREAM_FORMAT))
+    stream_handler.addFilter(logging.Filter("app"))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+    return handler, listener
+
+
+queue_handler, listener = _setup()
 logger = logging.getLogger("app")
-logger.setLevel(logging.INFO)
-logging.basicConfig(
-    filename='./logs/webhook.log',
-    level=logging.INFO,
-    format="[%(asctime)s] [%(levelname)s] %(name)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(asctime)s] %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
\ No newline at end of file
+logger.setLevel(LOG_LEVEL)
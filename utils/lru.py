@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key once maxsize is reached."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self._data:
+            self._data.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key, value=None):
+        """Store value under key; returns the evicted (key, value) pair, if any."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            return self._data.popitem(last=False)
+        return None
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
@@ -0,0 +1,205 @@
+"""
+Minimal Prometheus metrics: counters, gauges and histograms rendered in the
+text exposition format by render_metrics().
+
+Label sets are meant to be resolved once (metric.labels(...) at import or
+startup) and the returned child kept around, so recording on the hot path is
+an attribute update with no dict or string building.
+"""
+import time
+from bisect import bisect_left
+
+# Handler outcomes, matching the [NEW] / [UPDATE] / [SKIP] / [ERROR] log branches.
+CREATED = "created"
+UPDATED = "updated"
+SKIPPED = "skipped"
+ERROR = "error"
+OUTCOMES = (CREATED, UPDATED, SKIPPED, ERROR)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_string(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        REGISTRY.append(self)
+        if not self.labelnames:
+            self.labels()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self.children[values] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self.children.items():
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def _samples(self, values, child):
+        return [f"{self.name}_total{_label_string(self.labelnames, values)} {_number(child.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_label_string(self.labelnames, values)} {_number(child.value)}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("target", "start")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def _samples(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            lines.append(f"{self.name}_bucket{_label_string(self.labelnames, values, le)} {cumulative}")
+        labels = _label_string(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"))
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database round-trips per request.", ("method", "route"), QUERY_COUNT_BUCKETS)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in database queries per request.", ("method", "route"))
+WEBHOOK_EVENT_SECONDS = Histogram(
+    "webhook_event_processing_seconds", "Processing time of a webhook event by type.", ("event_type",))
+WEBHOOK_EVENT_DB_QUERIES = Histogram(
+    "webhook_event_db_queries", "Database round-trips per webhook event by type.", ("event_type",), QUERY_COUNT_BUCKETS)
+WEBHOOK_EVENT_OUTCOMES = Counter(
+    "webhook_event_outcomes", "Handler outcomes by event type.", ("event_type", "outcome"))
+WEBHOOK_EVENT_LAG = Gauge(
+    "webhook_event_lag_seconds", "Now minus event.created for the last processed event of a type.", ("event_type",))
+EXPIRY_SWEEP_SECONDS = Histogram(
+    "expiry_sweep_duration_seconds", "Duration of a subscription expiry sweep.").labels()
+EXPIRY_SWEEP_EXPIRED = Counter(
+    "expiry_sweep_expired_users", "Telegram users whose subscription the sweeper expired.").labels()
+EXPIRY_SWEEP_LAST_RUN = Gauge(
+    "expiry_sweep_last_run_timestamp_seconds", "Unix time of the last completed expiry sweep.").labels()
+NOTIFY_CHANGES = Counter(
+    "notify_changes", "Entitlement change notifications by outcome.", ("outcome",))
+NOTIFY_DELIVERY_SECONDS = Histogram(
+    "notify_delivery_seconds", "Latency of a delivered notification batch POST.").labels()
+NOTIFY_PENDING = Gauge(
+    "notify_pending_users", "Users with a change waiting for the coalescing window.").labels()
+ADMISSION_LIMIT = Gauge(
+    "admission_limit", "Current adaptive concurrency limit by route.", ("route",))
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Requests being served by route.", ("route",))
+ADMISSION_REJECTED = Counter(
+    "admission_rejected", "Requests shed with 503 by route.", ("route",))
+ARCHIVE_EVENTS = Counter(
+    "archive_events", "Raw webhook deliveries archived or dropped on a full queue.", ("outcome",))
+ARCHIVE_BYTES = Counter(
+    "archive_bytes", "Raw and compressed bytes written to the event archive.", ("kind",))
@@ -0,0 +1,96 @@
+import os
+import time
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+from utils.logger import logger
+
+load_dotenv()
+# Raise instead of logging when a request goes over its query budget (for dev and CI runs).
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+# Weight of the newest query in the moving average of DB round-trip time.
+DB_LATENCY_ALPHA = float(os.getenv("DB_LATENCY_ALPHA", 0.05))
+
+_EXECUTE_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+_counter = ContextVar("query_counter", default=None)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+
+class LatencyAverage:
+    """Exponentially weighted moving average of query round-trip time, pool wait included."""
+    __slots__ = ("alpha", "value", "samples")
+
+    def __init__(self, alpha=DB_LATENCY_ALPHA):
+        self.alpha = alpha
+        self.value = 0.0
+        self.samples = 0
+
+    def observe(self, seconds):
+        self.value = seconds if not self.samples else self.value + self.alpha * (seconds - self.value)
+        self.samples += 1
+
+
+db_latency = LatencyAverage()
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the DB round-trips (and their time) made by the current task inside
+    the block. Blocks nest: an outer counter also sees the inner block's queries.
+    """
+    counter = QueryCounter()
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
+        outer = _counter.get()
+        if outer is not None:
+            outer.count += counter.count
+            outer.time += counter.time
+
+
+def check_query_budget(name, counter, budget):
+    if counter.count <= budget:
+        return
+    message = f"[QUERY BUDGET] {name} made {counter.count} queries, budget is {budget}"
+    if QUERY_BUDGET_STRICT:
+        raise AssertionError(message)
+    logger.error(message)
+
+
+def instrument_db_client():
+    """
+    Wrap the asyncpg client's execute methods so count_queries() and
+    db_latency see every round-trip.
+    """
+    from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+    for name in _EXECUTE_METHODS:
+        original = getattr(AsyncpgDBClient, name)
+        if getattr(original, "_counted", False):
+            continue
+
+        @functools.wraps(original)
+        async def wrapper(self, *args, _original=original, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await _original(self, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                db_latency.observe(elapsed)
+                counter = _counter.get()
+                if counter is not None:
+                    counter.count += 1
+                    counter.time += elapsed
+
+        wrapper._counted = True
+        setattr(AsyncpgDBClient, name, wrapper)
@@ -0,0 +1,129 @@
+import os
+import time
+from dotenv import load_dotenv
+
+from utils.lru import LRUCache
+
+load_dotenv()
+SUBSCRIPTION_CACHE_TTL = float(os.getenv("SUBSCRIPTION_CACHE_TTL", 30))
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", 10000))
+
+
+def _lower(value):
+    return value.lower() if value is not None else None
+
+
+class SubscriptionCache:
+    """
+    TTL + LRU cache of /subscription/check answers keyed by (user_id, username, email).
+
+    Every entry is tagged with the identities and Stripe customers it was
+    computed from, so webhook writes can drop exactly the affected answers.
+
+    Readers take generation before querying and pass it to set(): an answer
+    whose tags were invalidated in the meantime was read before the write
+    committed and is not stored. The cache is process-local, so only writes
+    made in this process invalidate it. Writes from job_worker or backfill
+    processes show after at most ttl seconds (main.py turns the cache off
+    when WEBHOOK_JOB_QUEUE sends every webhook write to the job workers).
+    """
+
+    def __init__(self, maxsize=SUBSCRIPTION_CACHE_SIZE, ttl=SUBSCRIPTION_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+        self._tags = {}
+        # Bumped by every invalidate(). _invalidated holds the generation of the
+        # most recent invalidation of a tag; _forgotten the newest generation
+        # evicted from it, so a read older than that cannot be checked.
+        self.generation = 0
+        self._invalidated = LRUCache(maxsize)
+        self._forgotten = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @staticmethod
+    def key(user_id=None, username=None, email=None):
+        return user_id, _lower(username), _lower(email)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, tags=(), generation=None):
+        """Store value unless one of its tags was invalidated after generation (read before the query)."""
+        if not self.enabled:
+            return
+        tags = set(tags)
+        user_id, username, email = key
+        tags.update(t for t in (("user_id", user_id), ("username", username), ("email", email)) if t[1] is not None)
+        if generation is not None and self._stale(tags, generation):
+            return
+
+        self._drop(key)
+        evicted = self._entries.set(key, (time.monotonic() + self.ttl, value, tags))
+        if evicted:
+            self._untag(*evicted)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, customer_id=None, user_id=None, username=None, email=None):
+        if not self.enabled:
+            return
+        tags = [t for t in (("customer", customer_id), ("user_id", user_id),
+                            ("username", _lower(username)), ("email", _lower(email)))
+                if t[1] is not None]
+        self.generation += 1
+        for tag in tags:
+            evicted = self._invalidated.set(tag, self.generation)
+            if evicted:
+                self._forgotten = max(self._forgotten, evicted[1])
+            for key in self._tags.pop(tag, ()):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self.generation += 1
+        self._invalidated.clear()
+        self._forgotten = self.generation
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def _stale(self, tags, generation):
+        if self._forgotten > generation:
+            return True
+        return any(self._invalidated.get(tag, 0) > generation for tag in tags)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        if entry is not None:
+            self._untag(key, entry)
+
+    def _untag(self, key, entry):
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+subscription_cache = SubscriptionCache()